@@ -1,9 +1,25 @@
 from django.contrib import admin
-from .models import AppUser, Patient,Visit,DischargeSummary
+from .models import AppUser, AuditEntry, Patient,Visit,DischargeSummary
 
 
 # Register your models here.
 admin.site.register(AppUser)
 admin.site.register(Patient)
 admin.site.register(Visit)
-admin.site.register(DischargeSummary)
\ No newline at end of file
+admin.site.register(DischargeSummary)
+
+
+@admin.register(AuditEntry)
+class AuditEntryAdmin(admin.ModelAdmin):
+    """Read-only: audit entries are only ever written by main.audit."""
+    list_display = ('timestamp', 'action', 'model', 'object_id', 'patient_pk', 'actor', 'actor_role')
+    list_filter = ('action', 'model')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,454 @@
+"""
+Audit trail of Patient, Visit and DischargeSummary writes.
+
+Handlers in main.signals turn each create, update and delete into an entry:
+who made it (the signed-in user of the request, see AuditMiddleware), when,
+and the changed fields as {field: [old, new]}. An entry is recorded only
+once the write's transaction commits, so rolled-back writes leave none.
+
+AUDIT_LOG picks what record() does with an entry:
+
+- background (default): append it to this process's spool file, fsync, and
+  put it on an in-memory queue. A daemon thread inserts the queue in
+  batches of up to AUDIT_BATCH_SIZE, at least every AUDIT_FLUSH_INTERVAL
+  seconds. The request pays for one small file append, not an INSERT that
+  waits for the database write lock behind every other writer.
+- inline: insert it straight away (tests, one-off scripts).
+- off: drop it.
+
+Spool and crash safety: an entry is on disk before record() returns. The
+spool file is emptied whenever everything in it has been inserted. Anything
+still in it when the process dies is inserted by the next process that
+starts a flusher. Each log spools to its own
+audit-<host>-<pid>-<nonce>-<n>.jsonl, with a fresh nonce every time a log
+starts, and holds an exclusive flock() on it while it writes there. The
+kernel drops the lock with the process, so a spool file whose lock can be
+taken is orphaned wherever its writer ran, and several hosts can share
+AUDIT_SPOOL_DIR (on a filesystem with working flock(), such as a local
+volume or NFSv4). Without fcntl (Windows) the name decides instead: a file
+is replayed only if it names this host and a pid that is gone, or this pid
+with another nonce (an earlier process that had the same pid, common in
+containers). Entries carry a uuid and inserts ignore uuids already stored,
+so replaying an entry twice is harmless.
+
+The queue is bounded (AUDIT_QUEUE_SIZE). If the flusher falls that far
+behind, or an insert fails, entries are left in the spool only and the
+flusher re-reads the spool file instead; memory stays bounded and nothing
+is lost.
+
+Entries show up in the database up to AUDIT_FLUSH_INTERVAL seconds after the
+write; flush() waits for everything recorded so far.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import socket
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from functools import lru_cache
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import setting_changed
+from django.db import close_old_connections, connection, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .auth import current_user
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+AUDIT_MODES = ('off', 'inline', 'background')
+SPOOL_NAME = re.compile(r'^audit-(?P<host>[A-Za-z0-9._]+)-(?P<pid>\d+)-(?P<nonce>[0-9a-f]+)-(?P<segment>\d+)\.jsonl$')
+HOST = re.sub(r'[^A-Za-z0-9.]', '_', socket.gethostname()) or 'localhost'  # no '-', which splits the name
+
+_request = ContextVar('wellconx_audit_request', default=None)
+_encoder = DjangoJSONEncoder()
+
+
+class AuditMiddleware:
+    """
+    Makes the request available to entries recorded while it is handled (for
+    the actor). Sync and async capable, so under ASGI the async views are not
+    pushed onto a thread for it.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = _request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _request.reset(token)
+
+    async def __acall__(self, request):
+        # Sync views called from here run in a copy of this context, so they see the request too
+        token = _request.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _request.reset(token)
+
+
+def enabled():
+    return settings.AUDIT_LOG != 'off'
+
+
+# -------------------- Entries --------------------
+@lru_cache(maxsize=None)
+def audited_fields(model):
+    """Fields a user can change; ids, timestamps and derived columns are left out."""
+    return tuple(f for f in model._meta.concrete_fields if f.editable and not f.primary_key)
+
+
+def _json_value(field, value):
+    # Compare and store the value as the database would hold it, so a form
+    # posting '70.00' for a stored Decimal('70.00') is not a change
+    try:
+        value = field.to_python(value)
+    except ValidationError:
+        pass
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return _encoder.default(value)
+
+
+def _fields(instance, update_fields=None):
+    fields = audited_fields(type(instance))
+    if update_fields is not None:
+        fields = tuple(f for f in fields if f.name in update_fields or f.attname in update_fields)
+    return fields
+
+
+def current_values(instance, update_fields=None):
+    return {f.name: _json_value(f, getattr(instance, f.attname)) for f in _fields(instance, update_fields)}
+
+
+def stored_columns(instance, update_fields=None):
+    """Columns stored_values() needs from the stored row."""
+    return [f.attname for f in _fields(instance, update_fields)]
+
+
+def stored_values(instance, row, update_fields=None):
+    """The audited columns of `instance` from its stored `row` (a .values() dict), or None."""
+    if row is None:
+        return None
+    return {f.name: _json_value(f, row[f.attname]) for f in _fields(instance, update_fields)}
+
+
+def make_entry(action, instance, changes):
+    from .models import Patient
+
+    request = _request.get()
+    user = current_user(request) if request is not None else None
+    return {
+        'uuid': str(uuid.uuid4()),
+        'timestamp': timezone.now().isoformat(),
+        'actor': user['user_id'] if user else '',
+        'actor_role': (user['role'] or '') if user else '',
+        'action': action,
+        'model': instance._meta.model_name,
+        'object_id': instance.pk,
+        'patient_pk': instance.pk if isinstance(instance, Patient) else instance.patient_id,
+        'changes': changes,
+    }
+
+
+def save_entry(instance, created, before, update_fields=None):
+    """Entry for a save, given stored_values() from before it; None when nothing audited changed."""
+    after = current_values(instance, update_fields)
+    if created or before is None:
+        return make_entry('create', instance, {name: [None, value] for name, value in after.items()})
+    changes = {name: [before.get(name), value] for name, value in after.items() if before.get(name) != value}
+    if not changes:
+        return None
+    return make_entry('update', instance, changes)
+
+
+def delete_entry(instance):
+    return make_entry('delete', instance, {name: [value, None] for name, value in current_values(instance).items()})
+
+
+def write_entries(entries):
+    """Insert entries, skipping uuids already stored."""
+    from .models import AuditEntry
+
+    AuditEntry.objects.bulk_create([AuditEntry(**entry) for entry in entries], ignore_conflicts=True)
+
+
+def record(*entries):
+    if settings.AUDIT_LOG == 'inline':
+        write_entries(entries)
+    elif settings.AUDIT_LOG == 'background':
+        get_log().record(entries)
+
+
+def record_created(instances):
+    """Audit rows inserted by bulk_create(), which sends no signals; recorded at commit like the rest."""
+    if not enabled() or not instances:
+        return
+    entries = [save_entry(instance, True, None) for instance in instances]
+    transaction.on_commit(lambda: record(*entries))
+
+
+# -------------------- Spool and background flush --------------------
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _try_lock(f):
+    """Take the spool file's lock without waiting; False while a live log holds it."""
+    if fcntl is None:
+        return True  # ownership comes from the file name instead, see _orphaned_files()
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+class AuditLog:
+    def __init__(self, spool_dir, batch_size, flush_interval, queue_size):
+        self.spool_dir = Path(spool_dir)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pid = os.getpid()
+        self.nonce = uuid.uuid4().hex[:12]
+        self.queued = self.flushed = self.overflowed = 0
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()  # guards the spool file and the counts below
+        self._segment = 0
+        self._file = None
+        self._unflushed = {}  # spool segment -> entries written to it but not yet inserted
+        self._replay = False
+        self._stopping = threading.Event()
+
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self._open_segment()
+        self._thread = threading.Thread(target=self._run, name='audit-flusher', daemon=True)
+        self._thread.start()
+
+    def _path(self, segment):
+        return self.spool_dir / f'audit-{HOST}-{self.pid}-{self.nonce}-{segment}.jsonl'
+
+    def _open_segment(self):
+        # Locked under a name the orphan scan ignores, then renamed, so no
+        # other process ever finds the segment unlocked
+        path = self._path(self._segment)
+        pending = path.with_suffix('.new')
+        self._file = open(pending, 'ab')
+        _try_lock(self._file)
+        os.replace(pending, path)
+        self._unflushed[self._segment] = 0
+
+    def record(self, entries):
+        data = b''.join((json.dumps(entry, cls=DjangoJSONEncoder) + '\n').encode() for entry in entries)
+        with self._lock:
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())  # one fsync however many entries (an import batch)
+            segment = self._segment
+            self._unflushed[segment] += len(entries)
+            for entry in entries:
+                try:
+                    self._queue.put_nowait((segment, entry))
+                    self.queued += 1
+                except queue.Full:
+                    # Spooled only; the flusher picks it up from the file
+                    self.overflowed += 1
+                    self._replay = True
+
+    def flush(self, timeout=None):
+        """Wait until everything recorded so far is in the database."""
+        done = threading.Event()
+        self._queue.put((None, done))
+        return done.wait(timeout)
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        try:
+            self._queue.put_nowait((None, None))  # wake the flusher
+        except queue.Full:
+            pass  # it is busy draining anyway
+        self._thread.join(timeout)
+
+    # Flusher thread
+    def _run(self):
+        self._replay_files(self._orphaned_files())
+        while True:
+            batch, waiters = self._next_batch()
+            try:
+                if batch:
+                    self._insert(batch)
+                self._checkpoint()
+            except Exception:
+                logger.exception("Audit flusher error")
+            for done in waiters:
+                done.set()
+            if self._stopping.is_set() and self._queue.empty():
+                break
+        with self._lock:
+            self._file.close()
+            if not any(self._unflushed.values()):
+                self._path(self._segment).unlink(missing_ok=True)
+        connection.close()
+
+    def _next_batch(self):
+        batch, waiters = [], []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                segment, item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if segment is None:  # flush() or stop()
+                if item is not None:
+                    waiters.append(item)
+                break
+            batch.append((segment, item))
+        return batch, waiters
+
+    def _insert(self, batch):
+        close_old_connections()
+        try:
+            write_entries([entry for _, entry in batch])
+        except Exception:
+            logger.exception("Audit flush of %d entries failed; they stay in the spool", len(batch))
+            with self._lock:
+                self._replay = True
+            return
+        with self._lock:
+            for segment, _ in batch:
+                if segment in self._unflushed:  # not already replayed from the file
+                    self._unflushed[segment] -= 1
+        self.flushed += len(batch)
+
+    def _checkpoint(self):
+        with self._lock:
+            if not self._replay:
+                if not self._unflushed[self._segment] and self._file.tell():
+                    self._file.truncate(0)  # all of it is in the database
+                    self._file.seek(0)
+                return
+            # Start a new segment and insert the older ones from disk
+            self._replay = False
+            self._file.close()
+            old = list(self._unflushed)
+            self._segment += 1
+            self._open_segment()
+        for segment in old:
+            if self._replay_files([self._path(segment)]):
+                with self._lock:
+                    self._unflushed.pop(segment, None)
+            else:
+                with self._lock:
+                    self._replay = True
+
+    def _orphaned_files(self):
+        """Other logs' spool files that may be orphaned; _replay_files() skips those still locked."""
+        orphans = []
+        for path in sorted(self.spool_dir.glob('audit-*.jsonl')):
+            match = SPOOL_NAME.match(path.name)
+            if not match or match['nonce'] == self.nonce:
+                continue  # ours are replayed by _checkpoint()
+            if fcntl is not None:
+                orphans.append(path)
+            elif match['host'] == HOST:
+                pid = int(match['pid'])
+                if pid == self.pid or not _process_alive(pid):  # same pid: an earlier process
+                    orphans.append(path)
+        return orphans
+
+    def _replay_files(self, paths):
+        """Insert every entry in `paths` and delete them; False if an insert failed."""
+        for path in paths:
+            try:
+                f = open(path, 'rb')
+            except FileNotFoundError:
+                continue  # replayed by another process
+            with f:
+                if not _try_lock(f):
+                    continue  # a live log is still writing to it
+                close_old_connections()
+                try:
+                    entries = []
+                    for line in f:
+                        try:
+                            entries.append(json.loads(line))
+                        except ValueError:
+                            continue  # a line cut short by a crash; its write never returned
+                        if len(entries) >= self.batch_size:
+                            write_entries(entries)
+                            entries = []
+                    if entries:
+                        write_entries(entries)
+                except Exception:
+                    logger.exception("Audit spool replay of %s failed; will retry", path)
+                    return False
+                path.unlink(missing_ok=True)  # before the lock goes, so a later scan cannot find it
+        return True
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_log():
+    """This process's AuditLog, started on first use (and again in a forked child)."""
+    global _log
+    with _log_lock:
+        if _log is None or _log.pid != os.getpid():
+            _log = AuditLog(settings.AUDIT_SPOOL_DIR, settings.AUDIT_BATCH_SIZE,
+                            settings.AUDIT_FLUSH_INTERVAL, settings.AUDIT_QUEUE_SIZE)
+        return _log
+
+
+def flush(timeout=None):
+    if _log is not None and _log.pid == os.getpid():
+        return _log.flush(timeout)
+    return True
+
+
+@atexit.register
+def shutdown(timeout=10):
+    """Flush what is queued and stop the flusher; anything left stays in the spool for the next start."""
+    global _log
+    with _log_lock:
+        if _log is not None and _log.pid == os.getpid():
+            _log.stop(timeout)
+        _log = None
+
+
+@receiver(setting_changed)
+def _audit_setting_changed(setting, **kwargs):
+    if setting.startswith('AUDIT_'):
+        shutdown()
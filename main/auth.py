@@ -0,0 +1,103 @@
+"""
+Who is signed in, without a session-table read.
+
+At login the user id and role go into the session as before and also into a
+signed auth cookie (AUTH_COOKIE_NAME). current_user() and the role_required
+decorator read that cookie first, so role checks cost an HMAC check rather
+than a session lookup; only requests without a valid cookie (expired, or
+sessions from before the cookie existed) fall back to the session.
+
+The cookie is a stateless credential: logout deletes it from the browser and
+flushes the session, but a copy taken earlier keeps working until it expires,
+so AUTH_COOKIE_AGE is kept to a working shift rather than SESSION_COOKIE_AGE.
+A role change likewise takes effect at the next login, as it already did with
+the role cached in the session.
+
+Anyone can sign a cookie with a SECRET_KEY that is published, so while
+SECRET_KEY is Django's django-insecure- development default no cookie is set
+or trusted and every request reads the session.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.core import signing
+from django.http import HttpResponseForbidden
+
+SALT = 'main.auth.cookie'
+INSECURE_KEY_PREFIX = 'django-insecure-'
+
+
+def cookie_enabled():
+    return not settings.SECRET_KEY.startswith(INSECURE_KEY_PREFIX)
+
+
+def set_auth_cookie(response, user):
+    if not cookie_enabled():
+        return response
+    value = signing.dumps({'user_id': str(user.unique_id), 'role': user.role}, salt=SALT, compress=False)
+    response.set_cookie(
+        settings.AUTH_COOKIE_NAME, value,
+        max_age=settings.AUTH_COOKIE_AGE,
+        secure=settings.SESSION_COOKIE_SECURE,
+        httponly=True,
+        samesite='Lax',
+    )
+    return response
+
+
+def delete_auth_cookie(response):
+    response.delete_cookie(settings.AUTH_COOKIE_NAME, samesite='Lax')
+    return response
+
+
+def _from_cookie(request):
+    value = request.COOKIES.get(settings.AUTH_COOKIE_NAME)
+    if not value or not cookie_enabled():
+        return None
+    try:
+        return signing.loads(value, salt=SALT, max_age=settings.AUTH_COOKIE_AGE)
+    except signing.BadSignature:  # also covers expiry
+        return None
+
+
+def current_user(request):
+    """{'user_id', 'role'} for the signed-in user, or None."""
+    if not hasattr(request, '_auth_user'):
+        identity = _from_cookie(request)
+        if identity is None and request.session.get('user_id'):
+            identity = {'user_id': request.session['user_id'], 'role': request.session.get('role')}
+        request._auth_user = identity
+    return request._auth_user
+
+
+async def acurrent_user(request):
+    """current_user() for async views."""
+    if not hasattr(request, '_auth_user'):
+        identity = _from_cookie(request)
+        if identity is None and await request.session.aget('user_id'):
+            identity = {'user_id': await request.session.aget('user_id'),
+                        'role': await request.session.aget('role')}
+        request._auth_user = identity
+    return request._auth_user
+
+
+def current_role(request):
+    user = current_user(request)
+    return user['role'] if user else None
+
+
+async def acurrent_role(request):
+    user = await acurrent_user(request)
+    return user['role'] if user else None
+
+
+def role_required(*roles):
+    """Answer 403 unless the signed-in user has one of `roles`."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if current_role(request) not in roles:
+                return HttpResponseForbidden("You are not authorized to access this page.")
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
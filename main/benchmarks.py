@@ -0,0 +1,302 @@
+"""
+Helpers shared by the bench_* management commands.
+
+Benchmarks never run against the configured database: scratch_database()
+migrates a throwaway copy (the same way the test runner does) and drops it
+afterwards. Audit entries spool to a scratch directory and are flushed into
+the throwaway copy before it is dropped, so none are left for the configured
+database to pick up.
+"""
+import datetime
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from .models import DischargeSummary, IdSequence, PATIENT_ID_SEQUENCE, Patient, Visit, format_patient_id
+from .stats import reconcile as reconcile_stats
+
+
+@contextmanager
+def scratch_database(verbosity=0):
+    settings_dict = connection.settings_dict
+    old_name = settings_dict['NAME']
+    test_settings = settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    tmpdir = tempfile.mkdtemp(prefix='wellconx-bench-')
+    if connection.vendor == 'sqlite':
+        # Its own file, so several threads can share it and it never clobbers the test database
+        test_settings['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        # Leaving the override stops the audit flusher, which empties the spool first
+        with override_settings(AUDIT_SPOOL_DIR=os.path.join(tmpdir, 'audit_spool')):
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        teardown_test_environment()
+        if connection.vendor == 'sqlite':
+            test_settings['NAME'] = old_test_name
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+
+
+# -------------------- Synthetic data --------------------
+FIRST_NAMES = ['Aarav', 'Priya', 'Rahul', 'Ananya', 'Vikram', 'Meera', 'Arjun', 'Kavya', 'Rohan', 'Isha',
+               'John', 'Maria', 'Ahmed', 'Fatima', 'Wei', 'Yuki', 'Carlos', 'Sofia', 'Liam', 'Olivia']
+LAST_NAMES = ['Sharma', 'Patel', 'Iyer', 'Nair', 'Reddy', 'Singh', 'Khan', 'Das', 'Menon', 'Rao',
+              'Smith', 'Garcia', 'Chen', 'Tanaka', 'Silva', 'Brown', 'Kumar', 'Joseph', 'Thomas', 'Varghese']
+
+
+# Clinical words with a long tail: the first few appear in most documents, the last rarely
+CLINICAL_WORDS = (
+    'patient stable afebrile improved managed conservatively discharged advised review '
+    'hypertension diabetes ckd creatinine dialysis anaemia fever cough pneumonia sepsis '
+    'antibiotics insulin metformin amlodipine furosemide heparin transfusion nebulisation '
+    'ecg echocardiogram ultrasound xray ct mri biopsy endoscopy colonoscopy angiography '
+    'fracture femur laparoscopic appendicectomy cholecystectomy hernia stent catheter '
+    'asthma copd tuberculosis dengue malaria typhoid hepatitis cirrhosis pancreatitis '
+    'stroke seizure migraine syncope arrhythmia fibrillation infarction angina '
+    'hypothyroidism hyponatraemia hypokalaemia cellulitis abscess ulcer gangrene amputation '
+    'thrombosis embolism haemodialysis peritoneal nephrotic glomerulonephritis lithotripsy'
+).split()
+_CLINICAL_WEIGHTS = [rank ** -1.5 for rank in range(1, len(CLINICAL_WORDS) + 1)]
+
+
+def clinical_text(rng, words):
+    return ' '.join(rng.choices(CLINICAL_WORDS, weights=_CLINICAL_WEIGHTS, k=words))
+
+
+def seed_patients(count, batch_size=5000, rng=None):
+    rng = rng or random.Random(42)
+    numbers = iter(IdSequence.reserve(PATIENT_ID_SEQUENCE, count))
+    remaining = count
+    while remaining:
+        size = min(batch_size, remaining)
+        Patient.objects.bulk_create([
+            Patient(
+                name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}{rng.randint(0, 999)}',
+                patient_id=format_patient_id(next(numbers)),
+                age=rng.randint(1, 95),
+                gender=rng.choice(['Male', 'Female', 'Other']),
+                contact_number=f'9{rng.randint(0, 999999999):09d}',
+                status=rng.choice(['Active', 'Follow-up', 'Chronic']),
+            )
+            for _ in range(size)
+        ])
+        remaining -= size
+
+
+WARDS = ['General', 'ICU', 'Cardiology', 'Nephrology', 'Orthopaedics']
+
+
+def seed_discharge_summaries(count, patients=None, rng=None, text_words=300):
+    rng = rng or random.Random(11)
+    if patients is None:
+        patients = list(Patient.objects.all()[:1000]) or [
+            Patient.objects.create(name='Bench Patient', age=50, gender='Other',
+                                   contact_number='0000000000', status='Active')
+        ]
+    start = datetime.date(2024, 1, 1)
+    batch = []
+    for i in range(count):
+        admitted = start + datetime.timedelta(days=rng.randint(0, 600))
+        batch.append(DischargeSummary(
+            patient=rng.choice(patients),
+            uhid=f'UH{i:07d}',
+            ward=rng.choice(WARDS),
+            bed_no=str(rng.randint(1, 40)),
+            consultant_name=f'Dr. {rng.choice(["Rao", "Iyer", "Khan", "Smith"])}',
+            admission_date=admitted,
+            discharge_date=admitted + datetime.timedelta(days=rng.randint(1, 14)),
+            discharge_type=rng.choice(['Planned', 'DAMA', 'DOR', 'LAMA']),
+            final_diagnosis=clinical_text(rng, 12),
+            procedures_done=clinical_text(rng, 20),
+            hospital_course=clinical_text(rng, text_words),
+            discharge_advice=clinical_text(rng, 40),
+        ))
+        if len(batch) >= 2000:
+            DischargeSummary.objects.bulk_create(batch)
+            batch = []
+    DischargeSummary.objects.bulk_create(batch)
+
+
+def seed_visits(per_patient, rng=None, batch_size=5000):
+    rng = rng or random.Random(5)
+    start = datetime.date(2023, 1, 1)
+    batch = []
+    for patient_pk in Patient.objects.values_list('pk', flat=True).iterator():
+        for _ in range(per_patient):
+            visit = Visit(
+                patient_id=patient_pk,
+                doctor_name=f'Dr. {rng.choice(LAST_NAMES)}',
+                date=start + datetime.timedelta(days=rng.randint(0, 1000)),
+                checkup_type=rng.choice(['Follow-up', 'Regular', 'New']),
+                healthcare_service=rng.choice(['OPD', 'IPD', 'Emergency']),
+                bp=f'{rng.randint(95, 170)}/{rng.randint(60, 105)} mmHg',
+                oxygen_level=f'{rng.randint(86, 100)}%',
+                weight=f'{rng.uniform(40, 110):.2f}',
+                notes=clinical_text(rng, rng.randint(0, 30)),
+            )
+            visit.parse_vitals()
+            batch.append(visit)
+            if len(batch) >= batch_size:
+                Visit.objects.bulk_create(batch)
+                batch = []
+    Visit.objects.bulk_create(batch)
+    # bulk_create() skips the signals that keep the per-patient counters current
+    Patient.refresh_visit_stats()
+
+
+def seed_database(patients, visits_per_patient, discharges):
+    seed_patients(patients)
+    seed_visits(visits_per_patient)
+    seed_discharge_summaries(discharges, patients=list(Patient.objects.only('pk')[:1000]))
+    # bulk_create() skips the signals that keep the dashboard counters current
+    reconcile_stats()
+
+
+# -------------------- Load generation --------------------
+class LoadResult:
+    def __init__(self, name, latencies, errors, elapsed):
+        self.name = name
+        self.latencies = sorted(latencies)
+        self.errors = errors
+        self.elapsed = elapsed
+        self.peak_threads = None
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    @property
+    def rps(self):
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'rps': round(self.rps, 1),
+            'p50_ms': round(percentile(self.latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(self.latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(self.latencies, 99) * 1000, 2),
+        }
+
+
+def run_load(name, make_request, total, concurrency, client_factory):
+    """
+    Fire `total` requests from `concurrency` threads, each with its own
+    client from client_factory(). make_request(client, i) returns a response.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    per_worker = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+    peak_threads = [threading.active_count()]
+
+    def worker(count):
+        client = client_factory()
+        latencies, errors = [], 0
+        try:
+            for i in range(count):
+                start = time.perf_counter()
+                response = make_request(client, i)
+                if getattr(response, 'streaming', False):
+                    for _ in response.streaming_content:
+                        pass
+                latencies.append(time.perf_counter() - start)
+                peak_threads[0] = max(peak_threads[0], threading.active_count())
+                if response.status_code >= 400:
+                    errors += 1
+        finally:
+            connection.close()
+        return latencies, errors
+
+    with Timer() as t:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(worker, per_worker))
+    latencies = [value for lat, _ in results for value in lat]
+    result = LoadResult(name, latencies, sum(e for _, e in results), t.elapsed)
+    result.peak_threads = peak_threads[0]
+    return result
+
+
+def arun_load(name, make_request, total, concurrency, clients):
+    """
+    run_load() for async clients: `concurrency` tasks on one event loop, task
+    i using clients[i]. make_request(client, i) returns an awaitable response.
+    Also records the peak thread count, since that is what ASGI saves.
+    """
+    import asyncio
+
+    per_task = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+    peak_threads = threading.active_count()
+
+    async def task(client, count):
+        nonlocal peak_threads
+        latencies, errors = [], 0
+        for i in range(count):
+            start = time.perf_counter()
+            response = await make_request(client, i)
+            latencies.append(time.perf_counter() - start)
+            peak_threads = max(peak_threads, threading.active_count())
+            if response.status_code >= 400:
+                errors += 1
+        return latencies, errors
+
+    async def main():
+        return await asyncio.gather(*(task(client, count) for client, count in zip(clients, per_task)))
+
+    with Timer() as t:
+        results = asyncio.run(main())
+    latencies = [value for lat, _ in results for value in lat]
+    result = LoadResult(name, latencies, sum(e for _, e in results), t.elapsed)
+    result.peak_threads = peak_threads
+    return result
+
+
+@contextmanager
+def async_views():
+    """Route the URLconf to the async views (settings.ASYNC_VIEWS) for the duration."""
+    import importlib
+
+    from django.conf import settings
+    from django.test import override_settings
+    from django.urls import clear_url_caches
+
+    def reload_urls():
+        import main.urls
+        importlib.reload(main.urls)
+        importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+        clear_url_caches()
+
+    try:
+        with override_settings(ASYNC_VIEWS=True):
+            reload_urls()
+            yield
+    finally:
+        reload_urls()
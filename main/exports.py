@@ -0,0 +1,133 @@
+"""
+Streaming exports of patients, visits and discharge summaries as CSV or
+NDJSON (one JSON object per line).
+
+Rows come from the database with QuerySet.iterator(chunk_size=...) as plain
+tuples (values_list, no model instances) and are written out in ~64 KB
+chunks, so memory use does not grow with the size of the table.
+
+The id is the first column. A client that exports incrementally keeps the
+largest id it received and passes it back as since_id next time to get only
+the rows added since. Rows come in id order, except for a date range without
+since_id, which follows the (date, id) index instead so the database does
+not have to sort the whole range first.
+"""
+import csv
+import io
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import DischargeSummary, Patient, Visit
+
+DEFAULT_CHUNK_SIZE = 2000
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+FLUSH_BYTES = 64 * 1024
+
+
+class ExportSpec:
+    def __init__(self, model, columns, date_field, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.model = model
+        self.columns = columns  # (output name, lookup)
+        self.date_field = date_field  # what ?from / ?to filter on
+        self.chunk_size = chunk_size
+
+    @property
+    def headers(self):
+        return [name for name, _ in self.columns]
+
+
+EXPORTS = {
+    'patients': ExportSpec(Patient, [
+        ('id', 'id'), ('patient_id', 'patient_id'), ('name', 'name'), ('age', 'age'), ('gender', 'gender'),
+        ('contact_number', 'contact_number'), ('email', 'email'), ('address', 'address'), ('status', 'status'),
+        ('medical_history', 'medical_history'), ('last_visit_date', 'last_visit_date'),
+        ('visit_count', 'visit_count'),
+    ], date_field='last_visit_date'),
+    'visits': ExportSpec(Visit, [
+        ('id', 'id'), ('patient_id', 'patient__patient_id'), ('date', 'date'), ('doctor_name', 'doctor_name'),
+        ('checkup_type', 'checkup_type'), ('healthcare_service', 'healthcare_service'), ('bp', 'bp'),
+        ('oxygen_level', 'oxygen_level'), ('weight', 'weight'), ('systolic', 'systolic'),
+        ('diastolic', 'diastolic'), ('spo2', 'spo2'), ('notes', 'notes'), ('updated_at', 'updated_at'),
+    ], date_field='date'),
+    'discharges': ExportSpec(DischargeSummary, [
+        ('id', 'id'), ('patient_id', 'patient__patient_id'), ('uhid', 'uhid'), ('ip_id', 'ip_id'),
+        ('ward', 'ward'), ('bed_no', 'bed_no'), ('consultant_name', 'consultant_name'),
+        ('admission_date', 'admission_date'), ('discharge_date', 'discharge_date'),
+        ('discharge_type', 'discharge_type'), ('final_diagnosis', 'final_diagnosis'),
+        ('procedures_done', 'procedures_done'), ('clinical_examination', 'clinical_examination'),
+        ('consultations', 'consultations'), ('chief_complaints', 'chief_complaints'),
+        ('past_history', 'past_history'), ('hospital_course', 'hospital_course'),
+        ('condition_on_discharge', 'condition_on_discharge'), ('discharge_advice', 'discharge_advice'),
+        ('diet_advice', 'diet_advice'), ('follow_up', 'follow_up'),
+        ('emergency_instructions', 'emergency_instructions'), ('created_at', 'created_at'),
+    ], date_field='discharge_date', chunk_size=500),  # rows of several KB of free text
+}
+
+
+def export_rows(kind, since_id=None, date_from=None, date_to=None):
+    """values_list() queryset of the rows to export (see the module docstring for the order)."""
+    spec = EXPORTS[kind]
+    rows = spec.model.objects.all()
+    if since_id is not None:
+        rows = rows.filter(id__gt=since_id)
+    if date_from:
+        rows = rows.filter(**{f'{spec.date_field}__gte': date_from})
+    if date_to:
+        rows = rows.filter(**{f'{spec.date_field}__lte': date_to})
+    order = [spec.date_field, 'id'] if since_id is None and (date_from or date_to) else ['id']
+    return rows.order_by(*order).values_list(*(lookup for _, lookup in spec.columns))
+
+
+def _csv_lines(headers, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _ndjson_lines(headers, rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(dict(zip(headers, row))) + '\n'
+
+
+def stream_export(kind, fmt, rows, chunk_size=None, stats=None):
+    """
+    Generate the export as UTF-8 byte chunks. `rows` is export_rows()'s
+    queryset; `stats`, if given, collects the row count and largest id sent.
+    """
+    spec = EXPORTS[kind]
+    headers = spec.headers
+    chunk_size = chunk_size or spec.chunk_size
+
+    def counted(iterator):
+        if stats is None:
+            yield from iterator
+            return
+        count, last_id = 0, None
+        for row in iterator:
+            count += 1
+            last_id = row[0] if last_id is None else max(last_id, row[0])
+            yield row
+            stats['rows'], stats['last_id'] = count, last_id
+
+    lines = (_csv_lines if fmt == 'csv' else _ndjson_lines)(headers, counted(rows.iterator(chunk_size=chunk_size)))
+    pending, size = [], 0
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= FLUSH_BYTES:
+            yield ''.join(pending).encode()
+            pending, size = [], 0
+    if pending:
+        yield ''.join(pending).encode()
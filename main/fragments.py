@@ -0,0 +1,35 @@
+"""
+Rendered template fragments cached with {% cache %}.
+
+Templates cache with FRAGMENT_CACHE_TTL (from the fragment_cache context
+processor), which is 0, i.e. not cached, outside the production template
+profile. Fragments that show a patient are keyed on the patient's pk;
+invalidate_patient() drops them when the patient or one of their visits
+changes (see main.signals). Static chrome (nav, dashboard modules) has no
+invalidation and relies on the TTL.
+"""
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.utils import make_template_fragment_key
+
+# {% cache %} fragment names keyed on a patient pk
+PATIENT_FRAGMENTS = ('patient_card', 'visit_history_patient')
+
+
+def fragment_cache(request):
+    """Context processor: the TTL templates pass to {% cache %}."""
+    return {'FRAGMENT_CACHE_TTL': settings.FRAGMENT_CACHE_TTL}
+
+
+def _cache():
+    # The cache {% cache %} itself uses
+    try:
+        return caches['template_fragments']
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def invalidate_patient(*pks):
+    pks = [pk for pk in pks if pk is not None]
+    if pks:
+        _cache().delete_many([make_template_fragment_key(name, [pk]) for name in PATIENT_FRAGMENTS for pk in pks])
@@ -0,0 +1,50 @@
+"""
+Password hashing policy for AppUser logins.
+
+The work factor comes from settings (PASSWORD_HASH_ITERATIONS) instead of
+Django's release default, so it can be tuned to the hardware. A stored hash
+made with a different hasher or iteration count still verifies, and is
+rewritten with the current policy on the next successful login
+(verify_password's rehash).
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password, make_password
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 with settings.PASSWORD_HASH_ITERATIONS. It keeps the
+    'pbkdf2_sha256' algorithm name, so existing hashes verify unchanged and
+    must_update() flags the ones with a different iteration count.
+    """
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS
+
+
+@lru_cache(maxsize=4)
+def _dummy_hash(hasher_path, iterations):
+    # Keyed on the policy, so a settings change gets a hash that costs the same as real ones
+    return make_password('wellconx-dummy-password')
+
+
+def dummy_check(password):
+    """
+    Spend the same hashing work as a real check, for logins with an unknown
+    email, so response time does not reveal which emails are registered.
+    """
+    check_password(password, _dummy_hash(settings.PASSWORD_HASHERS[0], settings.PASSWORD_HASH_ITERATIONS))
+
+
+def verify_password(user, password):
+    """
+    Check `password` against the user's stored hash. On success, a hash made
+    under an older policy is replaced with one made under the current policy.
+    """
+    def rehash(raw_password):
+        user.password = make_password(raw_password)
+        type(user).objects.filter(pk=user.pk).update(password=user.password)
+
+    return check_password(password, user.password, setter=rehash)
@@ -0,0 +1,260 @@
+"""
+Bulk patient import from CSV or JSON Lines.
+
+Rows are streamed from the file, validated with PatientForm, and inserted
+with bulk_create() in fixed-size batches, reserving one block of patient_ids
+per batch. Only the current batch is held in memory; rejected rows go to an
+optional error file as they are found.
+
+Uploads through the web endpoint become jobs (start_import_job()) that run off
+the request thread and keep their status and rejected rows under IMPORT_DIR.
+"""
+import csv
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import audit, snapshots, stats
+from .forms import PatientForm
+from .models import IdSequence, PATIENT_ID_SEQUENCE, Patient, format_patient_id
+
+DEFAULT_BATCH_SIZE = 1000
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+logger = logging.getLogger(__name__)
+
+
+class ImportStats:
+    def __init__(self, keep_errors=100):
+        self.rows = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors = []  # first `keep_errors` only; the error file has the rest
+        self.keep_errors = keep_errors
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'imported': self.imported,
+            'failed': self.failed,
+            'elapsed_seconds': round(self.elapsed, 3),
+            'rows_per_sec': round(self.rows_per_sec, 1),
+            'errors': self.errors,
+        }
+
+
+def guess_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def text_stream(binary_file):
+    return io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+
+
+def iter_rows(stream, fmt):
+    """Yield (line_number, row_dict_or_None, parse_error_or_None) without reading the whole file."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, None, f'Invalid JSON: {e}'
+                continue
+            if not isinstance(row, dict):
+                yield line_number, None, 'Expected a JSON object'
+                continue
+            yield line_number, row, None
+    else:
+        raise ValueError(f'Unsupported import format: {fmt}')
+
+
+def import_patients(stream, fmt='csv', batch_size=DEFAULT_BATCH_SIZE, error_file=None, keep_errors=100):
+    """
+    Import patients from a text stream. Returns ImportStats.
+
+    `error_file` (optional, text mode) receives one CSV line per rejected row:
+    line number, validation errors as JSON, and the original row as JSON.
+    """
+    stats = ImportStats(keep_errors=keep_errors)
+    error_writer = csv.writer(error_file) if error_file is not None else None
+    if error_writer:
+        error_writer.writerow(['line', 'errors', 'row'])
+
+    def reject(line_number, errors, row):
+        stats.failed += 1
+        if len(stats.errors) < stats.keep_errors:
+            stats.errors.append({'line': line_number, 'errors': errors})
+        if error_writer:
+            error_writer.writerow([line_number, json.dumps(errors), json.dumps(row)])
+
+    form = _ReusablePatientForm()
+    batch = []
+    for line_number, row, parse_error in iter_rows(stream, fmt):
+        stats.rows += 1
+        if parse_error:
+            reject(line_number, {'__all__': [parse_error]}, row)
+            continue
+
+        form.bind(row)
+        if not form.is_valid():
+            reject(line_number, {field: [e['message'] for e in errs]
+                                 for field, errs in form.errors.get_json_data().items()}, row)
+            continue
+
+        batch.append(form.save(commit=False))
+        if len(batch) >= batch_size:
+            stats.imported += _insert_batch(batch)
+            batch = []
+
+    if batch:
+        stats.imported += _insert_batch(batch)
+
+    stats.elapsed = time.perf_counter() - stats.started
+    return stats
+
+
+class _ReusablePatientForm(PatientForm):
+    """
+    PatientForm that can be re-bound to a new row. Building a form deep-copies
+    every field and widget, which costs more than the validation itself when
+    done once per row, so the importer builds one form and re-binds it.
+    """
+    def bind(self, data):
+        self.is_bound = True
+        self.data = data
+        self.instance = Patient()
+        self._errors = None
+
+
+def _insert_batch(patients):
+    numbers = IdSequence.reserve(PATIENT_ID_SEQUENCE, len(patients))
+    for patient, number in zip(patients, numbers):
+        patient.patient_id = format_patient_id(number)
+    with transaction.atomic():
+        Patient.objects.bulk_create(patients)
+        if patients[0].pk is None:
+            # Backends that cannot return ids from a bulk insert; the audit entries need them
+            pks = dict(Patient.objects.filter(patient_id__in=[p.patient_id for p in patients])
+                       .values_list('patient_id', 'pk'))
+            for patient in patients:
+                patient.pk = pks[patient.patient_id]
+        stats.record_created(patients)
+        audit.record_created(patients)
+    # Drop any cached "no such patient" answers for the new ids
+    snapshots.invalidate(*(patient.patient_id for patient in patients))
+    return len(patients)
+
+
+# -------------------- Upload jobs --------------------
+# Each job is a directory under IMPORT_DIR holding the upload (until it has
+# been imported), status.json and errors.csv, so whichever web process gets
+# the status request can answer it.
+JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.IMPORT_WORKERS,
+                                           thread_name_prefix='patient-import')
+        return _executor
+
+
+def job_dir(job_id):
+    return Path(settings.IMPORT_DIR) / job_id
+
+
+def job_errors_path(job_id):
+    return job_dir(job_id) / 'errors.csv'
+
+
+def job_status(job_id):
+    """The job's status dict, or None if there is no such job."""
+    if not JOB_ID_RE.match(job_id):
+        return None
+    try:
+        return json.loads((job_dir(job_id) / 'status.json').read_text())
+    except FileNotFoundError:
+        return None
+
+
+def _write_status(job_id, status):
+    # Replaced atomically so a reader never sees half a file
+    directory = job_dir(job_id)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(status, f)
+    os.replace(tmp, directory / 'status.json')
+
+
+def start_import_job(upload, fmt, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Save an uploaded file and import it on a worker thread, or inline when
+    IMPORT_WORKERS is 0. Returns the job id for job_status().
+    """
+    job_id = uuid.uuid4().hex
+    directory = job_dir(job_id)
+    directory.mkdir(parents=True)
+    with open(directory / 'upload', 'wb') as f:
+        for chunk in upload.chunks():
+            f.write(chunk)
+    job = {'filename': upload.name, 'format': fmt, 'batch_size': batch_size}
+    _write_status(job_id, {'status': QUEUED, **job})
+    if settings.IMPORT_WORKERS:
+        _get_executor().submit(_run_job_in_thread, job_id, job)
+    else:
+        _run_job(job_id, job)
+    return job_id
+
+
+def _run_job_in_thread(job_id, job):
+    try:
+        _run_job(job_id, job)
+    finally:
+        connection.close()  # this thread's connection; the pool thread may idle for a long time
+
+
+def _run_job(job_id, job):
+    directory = job_dir(job_id)
+    _write_status(job_id, {'status': RUNNING, **job})
+    try:
+        with open(directory / 'upload', 'rb') as upload, \
+                open(job_errors_path(job_id), 'w', newline='', encoding='utf-8') as error_file:
+            result = import_patients(text_stream(upload), fmt=job['format'], batch_size=job['batch_size'],
+                                     error_file=error_file)
+    except Exception as e:
+        # Batches committed before the failure stay imported
+        logger.exception("Patient import %s failed", job_id)
+        _write_status(job_id, {'status': FAILED, **job, 'error': f'{type(e).__name__}: {e}'})
+    else:
+        _write_status(job_id, {'status': DONE, **job, **result.as_dict(), 'error_count': result.failed})
+    finally:
+        (directory / 'upload').unlink(missing_ok=True)
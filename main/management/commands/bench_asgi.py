@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient
+
+from main.benchmarks import Timer, arun_load, async_views, run_load, scratch_database, seed_database
+from main.models import Patient
+from main.management.commands.benchmark import admin_client, endpoints
+
+# Endpoints that have an async twin (see main.views, "Async views")
+ASYNC_ENDPOINTS = ('ehr_home', 'patient_api', 'patient_search', 'discharge_summary_list')
+
+
+def async_admin_client():
+    # Log in through the sync client, then hand its session cookie to an AsyncClient
+    client = AsyncClient()
+    client.cookies = admin_client().cookies
+    return client
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync views behind the WSGI handler (one thread per in-flight request) "
+        "with the async views behind the ASGI handler (one event loop) at high concurrency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=5000)
+        parser.add_argument('--visits', type=int, default=3, help="Visits per patient")
+        parser.add_argument('--discharges', type=int, default=1000)
+        parser.add_argument('--requests', type=int, default=500, help="Requests per endpoint and mode")
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--endpoint', action='append', dest='endpoints', choices=ASYNC_ENDPOINTS,
+                            help="Only run these (repeatable)")
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError("--concurrency must be at least 1")
+        selected = options['endpoints'] or ASYNC_ENDPOINTS
+        concurrency = options['concurrency']
+
+        rows = []
+        with scratch_database():
+            with Timer() as t:
+                seed_database(options['patients'], options['visits'], options['discharges'])
+            self.stdout.write(f"seeded {options['patients']} patients in {t.elapsed:.1f}s")
+
+            patient_ids = list(Patient.objects.values_list('patient_id', flat=True)[:1000])
+            for name in selected:
+                make_request = endpoints(patient_ids, [])[name]
+                rows.append(('wsgi', run_load(name, make_request, options['requests'], concurrency, admin_client)))
+                clients = [async_admin_client() for _ in range(concurrency)]
+                with async_views():
+                    make_request = endpoints(patient_ids, [])[name]
+                    rows.append(('asgi', arun_load(name, make_request, options['requests'], concurrency, clients)))
+
+        self.stdout.write(f"{'endpoint':24s} {'mode':5s} {'reqs':>6s} {'err':>4s} {'req/s':>8s} "
+                          f"{'p50ms':>8s} {'p95ms':>8s} {'p99ms':>8s} {'threads':>8s}")
+        for mode, result in rows:
+            r = result.as_dict()
+            self.stdout.write(
+                f"{result.name:24s} {mode:5s} {r['requests']:6d} {r['errors']:4d} {r['rps']:8.1f} "
+                f"{r['p50_ms']:8.2f} {r['p95_ms']:8.2f} {r['p99_ms']:8.2f} {result.peak_threads:8d}"
+            )
@@ -0,0 +1,73 @@
+import itertools
+import random
+import tempfile
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from main import audit
+from main.benchmarks import Timer, run_load, scratch_database, seed_database
+from main.models import AppUser, AuditEntry, Patient
+
+PASSWORD = 'bench-password'
+
+
+class Command(BaseCommand):
+    help = (
+        "Throughput and latency of new_visit and edit_patient with AUDIT_LOG off, inline "
+        "(insert at commit) and background (fsync'd spool + batched insert from a thread)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=2000)
+        parser.add_argument('--requests', type=int, default=400, help="Requests per view and mode")
+        parser.add_argument('--concurrency', type=int, default=8)
+
+    def handle(self, *args, **options):
+        settings_for_bench = override_settings(PASSWORD_HASH_ITERATIONS=1000, LOGIN_THROTTLE_ENABLED=False)
+        with settings_for_bench, scratch_database(), tempfile.TemporaryDirectory() as spool_dir:
+            seed_database(options['patients'], 2, 0)
+            AppUser.objects.create(username='admin', usermail='admin@wellconx.test',
+                                   password=make_password(PASSWORD), role='admin')
+            patients = list(Patient.objects.order_by('id').values('id', 'patient_id', 'name', 'age', 'gender')
+                            [:options['patients']])
+            runs = itertools.count()
+
+            def signed_in_client():
+                client = Client()
+                response = client.post('/', {'email': 'admin@wellconx.test', 'password': PASSWORD})
+                assert response.status_code == 302, "benchmark login failed"
+                return client
+
+            def new_visit(client, i):
+                return client.post('/new_visit/', {
+                    'patient': random.choice(patients)['id'], 'date': '2025-03-01', 'doctor_name': 'Dr. Rao',
+                    'checkup_type': 'Regular', 'healthcare_service': 'OPD', 'bp': '120/80',
+                    'oxygen_level': '98%', 'weight': '70.00', 'notes': 'Routine review',
+                })
+
+            def edit_patient(client, i):
+                # A new contact number on every request, so every save is a real change
+                patient = random.choice(patients)
+                return client.post(f"/patient/{patient['patient_id']}/edit/", {
+                    'name': patient['name'], 'age': patient['age'], 'gender': patient['gender'],
+                    'contact_number': f'9{next(runs):09d}', 'status': 'Follow-up',
+                })
+
+            self.stdout.write(f"{'view':14s} {'AUDIT_LOG':11s} {'req/s':>8s} {'p50ms':>8s} {'p95ms':>8s} "
+                              f"{'errors':>7s} {'entries':>8s} {'flush lag s':>12s}")
+            for name, post in (('new_visit', new_visit), ('edit_patient', edit_patient)):
+                for mode in audit.AUDIT_MODES:
+                    with override_settings(AUDIT_LOG=mode, AUDIT_SPOOL_DIR=spool_dir):
+                        before = AuditEntry.objects.count()
+                        result = run_load(name, post, options['requests'], options['concurrency'], signed_in_client)
+                        # How far the background flusher is behind the last request
+                        with Timer() as lag:
+                            audit.flush()
+                        entries = AuditEntry.objects.count() - before
+                    row = result.as_dict()
+                    self.stdout.write(
+                        f"{name:14s} {mode:11s} {row['rps']:8.1f} {row['p50_ms']:8.2f} {row['p95_ms']:8.2f} "
+                        f"{row['errors']:7d} {entries:8d} {lag.elapsed:12.3f}"
+                    )
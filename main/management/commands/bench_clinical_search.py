@@ -0,0 +1,77 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from main.benchmarks import (Timer, percentile, scratch_database, seed_discharge_summaries, seed_patients,
+                             seed_visits)
+from main.models import DischargeSummary, Patient
+from main.search import fts_enabled, search_clinical
+
+VISITS_PER_PATIENT = 5
+
+# (label, kind, term, field)
+QUERIES = [
+    ('common word', 'discharge', 'hypertension', None),
+    ('rare word', 'discharge', 'lithotripsy', None),
+    ('no match', 'discharge', 'sarcoidosis', None),
+    ('two words', 'discharge', 'ckd dialysis', None),
+    ('diagnosis only', 'discharge', 'ckd', 'final_diagnosis'),
+    ('prefix', 'discharge', 'glomerulo*', None),
+    ('visit notes', 'visit', 'pneumonia antibiotics', None),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed discharge summaries and visit notes on a scratch database and time "
+        "ranked and newest-first clinical full-text queries, against LIKE scans."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=1_000_000,
+                            help="Discharge summaries plus visits, split evenly")
+        parser.add_argument('--text-words', type=int, default=60, help="Words of hospital course per summary")
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--skip-like', action='store_true', help="Skip the LIKE baseline")
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            if not fts_enabled():
+                raise CommandError("Clinical search benchmarks need SQLite FTS5")
+            discharges = options['documents'] // 2
+            patients = max(1, (options['documents'] - discharges) // VISITS_PER_PATIENT)
+            with Timer() as t:
+                seed_patients(patients)
+                seed_visits(VISITS_PER_PATIENT)
+                seed_discharge_summaries(discharges, patients=list(Patient.objects.all()[:10000]),
+                                         text_words=options['text_words'])
+            self.stdout.write(f"seeded {discharges} discharge summaries and {patients * VISITS_PER_PATIENT} "
+                              f"visits (indexed by triggers) in {t.elapsed:.1f}s")
+
+            self.stdout.write(f"{'query':16s} {'sort':10s} {'hits':>5s} {'p50ms':>9s} {'p95ms':>9s}")
+            for label, kind, term, field in QUERIES:
+                for sort in ('relevance', 'recent'):
+                    self._report(label, sort, lambda: search_clinical(term, kind, field=field, sort=sort),
+                                 options['repeat'])
+            if not options['skip_like']:
+                # LIKE stops once it has a page of matches, so it is cheap for frequent words
+                # and reads the whole table for a word that (almost) never occurs
+                for label, term in (('common word', 'hypertension'), ('rare word', 'lithotripsy'),
+                                    ('no match', 'sarcoidosis')):
+                    self._report(label, 'LIKE', lambda: list(
+                        DischargeSummary.objects.filter(
+                            Q(final_diagnosis__icontains=term) | Q(procedures_done__icontains=term)
+                            | Q(hospital_course__icontains=term)
+                        ).order_by('-discharge_date', '-id').values_list('id', flat=True)[:20]
+                    ), repeat=3)
+
+    def _report(self, label, sort, search, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            hits = search()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        self.stdout.write(f"{label:16s} {sort:10s} {len(hits):5d} "
+                          f"{percentile(timings, 50):9.2f} {percentile(timings, 95):9.2f}")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from main.benchmarks import Timer, scratch_database, seed_discharge_summaries
+from main.models import DischargeSummary
+from main.pdf import stream_summaries_zip
+
+
+class Command(BaseCommand):
+    help = "Benchmark batch PDF export throughput (PDFs/sec/core) on a scratch database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--summaries', type=int, default=200)
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            seed_discharge_summaries(options['summaries'])
+            for workers in options['workers']:
+                stats = {}
+                summaries = DischargeSummary.objects.select_related('patient').order_by('id')
+                with Timer() as t:
+                    for _ in stream_summaries_zip(summaries.iterator(), 'http://localhost/', workers, stats=stats):
+                        pass
+                rate = stats.get('pdfs', 0) / t.elapsed
+                cores = max(workers, 1)
+                self.stdout.write(
+                    f"workers={workers}: {stats.get('pdfs', 0)} PDFs in {t.elapsed:.1f}s -> "
+                    f"{rate:.1f} PDFs/sec, {rate / cores:.1f} PDFs/sec/core, errors={stats.get('errors', 0)}"
+                )
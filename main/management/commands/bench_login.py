@@ -0,0 +1,94 @@
+import logging
+import random
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from main.benchmarks import Timer, run_load, scratch_database
+from main.models import AppUser
+
+PASSWORD = 'correct horse battery staple'
+
+
+def login_traffic(users, attack_share, rng):
+    """
+    make_request(client, i) for run_load: mostly credential stuffing from a
+    handful of addresses (wrong passwords for real accounts, made-up emails),
+    plus real users signing in from their own addresses.
+    """
+    attacker_ips = [f'203.0.113.{n}' for n in range(1, 5)]
+    lock = threading.Lock()
+
+    def make_request(client, i):
+        with lock:
+            attack = rng.random() < attack_share
+            user = rng.choice(users)
+            if attack:
+                ip = rng.choice(attacker_ips)
+                email = user if rng.random() < 0.5 else f'nobody{rng.randint(1, 10**6)}@example.com'
+                password, kind = f'guess{rng.randint(1, 10**6)}', 'attack'
+            else:
+                ip, email, password, kind = f'198.51.100.{users.index(user) + 1}', user, PASSWORD, 'legit'
+        response = client.post('/', {'email': email, 'password': password}, REMOTE_ADDR=ip)
+        with lock:
+            if response.status_code == 429:
+                outcomes[kind, 'throttled'] += 1
+            elif response.status_code == 302:
+                outcomes[kind, 'signed in'] += 1
+            else:
+                outcomes[kind, 'rejected'] += 1
+        return response
+
+    outcomes = Counter()
+    return make_request, outcomes
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure login throughput and latency under credential-stuffing traffic, "
+        "with the login throttle on and off, on a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--attack-share', type=float, default=0.9,
+                            help="Fraction of requests that are attack traffic")
+        parser.add_argument('--iterations', type=int, default=None,
+                            help="PBKDF2 iterations (default: PASSWORD_HASH_ITERATIONS)")
+
+    def handle(self, *args, **options):
+        if not 0 <= options['attack_share'] <= 1:
+            raise CommandError("--attack-share must be between 0 and 1")
+        iterations = options['iterations'] or settings.PASSWORD_HASH_ITERATIONS
+        logging.getLogger('django.request').setLevel(logging.ERROR)  # one warning per 429 otherwise
+
+        with override_settings(PASSWORD_HASH_ITERATIONS=iterations), scratch_database():
+            with Timer() as t:
+                hashed = make_password(PASSWORD)
+            self.stdout.write(f"one hash at {iterations} iterations: {t.elapsed * 1000:.0f}ms")
+
+            users = [f'user{n}@wellconx.test' for n in range(options['users'])]
+            AppUser.objects.bulk_create(
+                AppUser(username=email.split('@')[0], usermail=email, password=hashed, role='doctor')
+                for email in users
+            )
+
+            self.stdout.write(f"{'throttle':9s} {'reqs':>6s} {'req/s':>8s} {'p50ms':>8s} {'p95ms':>8s}  outcomes")
+            for enabled in (False, True):
+                caches[settings.LOGIN_THROTTLE_CACHE_ALIAS].clear()
+                make_request, outcomes = login_traffic(users, options['attack_share'], random.Random(11))
+                with override_settings(LOGIN_THROTTLE_ENABLED=enabled):
+                    result = run_load('login', make_request, options['requests'], options['concurrency'], Client)
+                r = result.as_dict()
+                summary = ', '.join(f"{kind} {outcome}={n}" for (kind, outcome), n in sorted(outcomes.items()))
+                self.stdout.write(
+                    f"{'on' if enabled else 'off':9s} {r['requests']:6d} {r['rps']:8.1f} "
+                    f"{r['p50_ms']:8.2f} {r['p95_ms']:8.2f}  {summary}"
+                )
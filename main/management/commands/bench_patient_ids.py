@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from main.benchmarks import Timer, scratch_database
+from main.models import IdSequence, PATIENT_ID_SEQUENCE, Patient, format_patient_id
+
+
+class Command(BaseCommand):
+    help = "Benchmark patient_id allocation (inserts/sec) with concurrent writers on a scratch database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--inserts', type=int, default=250, help="Patients inserted per writer")
+        parser.add_argument('--block-size', type=int, default=0,
+                            help="Reserve IDs in blocks of this size and bulk_create (0 = one save() per patient)")
+
+    def handle(self, *args, **options):
+        writers = options['writers']
+        inserts = options['inserts']
+        block_size = options['block_size']
+
+        with scratch_database():
+            with Timer() as t:
+                with ThreadPoolExecutor(max_workers=writers) as pool:
+                    list(pool.map(lambda _: self._writer(inserts, block_size), range(writers)))
+
+            total = Patient.objects.count()
+            distinct = Patient.objects.values('patient_id').distinct().count()
+
+        self.stdout.write(f"writers={writers} inserts/writer={inserts} block_size={block_size or 'n/a'}")
+        self.stdout.write(f"{total} patients in {t.elapsed:.2f}s -> {total / t.elapsed:.0f} inserts/sec")
+        if distinct != total or total != writers * inserts:
+            self.stderr.write(self.style.ERROR(f"expected {writers * inserts} unique IDs, got {distinct}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("all patient_ids unique"))
+
+    def _writer(self, inserts, block_size):
+        try:
+            if not block_size:
+                for _ in range(inserts):
+                    Patient.objects.create(name='Bench', age=40, gender='Other',
+                                           contact_number='0000000000', status='Active')
+                return
+            remaining = inserts
+            while remaining:
+                size = min(block_size, remaining)
+                numbers = IdSequence.reserve(PATIENT_ID_SEQUENCE, size)
+                Patient.objects.bulk_create([
+                    Patient(name='Bench', age=40, gender='Other', contact_number='0000000000',
+                            status='Active', patient_id=format_patient_id(n))
+                    for n in numbers
+                ])
+                remaining -= size
+        finally:
+            connection.close()
@@ -0,0 +1,46 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.benchmarks import FIRST_NAMES, LAST_NAMES, Timer, percentile, scratch_database, seed_patients
+from main.models import Patient
+from main.search import search_patients
+
+
+class Command(BaseCommand):
+    help = "Benchmark per-keystroke patient_search latency on a scratch database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=100_000)
+        parser.add_argument('--queries', type=int, default=50, help="Typed terms to replay")
+
+    def handle(self, *args, **options):
+        rng = random.Random(7)
+        with scratch_database():
+            with Timer() as t:
+                seed_patients(options['patients'])
+            self.stdout.write(f"seeded {options['patients']} patients in {t.elapsed:.1f}s")
+
+            # Replay every prefix of each term, the way Select2 fires while typing
+            keystrokes = []
+            for _ in range(options['queries']):
+                term = rng.choice([rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), f'PO{rng.randint(1, 999):03d}'])
+                keystrokes.extend(term[:i] for i in range(1, len(term) + 1))
+
+            self._report('fts', keystrokes, lambda term: search_patients(term, limit=20))
+            self._report('icontains', keystrokes,
+                         lambda term: list(Patient.objects.filter(name__icontains=term).order_by('name')[:20]))
+
+    def _report(self, label, keystrokes, search):
+        timings = []
+        for term in keystrokes:
+            start = time.perf_counter()
+            search(term)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f"{label:10s} keystrokes={len(timings)} "
+            f"p50={percentile(timings, 50):.2f}ms p95={percentile(timings, 95):.2f}ms "
+            f"p99={percentile(timings, 99):.2f}ms"
+        )
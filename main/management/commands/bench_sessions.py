@@ -0,0 +1,65 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from main.benchmarks import percentile, scratch_database
+from main.models import AppUser
+
+PASSWORD = 'bench-password'
+
+
+def signed_in_client(keep_auth_cookie):
+    client = Client()
+    response = client.post('/', {'email': 'admin@wellconx.test', 'password': PASSWORD})
+    assert response.status_code == 302, "benchmark login failed"
+    if not keep_auth_cookie:
+        # Role checks fall back to the session, as every view did before main.auth
+        del client.cookies[settings.AUTH_COOKIE_NAME]
+    return client
+
+
+class Command(BaseCommand):
+    help = (
+        "Per-request cost of the auth check on a role-protected page for each "
+        "SESSION_BACKEND, with and without the signed auth cookie."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--path', default='/add_patient/', help="Admin-only page to request")
+
+    def handle(self, *args, **options):
+        with override_settings(PASSWORD_HASH_ITERATIONS=1000, LOGIN_THROTTLE_ENABLED=False), scratch_database():
+            AppUser.objects.create(username='admin', usermail='admin@wellconx.test',
+                                   password=make_password(PASSWORD), role='admin')
+
+            self.stdout.write(f"{'session backend':16s} {'auth cookie':11s} {'p50ms':>8s} {'p95ms':>8s} "
+                              f"{'queries':>8s} {'session queries':>16s}")
+            for label, engine in settings.SESSION_BACKENDS.items():
+                for keep_auth_cookie in (False, True):
+                    cache.clear()
+                    with override_settings(SESSION_ENGINE=engine):
+                        client = signed_in_client(keep_auth_cookie)
+                        client.get(options['path'])  # warm up (cached_db fills the cache here)
+                        timings, queries, session_queries = [], 0, 0
+                        for _ in range(options['requests']):
+                            with CaptureQueriesContext(connection) as ctx:
+                                start = time.perf_counter()
+                                response = client.get(options['path'])
+                                timings.append((time.perf_counter() - start) * 1000)
+                            assert response.status_code == 200, response.status_code
+                            queries += len(ctx.captured_queries)
+                            session_queries += sum('django_session' in q['sql'] for q in ctx.captured_queries)
+                    timings.sort()
+                    n = options['requests']
+                    self.stdout.write(
+                        f"{label:16s} {'yes' if keep_auth_cookie else 'no':11s} "
+                        f"{percentile(timings, 50):8.3f} {percentile(timings, 95):8.3f} "
+                        f"{queries / n:8.2f} {session_queries / n:16.2f}"
+                    )
@@ -0,0 +1,104 @@
+import copy
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from main.benchmarks import percentile, scratch_database, seed_database
+from main.models import AppUser
+
+PASSWORD = 'bench-password'
+PAGES = ['/dashboard/', '/ehr_home/', '/visit_history/', '/discharge/list/', '/discharge/add/']
+
+
+def profile_settings(profile, ttl):
+    """TEMPLATES / TEMPLATE_PROFILE / FRAGMENT_CACHE_TTL as wellconx.settings builds them for `profile`."""
+    templates = copy.deepcopy(settings.TEMPLATES)
+    options = templates[0]['OPTIONS']
+    options.pop('loaders', None)
+    options.pop('debug', None)
+    templates[0]['APP_DIRS'] = True
+    if profile == 'production':
+        templates[0]['APP_DIRS'] = False
+        options.update({
+            'debug': False,
+            'loaders': [('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ])],
+        })
+    else:
+        # What the cached loader gives development since Django 4.1 is exactly what is
+        # being compared, so spell out the uncached loaders
+        templates[0]['APP_DIRS'] = False
+        options.update({
+            'debug': True,
+            'loaders': [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ],
+        })
+    return {
+        'TEMPLATES': templates,
+        'TEMPLATE_PROFILE': profile,
+        'FRAGMENT_CACHE_TTL': ttl if profile == 'production' else 0,
+    }
+
+
+def server_timing(response):
+    timings = {}
+    for metric in response['Server-Timing'].split(','):
+        name, *params = metric.strip().split(';')
+        for param in params:
+            if param.startswith('dur='):
+                timings[name] = float(param[4:])
+    return timings
+
+
+class Command(BaseCommand):
+    help = (
+        "Template render time per page under TEMPLATE_PROFILE=development (templates "
+        "loaded and compiled on every request, no fragment caching) and production "
+        "(cached loader, {% cache %} fragments), from the Server-Timing header."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=5000)
+        parser.add_argument('--visits-per-patient', type=int, default=5)
+        parser.add_argument('--discharges', type=int, default=500)
+        parser.add_argument('--requests', type=int, default=200, help="Requests per page and profile")
+        parser.add_argument('--ttl', type=int, default=600, help="FRAGMENT_CACHE_TTL for the production profile")
+
+    def handle(self, *args, **options):
+        metrics = override_settings(REQUEST_METRICS_ENABLED=True, REQUEST_METRICS_SERVER_TIMING=True,
+                                    PASSWORD_HASH_ITERATIONS=1000, LOGIN_THROTTLE_ENABLED=False)
+        with metrics, scratch_database():
+            seed_database(options['patients'], options['visits_per_patient'], options['discharges'])
+            AppUser.objects.create(username='admin', usermail='admin@wellconx.test',
+                                   password=make_password(PASSWORD), role='admin')
+
+            self.stdout.write(f"{'page':18s} {'profile':12s} {'tpl p50':>8s} {'tpl p95':>8s} "
+                              f"{'total p50':>10s} {'total p95':>10s}")
+            for path in PAGES:
+                for profile in ('development', 'production'):
+                    cache.clear()
+                    with override_settings(**profile_settings(profile, options['ttl'])):
+                        client = Client()
+                        response = client.post('/', {'email': 'admin@wellconx.test', 'password': PASSWORD})
+                        assert response.status_code == 302, "benchmark login failed"
+                        client.get(path)  # warm up (fills the loader and fragment caches)
+                        tpl, total = [], []
+                        for _ in range(options['requests']):
+                            response = client.get(path)
+                            assert response.status_code == 200, (path, response.status_code)
+                            timings = server_timing(response)
+                            tpl.append(timings['tpl'])
+                            total.append(timings['total'])
+                    tpl.sort()
+                    total.sort()
+                    self.stdout.write(
+                        f"{path:18s} {profile:12s} {percentile(tpl, 50):8.2f} {percentile(tpl, 95):8.2f} "
+                        f"{percentile(total, 50):10.2f} {percentile(total, 95):10.2f}"
+                    )
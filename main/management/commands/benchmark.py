@@ -0,0 +1,124 @@
+import json
+import random
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from main.benchmarks import FIRST_NAMES, Timer, run_load, scratch_database, seed_database
+from main.models import DischargeSummary, Patient
+
+BENCHMARK_DIR = Path(settings.BASE_DIR) / 'benchmarks'
+DEFAULT_BASELINE = BENCHMARK_DIR / 'baseline.json'  # committed, so every checkout compares against it
+LATEST_RUN = BENCHMARK_DIR / 'latest.json'  # scratch, gitignored
+# Runs with different data or load are not comparable
+RUN_OPTIONS = ('patients', 'visits', 'discharges', 'requests', 'concurrency')
+
+
+def admin_client():
+    client = Client()
+    session = client.session
+    session['user_id'] = 'benchmark'
+    session['username'] = 'benchmark'
+    session['role'] = 'admin'
+    session.save()
+    return client
+
+
+def endpoints(patient_ids, summary_pks):
+    rng = random.Random(3)
+    return {
+        'ehr_home': lambda c, i: c.get('/ehr_home/'),
+        'patient_search': lambda c, i: c.get('/patients/search/', {'term': rng.choice(FIRST_NAMES)[:1 + i % 5]}),
+        'visit_history': lambda c, i: c.get('/visit_history/'),
+        'discharge_summary_list': lambda c, i: c.get('/discharge/list/'),
+        'discharge_summary_pdf': lambda c, i: c.get(f'/discharge/{rng.choice(summary_pks)}/pdf/'),
+        'patient_api': lambda c, i: c.get(f'/api/patient/{rng.choice(patient_ids)}/'),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a scratch database and drive the main views at fixed concurrency. "
+        "Reports p50/p95/p99 latency and req/s per endpoint and compares against the committed "
+        "baseline (benchmarks/baseline.json)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=5000)
+        parser.add_argument('--visits', type=int, default=3, help="Visits per patient")
+        parser.add_argument('--discharges', type=int, default=1000)
+        parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint")
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--endpoint', action='append', dest='endpoints', help="Only run these (repeatable)")
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument('--save-baseline', action='store_true', help="Store this run as the new baseline")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Allowed p95 slowdown / throughput drop vs baseline (0.25 = 25%%)")
+
+    def handle(self, *args, **options):
+        selected = options['endpoints'] or list(endpoints([], []))
+        unknown = set(selected) - set(endpoints([], []))
+        if unknown:
+            raise CommandError(f"Unknown endpoint(s): {', '.join(sorted(unknown))}")
+
+        results = {}
+        with scratch_database(), tempfile.TemporaryDirectory() as pdf_cache, \
+                override_settings(PDF_CACHE_DIR=pdf_cache, PDF_RENDER_WORKERS=0):
+            with Timer() as t:
+                seed_database(options['patients'], options['visits'], options['discharges'])
+            self.stdout.write(
+                f"seeded {options['patients']} patients, {options['patients'] * options['visits']} visits, "
+                f"{options['discharges']} discharge summaries in {t.elapsed:.1f}s"
+            )
+
+            patient_ids = list(Patient.objects.values_list('patient_id', flat=True)[:1000])
+            summary_pks = list(DischargeSummary.objects.values_list('pk', flat=True)[:50])
+            available = endpoints(patient_ids, summary_pks)
+            for name in selected:
+                result = run_load(name, available[name], options['requests'], options['concurrency'], admin_client)
+                results[name] = result.as_dict()
+
+        run = {'options': {name: options[name] for name in RUN_OPTIONS}, 'results': results}
+        LATEST_RUN.parent.mkdir(parents=True, exist_ok=True)
+        LATEST_RUN.write_text(json.dumps(run, indent=2, sort_keys=True) + '\n')
+        self._report(results)
+        self._compare(run, options)
+
+    def _report(self, results):
+        self.stdout.write(f"{'endpoint':26s} {'reqs':>6s} {'err':>4s} {'req/s':>8s} {'p50ms':>8s} {'p95ms':>8s} {'p99ms':>8s}")
+        for name, r in results.items():
+            self.stdout.write(
+                f"{name:26s} {r['requests']:6d} {r['errors']:4d} {r['rps']:8.1f} "
+                f"{r['p50_ms']:8.2f} {r['p95_ms']:8.2f} {r['p99_ms']:8.2f}"
+            )
+
+    def _compare(self, run, options):
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(run, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f"baseline saved to {baseline_path}"))
+            return
+        if not baseline_path.exists():
+            raise CommandError(f"no baseline at {baseline_path}; run with --save-baseline to create one")
+
+        baseline = json.loads(baseline_path.read_text())
+        if baseline['options'] != run['options']:
+            raise CommandError(f"baseline {baseline_path} was recorded with {baseline['options']}, "
+                               f"not {run['options']}; rerun with those options or save a new baseline")
+        tolerance = options['tolerance']
+        regressions = []
+        for name, r in run['results'].items():
+            base = baseline['results'].get(name)
+            if not base:
+                continue
+            if r['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{name}: p95 {r['p95_ms']:.2f}ms vs baseline {base['p95_ms']:.2f}ms")
+            if r['rps'] < base['rps'] * (1 - tolerance):
+                regressions.append(f"{name}: {r['rps']:.1f} req/s vs baseline {base['rps']:.1f} req/s")
+        if regressions:
+            raise CommandError("performance regression:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"within {tolerance:.0%} of baseline {baseline_path}"))
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from main.benchmarks import Timer
+from main.models import DischargeSummary
+from main.pdf import stream_summaries_zip
+
+
+class Command(BaseCommand):
+    help = "Export discharge summary PDFs to a ZIP file, filtered by date range, ward or consultant."
+
+    def add_arguments(self, parser):
+        parser.add_argument('out', help="Path of the ZIP file to write")
+        parser.add_argument('--from', dest='date_from', help="Discharge date from (YYYY-MM-DD)")
+        parser.add_argument('--to', dest='date_to', help="Discharge date to (YYYY-MM-DD)")
+        parser.add_argument('--ward')
+        parser.add_argument('--consultant')
+        parser.add_argument('--workers', type=int, default=settings.PDF_EXPORT_WORKERS)
+        parser.add_argument('--base-url', default='http://localhost/',
+                            help="Used to resolve absolute URLs in the PDF template")
+
+    def handle(self, *args, **options):
+        dates = {}
+        for key in ('date_from', 'date_to'):
+            if options[key]:
+                dates[key] = parse_date(options[key])
+                if dates[key] is None:
+                    raise CommandError(f"{options[key]!r} is not a YYYY-MM-DD date")
+
+        summaries = DischargeSummary.objects.select_related('patient').filter_by(
+            ward=options['ward'], consultant=options['consultant'], **dates,
+        ).order_by('discharge_date', 'id')
+
+        stats = {}
+        with Timer() as t, open(options['out'], 'wb') as out:
+            for chunk in stream_summaries_zip(summaries.iterator(chunk_size=200), options['base_url'],
+                                              workers=options['workers'], stats=stats):
+                out.write(chunk)
+
+        pdfs = stats.get('pdfs', 0)
+        self.stdout.write(
+            f"{pdfs} PDFs ({stats.get('bytes', 0) / 1e6:.1f} MB) written to {options['out']} "
+            f"in {t.elapsed:.1f}s ({pdfs / t.elapsed:.1f} PDFs/sec)"
+        )
+        if stats.get('errors'):
+            self.stderr.write(self.style.WARNING(f"{stats['errors']} summaries failed; see errors.txt in the archive"))
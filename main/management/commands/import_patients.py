@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.importers import DEFAULT_BATCH_SIZE, IMPORT_FORMATS, guess_format, import_patients, text_stream
+
+
+class Command(BaseCommand):
+    help = "Bulk-import patients from a CSV or JSON Lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help="Defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--errors', help="Write rejected rows to this CSV file")
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or guess_format(options['path'])
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        error_file = open(options['errors'], 'w', newline='', encoding='utf-8') if options['errors'] else None
+        try:
+            with open(options['path'], 'rb') as f:
+                stats = import_patients(text_stream(f), fmt=fmt, batch_size=options['batch_size'],
+                                        error_file=error_file, keep_errors=0)
+        except FileNotFoundError:
+            raise CommandError(f"No such file: {options['path']}")
+        finally:
+            if error_file:
+                error_file.close()
+
+        self.stdout.write(
+            f"{stats.rows} rows, {stats.imported} imported, {stats.failed} rejected "
+            f"in {stats.elapsed:.2f}s ({stats.rows_per_sec:.0f} rows/sec)"
+        )
+        if stats.failed and options['errors']:
+            self.stdout.write(f"rejected rows written to {options['errors']}")
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from main.models import Patient
+
+
+class Command(BaseCommand):
+    help = "Recompute Patient.last_visit_date and visit_count from the Visit table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Patients per UPDATE")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        started = time.perf_counter()
+        last_id = Patient.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        updated = 0
+        for start in range(0, last_id, batch_size):
+            block = Patient.objects.filter(id__gt=start, id__lte=start + batch_size).values('pk')
+            with transaction.atomic():
+                updated += Patient.refresh_visit_stats(block)
+        self.stdout.write(f"{updated} patients rebuilt in {time.perf_counter() - started:.2f}s")
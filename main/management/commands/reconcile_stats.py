@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from main.stats import reconcile
+
+
+class Command(BaseCommand):
+    help = ("Recount the materialized dashboard statistics and fix any drift. "
+            "Safe to run from cron: writes wait for it, and writes made through signals are "
+            "already counted.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without changing anything")
+
+    def handle(self, *args, **options):
+        drift = reconcile(dry_run=options['dry_run'])
+        for key in sorted(drift):
+            stored, actual = drift[key]
+            self.stdout.write(f"{key}: stored {stored}, actual {actual}")
+        verb = "found" if options['dry_run'] else "fixed"
+        self.stdout.write(f"{len(drift)} counter(s) {verb}")
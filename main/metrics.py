@@ -0,0 +1,183 @@
+"""
+Per-request instrumentation (opt-in with REQUEST_METRICS_ENABLED).
+
+RequestMetricsMiddleware records, per view: request count and latency,
+number of SQL queries and time spent in them, template render time and
+response size. Totals are kept in process memory and exposed in the
+Prometheus text format by metrics_text(). A request that runs the same SQL
+statement REQUEST_METRICS_N_PLUS_ONE_THRESHOLD times or more is counted and
+logged as a likely N+1.
+
+Cost per request is a few perf_counter() calls per query plus a dict
+update, so it is cheap enough to leave on.
+"""
+import functools
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.template.backends.django import Template as DjangoTemplate
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('wellconx_request_stats', default=None)
+_install_lock = threading.Lock()
+_template_timer_installed = False
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'template_time', 'statements')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def repeated_statement(self, threshold):
+        """The most repeated SQL statement if it ran `threshold`+ times (params are separate, so this groups N+1s)."""
+        if not self.statements:
+            return None
+        sql, count = self.statements.most_common(1)[0]
+        return (sql, count) if count >= threshold else None
+
+
+class MetricsRegistry:
+    FIELDS = ('requests', 'seconds', 'queries', 'db_seconds', 'template_seconds', 'response_bytes', 'n_plus_one')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = defaultdict(lambda: dict.fromkeys(self.FIELDS, 0))
+
+    def observe(self, view, seconds, stats, response_bytes, n_plus_one):
+        with self._lock:
+            row = self._views[view]
+            row['requests'] += 1
+            row['seconds'] += seconds
+            row['queries'] += stats.queries
+            row['db_seconds'] += stats.db_time
+            row['template_seconds'] += stats.template_time
+            row['response_bytes'] += response_bytes
+            row['n_plus_one'] += 1 if n_plus_one else 0
+
+    def snapshot(self):
+        with self._lock:
+            return {view: dict(row) for view, row in self._views.items()}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+registry = MetricsRegistry()
+
+_METRICS = [
+    ('wellconx_requests_total', 'counter', 'requests', 'Requests handled.'),
+    ('wellconx_request_seconds_total', 'counter', 'seconds', 'Wall-clock time spent handling requests.'),
+    ('wellconx_db_queries_total', 'counter', 'queries', 'SQL queries executed.'),
+    ('wellconx_db_seconds_total', 'counter', 'db_seconds', 'Time spent executing SQL.'),
+    ('wellconx_template_seconds_total', 'counter', 'template_seconds', 'Time spent rendering templates.'),
+    ('wellconx_response_bytes_total', 'counter', 'response_bytes', 'Response body bytes (non-streaming responses).'),
+    ('wellconx_n_plus_one_requests_total', 'counter', 'n_plus_one', 'Requests that repeated one SQL statement past the N+1 threshold.'),
+]
+
+
+def metrics_text():
+    """Prometheus text exposition of the per-view totals and cache counters."""
+    from .snapshots import counters as snapshot_counters
+
+    views = registry.snapshot()
+    lines = []
+    for name, kind, field, help_text in _METRICS:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for view in sorted(views):
+            value = views[view][field]
+            lines.append(f'{name}{{view="{view}"}} {value:.6f}' if isinstance(value, float)
+                         else f'{name}{{view="{view}"}} {value}')
+
+    lines.append('# HELP wellconx_cache_requests_total Patient snapshot cache lookups.')
+    lines.append('# TYPE wellconx_cache_requests_total counter')
+    lines.append(f'wellconx_cache_requests_total{{cache="patient_snapshot",result="hit"}} {snapshot_counters.hits}')
+    lines.append(f'wellconx_cache_requests_total{{cache="patient_snapshot",result="miss"}} {snapshot_counters.misses}')
+    return '\n'.join(lines) + '\n'
+
+
+def _install_template_timer():
+    """
+    Time the backend-level Template.render(), which render() and
+    render_to_string() call once per page ({% include %} does not go
+    through it, so nested templates are not double counted).
+    """
+    global _template_timer_installed
+    with _install_lock:
+        if _template_timer_installed:
+            return
+        original = DjangoTemplate.render
+
+        @functools.wraps(original)
+        def timed_render(self, context=None, request=None):
+            stats = _current.get()
+            if stats is None:
+                return original(self, context, request)
+            start = time.perf_counter()
+            try:
+                return original(self, context, request)
+            finally:
+                stats.template_time += time.perf_counter() - start
+
+        DjangoTemplate.render = timed_render
+        _template_timer_installed = True
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.server_timing = settings.REQUEST_METRICS_SERVER_TIMING
+        self.n_plus_one_threshold = settings.REQUEST_METRICS_N_PLUS_ONE_THRESHOLD
+        _install_template_timer()
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(stats):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        elapsed = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        size = 0 if response.streaming else len(response.content)
+        repeated = stats.repeated_statement(self.n_plus_one_threshold)
+        if repeated:
+            sql, count = repeated
+            logger.warning("Possible N+1 in %s: statement ran %d times: %s", view, count, sql)
+        registry.observe(view, elapsed, stats, size, repeated)
+
+        if self.server_timing:
+            response['Server-Timing'] = (
+                f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries", '
+                f'tpl;dur={stats.template_time * 1000:.1f}, '
+                f'total;dur={elapsed * 1000:.1f}'
+            )
+        return response
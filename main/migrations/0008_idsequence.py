@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:06
+
+from django.db import migrations, models
+
+
+def seed_patient_sequence(apps, schema_editor):
+    # Continue numbering after the highest existing POxxxxx id
+    Patient = apps.get_model('main', 'Patient')
+    IdSequence = apps.get_model('main', 'IdSequence')
+    last_value = 0
+    for patient_id in Patient.objects.values_list('patient_id', flat=True).iterator():
+        digits = (patient_id or '').replace('PO', '')
+        if digits.isdigit():
+            last_value = max(last_value, int(digits))
+    IdSequence.objects.update_or_create(name='patient_id', defaults={'last_value': last_value})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_dischargesummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_patient_sequence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations
+
+# The index as main.search defined it for this migration, copied so later changes
+# there do not change what it creates
+CREATE_PATIENT_INDEX = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS main_patient_fts USING fts5("
+    "name, patient_id, contact_number, content='main_patient', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS main_patient_fts_ai AFTER INSERT ON main_patient BEGIN "
+    "INSERT INTO main_patient_fts(rowid, name, patient_id, contact_number) "
+    "VALUES (new.id, new.name, new.patient_id, new.contact_number); END",
+    "CREATE TRIGGER IF NOT EXISTS main_patient_fts_ad AFTER DELETE ON main_patient BEGIN "
+    "INSERT INTO main_patient_fts(main_patient_fts, rowid, name, patient_id, contact_number) "
+    "VALUES ('delete', old.id, old.name, old.patient_id, old.contact_number); END",
+    "CREATE TRIGGER IF NOT EXISTS main_patient_fts_au AFTER UPDATE ON main_patient BEGIN "
+    "INSERT INTO main_patient_fts(main_patient_fts, rowid, name, patient_id, contact_number) "
+    "VALUES ('delete', old.id, old.name, old.patient_id, old.contact_number); "
+    "INSERT INTO main_patient_fts(rowid, name, patient_id, contact_number) "
+    "VALUES (new.id, new.name, new.patient_id, new.contact_number); END",
+    "INSERT INTO main_patient_fts(main_patient_fts) VALUES ('rebuild')",
+]
+
+DROP_PATIENT_INDEX = [
+    "DROP TRIGGER IF EXISTS main_patient_fts_ai",
+    "DROP TRIGGER IF EXISTS main_patient_fts_ad",
+    "DROP TRIGGER IF EXISTS main_patient_fts_au",
+    "DROP TABLE IF EXISTS main_patient_fts",
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        with schema_editor.connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_idsequence'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(CREATE_PATIENT_INDEX), run_on_sqlite(DROP_PATIENT_INDEX)),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_patient_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dischargesummary',
+            index=models.Index(fields=['discharge_date', 'id'], name='discharge_date_id_idx'),
+        ),
+    ]
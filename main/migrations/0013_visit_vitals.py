@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:19
+
+import re
+
+from django.db import migrations, models
+
+BACKFILL_BATCH_SIZE = 2000
+
+# main.vitals' parsers as of this migration, copied so later changes there do not
+# change what it backfills
+BP_RE = re.compile(r'(\d{2,3})\s*/\s*(\d{2,3})')
+SPO2_RE = re.compile(r'(\d{2,3}(?:\.\d+)?)')
+
+
+def parse_bp(text):
+    match = BP_RE.search(text or '')
+    if not match:
+        return None, None
+    systolic, diastolic = int(match.group(1)), int(match.group(2))
+    if not (50 <= systolic <= 300 and 20 <= diastolic <= 200):
+        return None, None
+    return systolic, diastolic
+
+
+def parse_spo2(text):
+    match = SPO2_RE.search(text or '')
+    if not match:
+        return None
+    value = float(match.group(1))
+    return value if 50.0 <= value <= 100.0 else None
+
+
+def backfill_vitals(apps, schema_editor):
+    # Walk visits in id order a batch at a time so memory stays flat on large tables
+    Visit = apps.get_model('main', 'Visit')
+    last_id = 0
+    while True:
+        batch = list(Visit.objects.filter(id__gt=last_id).order_by('id')
+                     .only('id', 'bp', 'oxygen_level')[:BACKFILL_BATCH_SIZE])
+        if not batch:
+            break
+        for visit in batch:
+            visit.systolic, visit.diastolic = parse_bp(visit.bp)
+            visit.spo2 = parse_spo2(visit.oxygen_level)
+        Visit.objects.bulk_update(batch, ['systolic', 'diastolic', 'spo2'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_visit_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visit',
+            name='diastolic',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='visit',
+            name='spo2',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='visit',
+            name='systolic',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['date'], name='visit_date_idx'),
+        ),
+        migrations.RunPython(backfill_vitals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:24
+
+from django.db import migrations, models
+from django.db.models import Count
+
+# (model, field, key prefix); mirrors main.stats.TRACKERS
+COUNTED = [
+    ('AppUser', 'role', 'users.role'),
+    ('Patient', 'status', 'patients.status'),
+    ('Visit', 'date', 'visits.day'),
+    ('DischargeSummary', 'discharge_type', 'discharges.type'),
+]
+
+
+def seed_dashboard_stats(apps, schema_editor):
+    DashboardStat = apps.get_model('main', 'DashboardStat')
+    stats = []
+    for model_name, field, prefix in COUNTED:
+        rows = apps.get_model('main', model_name).objects.values(field).annotate(n=Count('pk')).order_by()
+        total = 0
+        for row in rows:
+            total += row['n']
+            stats.append(DashboardStat(key=f'{prefix}.{row[field]}', value=row['n']))
+        stats.append(DashboardStat(key=f"{prefix.split('.')[0]}.total", value=total))
+    DashboardStat.objects.bulk_create(stats)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_visit_vitals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_dashboard_stats, migrations.RunPython.noop),
+    ]
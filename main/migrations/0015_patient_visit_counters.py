@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:27
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def backfill_visit_counters(apps, schema_editor):
+    # One correlated UPDATE per block of patient ids keeps each statement short
+    Patient = apps.get_model('main', 'Patient')
+    Visit = apps.get_model('main', 'Visit')
+    visits = Visit.objects.filter(patient=OuterRef('pk')).order_by().values('patient')
+    last_id = Patient.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    for start in range(0, last_id, BACKFILL_BATCH_SIZE):
+        Patient.objects.filter(id__gt=start, id__lte=start + BACKFILL_BATCH_SIZE).update(
+            visit_count=Coalesce(Subquery(visits.annotate(n=Count('id')).values('n')), 0),
+            last_visit_date=Subquery(visits.annotate(last=Max('date')).values('last')),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_dashboardstat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='last_visit_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='visit_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['last_visit_date', 'id'], name='patient_last_visit_idx'),
+        ),
+        migrations.RunPython(backfill_visit_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_patient_visit_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appuser',
+            name='password',
+            field=models.CharField(max_length=128),
+        ),
+    ]
@@ -0,0 +1,81 @@
+from django.db import migrations
+
+# The indexes as main.search defined them for this migration, copied so later
+# changes there do not change what it creates
+DISCHARGE_COLUMNS = 'final_diagnosis, procedures_done, hospital_course'
+DISCHARGE_NEW = 'new.id, new.final_diagnosis, new.procedures_done, new.hospital_course'
+DISCHARGE_OLD = 'old.id, old.final_diagnosis, old.procedures_done, old.hospital_course'
+PATIENT_COLUMNS = 'name, patient_id, contact_number'
+PATIENT_NEW = 'new.id, new.name, new.patient_id, new.contact_number'
+PATIENT_OLD = 'old.id, old.name, old.patient_id, old.contact_number'
+
+CREATE_CLINICAL_INDEXES = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS main_dischargesummary_fts USING fts5("
+    f"{DISCHARGE_COLUMNS}, content='main_dischargesummary', content_rowid='id', "
+    "tokenize='porter unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS main_dischargesummary_fts_ai AFTER INSERT ON main_dischargesummary BEGIN "
+    f"INSERT INTO main_dischargesummary_fts(rowid, {DISCHARGE_COLUMNS}) VALUES ({DISCHARGE_NEW}); END",
+    "CREATE TRIGGER IF NOT EXISTS main_dischargesummary_fts_ad AFTER DELETE ON main_dischargesummary BEGIN "
+    f"INSERT INTO main_dischargesummary_fts(main_dischargesummary_fts, rowid, {DISCHARGE_COLUMNS}) "
+    f"VALUES ('delete', {DISCHARGE_OLD}); END",
+    f"CREATE TRIGGER IF NOT EXISTS main_dischargesummary_fts_au AFTER UPDATE OF {DISCHARGE_COLUMNS} "
+    "ON main_dischargesummary BEGIN "
+    f"INSERT INTO main_dischargesummary_fts(main_dischargesummary_fts, rowid, {DISCHARGE_COLUMNS}) "
+    f"VALUES ('delete', {DISCHARGE_OLD}); "
+    f"INSERT INTO main_dischargesummary_fts(rowid, {DISCHARGE_COLUMNS}) VALUES ({DISCHARGE_NEW}); END",
+    "INSERT INTO main_dischargesummary_fts(main_dischargesummary_fts) VALUES ('rebuild')",
+
+    "CREATE VIRTUAL TABLE IF NOT EXISTS main_visit_fts USING fts5("
+    "notes, content='main_visit', content_rowid='id', tokenize='porter unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS main_visit_fts_ai AFTER INSERT ON main_visit BEGIN "
+    "INSERT INTO main_visit_fts(rowid, notes) VALUES (new.id, new.notes); END",
+    "CREATE TRIGGER IF NOT EXISTS main_visit_fts_ad AFTER DELETE ON main_visit BEGIN "
+    "INSERT INTO main_visit_fts(main_visit_fts, rowid, notes) VALUES ('delete', old.id, old.notes); END",
+    "CREATE TRIGGER IF NOT EXISTS main_visit_fts_au AFTER UPDATE OF notes ON main_visit BEGIN "
+    "INSERT INTO main_visit_fts(main_visit_fts, rowid, notes) VALUES ('delete', old.id, old.notes); "
+    "INSERT INTO main_visit_fts(rowid, notes) VALUES (new.id, new.notes); END",
+    "INSERT INTO main_visit_fts(main_visit_fts) VALUES ('rebuild')",
+
+    # The patient trigger fired on every UPDATE, including the visit counters
+    # bumped on each new visit; recreate it as UPDATE OF the indexed columns.
+    "DROP TRIGGER IF EXISTS main_patient_fts_au",
+    "CREATE TRIGGER IF NOT EXISTS main_patient_fts_ai AFTER INSERT ON main_patient BEGIN "
+    f"INSERT INTO main_patient_fts(rowid, {PATIENT_COLUMNS}) VALUES ({PATIENT_NEW}); END",
+    "CREATE TRIGGER IF NOT EXISTS main_patient_fts_ad AFTER DELETE ON main_patient BEGIN "
+    f"INSERT INTO main_patient_fts(main_patient_fts, rowid, {PATIENT_COLUMNS}) VALUES ('delete', {PATIENT_OLD}); END",
+    f"CREATE TRIGGER IF NOT EXISTS main_patient_fts_au AFTER UPDATE OF {PATIENT_COLUMNS} ON main_patient BEGIN "
+    f"INSERT INTO main_patient_fts(main_patient_fts, rowid, {PATIENT_COLUMNS}) VALUES ('delete', {PATIENT_OLD}); "
+    f"INSERT INTO main_patient_fts(rowid, {PATIENT_COLUMNS}) VALUES ({PATIENT_NEW}); END",
+]
+
+REMOVE_CLINICAL_INDEXES = [
+    "DROP TRIGGER IF EXISTS main_visit_fts_ai",
+    "DROP TRIGGER IF EXISTS main_visit_fts_ad",
+    "DROP TRIGGER IF EXISTS main_visit_fts_au",
+    "DROP TABLE IF EXISTS main_visit_fts",
+    "DROP TRIGGER IF EXISTS main_dischargesummary_fts_ai",
+    "DROP TRIGGER IF EXISTS main_dischargesummary_fts_ad",
+    "DROP TRIGGER IF EXISTS main_dischargesummary_fts_au",
+    "DROP TABLE IF EXISTS main_dischargesummary_fts",
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        with schema_editor.connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_appuser_password_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(CREATE_CLINICAL_INDEXES), run_on_sqlite(REMOVE_CLINICAL_INDEXES)),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_clinical_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.UUIDField(editable=False, unique=True)),
+                ('timestamp', models.DateTimeField()),
+                ('actor', models.CharField(blank=True, max_length=64)),
+                ('actor_role', models.CharField(blank=True, max_length=10)),
+                ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete')], max_length=10)),
+                ('model', models.CharField(max_length=50)),
+                ('object_id', models.BigIntegerField()),
+                ('patient_pk', models.BigIntegerField(null=True)),
+                ('changes', models.JSONField(default=dict)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient_pk', 'timestamp', 'id'], name='audit_patient_time_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations
+
+# (name, table, indexed expression) for main.search's PostgreSQL fallback. icontains
+# compiles to UPPER(column::text) LIKE UPPER('%word%') and startswith to
+# column::text LIKE 'word%'; an index is only used when its expression is the same.
+TRIGRAM_INDEXES = [
+    ('main_patient_name_trgm', 'main_patient', 'UPPER(name::text)'),
+    ('main_patient_patient_id_trgm', 'main_patient', 'UPPER(patient_id::text)'),
+    ('main_patient_contact_number_trgm', 'main_patient', 'contact_number::text'),
+    ('main_dischargesummary_final_diagnosis_trgm', 'main_dischargesummary', 'UPPER(final_diagnosis::text)'),
+    ('main_dischargesummary_procedures_done_trgm', 'main_dischargesummary', 'UPPER(procedures_done::text)'),
+    ('main_dischargesummary_hospital_course_trgm', 'main_dischargesummary', 'UPPER(hospital_course::text)'),
+    ('main_visit_notes_trgm', 'main_visit', 'UPPER(notes::text)'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # Needs a role allowed to CREATE EXTENSION pg_trgm (or the extension already installed)
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for name, table, expression in TRIGRAM_INDEXES:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (({expression}) gin_trgm_ops)")
+
+
+def remove_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for name, _, _ in TRIGRAM_INDEXES:
+            cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_auditentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, remove_trigram_indexes),
+    ]
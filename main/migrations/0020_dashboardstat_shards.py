@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0019_postgres_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dashboardstat',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='dashboardstat',
+            name='key',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AddConstraint(
+            model_name='dashboardstat',
+            constraint=models.UniqueConstraint(fields=('key', 'shard'), name='dashboardstat_key_shard_uniq'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def set_journal_mode(mode):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'sqlite':
+            with schema_editor.connection.cursor() as cursor:
+                cursor.execute(f'PRAGMA journal_mode={mode}')
+    return run
+
+
+class Migration(migrations.Migration):
+    # The journal mode is stored in the database file, so it is set once here rather than
+    # on every connection, and SQLite refuses to change it inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('main', '0020_dashboardstat_shards'),
+    ]
+
+    operations = [
+        migrations.RunPython(set_journal_mode('WAL'), set_journal_mode('DELETE')),
+    ]
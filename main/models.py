@@ -1,6 +1,10 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Max, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
 import uuid
 
+from .vitals import parse_bp, parse_spo2
+
 # -------------------
 # User Roles
 # -------------------
@@ -14,74 +18,84 @@ class AppUser(models.Model):
     unique_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     username = models.CharField(max_length=100)
     usermail = models.EmailField(unique=True)
-    password = models.CharField(max_length=100)
+    password = models.CharField(max_length=128)
     role = models.CharField(max_length=10, choices=ROLE_CHOICES)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['role'], name='appuser_role_idx'),
+        ]
+
     def __str__(self):
         return f"{self.username} ({self.role})"
 
 
 # -------------------
-# Patient Model
+# ID Sequences
 # -------------------
-class Patient(models.Model):
-    STATUS_CHOICES = [
-        ('Active', 'Active'),
-        ('Follow-up', 'Follow-up'),
-        ('Chronic', 'Chronic'),
-    ]
-
-    GENDER_CHOICES = [
-        ('Male', 'Male'),
-        ('Female', 'Female'),
-        ('Other', 'Other'),
-    ]
-
-    name = models.CharField(max_length=100)
-    patient_id = models.CharField(max_length=10, unique=True, blank=True)
-    age = models.IntegerField()
-    gender = models.CharField(max_length=10, choices=GENDER_CHOICES)
-    contact_number = models.CharField(max_length=15)
-    email = models.EmailField(blank=True, null=True)
-    address = models.TextField(blank=True, null=True)
-    medical_history = models.TextField(blank=True, null=True)
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
-
-    def save(self, *args, **kwargs):
-        if not self.patient_id:
-            last_patient = Patient.objects.order_by('-id').first()
-            if last_patient and last_patient.patient_id:
-                last_id = int(last_patient.patient_id.replace('PO', ''))
-            else:
-                last_id = 0
-            new_id = last_id + 1
-            self.patient_id = f'PO{new_id:05d}'
-        super().save(*args, **kwargs)
+class IdSequence(models.Model):
+    """
+    Named counters for human-readable IDs (e.g. patient_id).
+    Values are handed out with a single atomic UPDATE, so concurrent
+    requests never see the same number.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_value = models.BigIntegerField(default=0)
 
     def __str__(self):
-        return self.name
+        return f"{self.name}: {self.last_value}"
+
+    @classmethod
+    def reserve(cls, name, count=1):
+        """
+        Reserve `count` consecutive values and return them as a range.
+        Bulk callers reserve a whole block in one round trip.
+        """
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        cls.objects.get_or_create(name=name)
+        with transaction.atomic():
+            # The UPDATE takes the row (Postgres) / database (SQLite) write
+            # lock before reading, so the value we read back is ours alone.
+            cls.objects.filter(name=name).update(last_value=F('last_value') + count)
+            last = cls.objects.filter(name=name).values_list('last_value', flat=True).get()
+        return range(last - count + 1, last + 1)
+
+    @classmethod
+    def peek(cls, name):
+        """Next value that would be handed out, without reserving it (display only)."""
+        last = cls.objects.filter(name=name).values_list('last_value', flat=True).first()
+        return (last or 0) + 1
+
+
+PATIENT_ID_SEQUENCE = 'patient_id'
 
-from django.db import models
-import uuid
 
 # -------------------
-# User Roles
+# Dashboard Statistics
 # -------------------
-ROLE_CHOICES = [
-    ('doctor', 'Doctor'),
-    ('nurse', 'Nurse'),
-    ('admin', 'Admin'),
-]
-
-class AppUser(models.Model):
-    unique_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
-    username = models.CharField(max_length=100)
-    usermail = models.EmailField(unique=True)
-    password = models.CharField(max_length=100)
-    role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+class DashboardStat(models.Model):
+    """
+    One shard of a materialized counter (e.g. 'patients.status.Active'); the
+    counter is the sum of its shards. Kept current by the signal handlers in
+    main.signals; see main.stats.
+    """
+    key = models.CharField(max_length=100)
+    shard = models.PositiveSmallIntegerField(default=0)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'shard'], name='dashboardstat_key_shard_uniq'),
+        ]
 
     def __str__(self):
-        return f"{self.username} ({self.role})"
+        return f"{self.key}[{self.shard}]: {self.value}"
+
+
+def format_patient_id(number):
+    # Zero-padded to 5 digits, widens naturally past PO99999 (max_length allows 8 digits)
+    return f'PO{number:05d}'
 
 
 # -------------------
@@ -110,20 +124,50 @@ class Patient(models.Model):
     medical_history = models.TextField(blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES)
 
+    # Denormalized from Visit, kept current by main.signals (rebuild_visit_stats repairs them)
+    last_visit_date = models.DateField(null=True, blank=True, editable=False)
+    visit_count = models.PositiveIntegerField(default=0, editable=False)
+
     def save(self, *args, **kwargs):
         if not self.patient_id:
-            last_patient = Patient.objects.order_by('-id').first()
-            if last_patient and last_patient.patient_id:
-                last_id = int(last_patient.patient_id.replace('PO', ''))
-            else:
-                last_id = 0
-            new_id = last_id + 1
-            self.patient_id = f'PO{new_id:05d}'
+            number = IdSequence.reserve(PATIENT_ID_SEQUENCE)[0]
+            self.patient_id = format_patient_id(number)
         super().save(*args, **kwargs)
 
+    class Meta:
+        indexes = [
+            # Registry filters page through (status|gender, id); name backs the A-Z search fallback
+            models.Index(fields=['status', 'id'], name='patient_status_id_idx'),
+            models.Index(fields=['gender', 'id'], name='patient_gender_id_idx'),
+            models.Index(fields=['name'], name='patient_name_idx'),
+            # "Most recently seen" registry order
+            models.Index(fields=['last_visit_date', 'id'], name='patient_last_visit_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def visit_added(cls, pk, date):
+        """Count one new visit on `date` with a single UPDATE (safe under concurrent inserts)."""
+        cls.objects.filter(pk=pk).update(
+            visit_count=F('visit_count') + 1,
+            last_visit_date=Case(
+                When(Q(last_visit_date__isnull=True) | Q(last_visit_date__lt=date), then=Value(date)),
+                default=F('last_visit_date'),
+            ),
+        )
+
+    @classmethod
+    def refresh_visit_stats(cls, pks=None):
+        """Recompute last_visit_date / visit_count from Visit for `pks` (ids or a values('pk') queryset; all if None)."""
+        visits = Visit.objects.filter(patient=OuterRef('pk')).order_by().values('patient')
+        patients = cls.objects.all() if pks is None else cls.objects.filter(pk__in=pks)
+        return patients.update(
+            visit_count=Coalesce(Subquery(visits.annotate(n=Count('id')).values('n')), 0),
+            last_visit_date=Subquery(visits.annotate(last=Max('date')).values('last')),
+        )
+
 
 # -------------------
 # Visit Model (New Visit Feature)
@@ -150,10 +194,39 @@ class Visit(models.Model):
     oxygen_level = models.CharField(max_length=10)  # Example: 98%
     weight = models.DecimalField(max_digits=5, decimal_places=2)  # Example: 72.50
     notes = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Parsed from bp / oxygen_level on save; NULL when the text is not a reading
+    systolic = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    diastolic = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    spo2 = models.FloatField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # A patient's visits newest first, with id as the tie-breaker for cursors
+            models.Index(fields=['patient', 'date', 'id'], name='visit_patient_date_idx'),
+            # Date-range scans for cohort vitals alerts
+            models.Index(fields=['date'], name='visit_date_idx'),
+        ]
 
     def __str__(self):
         return f"Visit - {self.patient.name} on {self.date}"
 
+    def parse_vitals(self):
+        """Fill the numeric vitals from the text fields (bulk_create() skips save(), so callers use this)."""
+        self.systolic, self.diastolic = parse_bp(self.bp)
+        self.spo2 = parse_spo2(self.oxygen_level)
+
+    def save(self, *args, **kwargs):
+        self.parse_vitals()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'bp', 'oxygen_level'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'systolic', 'diastolic', 'spo2'}
+        # The patient's last_visit_date / visit_count are updated by the
+        # post_save handler; keep the visit and that update in one transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 # -------------------
 # DischargeSummary (New Visit Feature)
@@ -162,6 +235,23 @@ class Visit(models.Model):
 from django.db import models
 from .models import Patient  # assuming Patient already exists
 
+class DischargeSummaryQuerySet(models.QuerySet):
+    def filter_by(self, date_from=None, date_to=None, ward=None, consultant=None, discharge_type=None):
+        """Filters shared by the summary list and exports; None means "don't filter"."""
+        qs = self
+        if date_from:
+            qs = qs.filter(discharge_date__gte=date_from)
+        if date_to:
+            qs = qs.filter(discharge_date__lte=date_to)
+        if ward:
+            qs = qs.filter(ward=ward)
+        if consultant:
+            qs = qs.filter(consultant_name=consultant)
+        if discharge_type:
+            qs = qs.filter(discharge_type=discharge_type)
+        return qs
+
+
 class DischargeSummary(models.Model):
     DISCHARGE_TYPE_CHOICES = [
         ('Planned', 'Planned'),
@@ -197,5 +287,45 @@ class DischargeSummary(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = DischargeSummaryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Newest-first list and keyset pagination on (discharge_date, id)
+            models.Index(fields=['discharge_date', 'id'], name='discharge_date_id_idx'),
+        ]
+
     def __str__(self):
         return f"Discharge Summary - {self.patient.name} ({self.discharge_date})"
+
+
+# -------------------
+# Audit Log (main.audit)
+# -------------------
+class AuditEntry(models.Model):
+    ACTION_CHOICES = [
+        ('create', 'Create'),
+        ('update', 'Update'),
+        ('delete', 'Delete'),
+    ]
+
+    # Assigned when the change is recorded; spool replays skip uuids already stored
+    uuid = models.UUIDField(unique=True, editable=False)
+    timestamp = models.DateTimeField()
+    actor = models.CharField(max_length=64, blank=True)  # AppUser.unique_id; blank outside a request
+    actor_role = models.CharField(max_length=10, blank=True)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    model = models.CharField(max_length=50)  # model_name: patient, visit, dischargesummary
+    object_id = models.BigIntegerField()
+    # Plain pk rather than a ForeignKey, so a patient's history outlives the patient
+    patient_pk = models.BigIntegerField(null=True)
+    changes = models.JSONField(default=dict)  # {field: [old, new]}
+
+    class Meta:
+        indexes = [
+            # A patient's history newest first, with id as the tie-breaker for cursors
+            models.Index(fields=['patient_pk', 'timestamp', 'id'], name='audit_patient_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.action} {self.model} {self.object_id} at {self.timestamp}"
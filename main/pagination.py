@@ -0,0 +1,126 @@
+import base64
+import json
+from collections import namedtuple
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+KeysetPage = namedtuple('KeysetPage', ['items', 'next_cursor'])
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    raw = json.dumps([None if v is None else str(v) for v in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model, fields):
+    """
+    Turn an opaque cursor back into typed values for `fields`.
+    Raises InvalidCursor for anything that was not produced by encode_cursor().
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise ValueError
+        return [model._meta.get_field(name).to_python(value) for name, value in zip(fields, values)]
+    except Exception:
+        raise InvalidCursor('Invalid cursor')
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def _after(fields, ordering, values):
+    """Q for rows that sort strictly after `values` (all non-NULL) under `ordering`."""
+    after = Q()
+    for i, name in enumerate(fields):
+        lookup = 'lt' if ordering[i].startswith('-') else 'gt'
+        step = Q(**{f'{name}__{lookup}': values[i]})
+        for prev, value in zip(fields[:i], values[:i]):
+            step &= Q(**{prev: value})
+        after |= step
+    return after
+
+
+def _segments(queryset, ordering, cursor):
+    """
+    The querysets one page is read from, in order, with the ordering fields.
+    One segment normally; two when the first field is nullable (see
+    keyset_paginate).
+    """
+    fields = [o.lstrip('-') for o in ordering]
+    values = decode_cursor(cursor, queryset.model, fields) if cursor else None
+
+    if not queryset.model._meta.get_field(fields[0]).null:
+        parts = [(queryset, ordering, fields, values)]
+    else:
+        null_values = values[1:] if values and values[0] is None else None
+        parts = [(queryset.filter(**{f'{fields[0]}__isnull': True}), ordering[1:], fields[1:], null_values)]
+        if not (values and values[0] is None):
+            parts.insert(0, (queryset.filter(**{f'{fields[0]}__isnull': False}), ordering, fields, values))
+
+    segments = []
+    for segment, segment_ordering, segment_fields, after in parts:
+        segment = segment.order_by(*segment_ordering)
+        if after:
+            segment = segment.filter(_after(segment_fields, segment_ordering, after))
+        segments.append(segment)
+    return segments, fields
+
+
+def _page(rows, fields, limit):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        if isinstance(last, dict):
+            next_cursor = encode_cursor([last[name] for name in fields])
+        else:
+            next_cursor = encode_cursor([getattr(last, name) for name in fields])
+    return KeysetPage(rows, next_cursor)
+
+
+def keyset_paginate(queryset, ordering, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Cursor (keyset) pagination.
+
+    `ordering` is a list like ['-discharge_date', '-id']; the last field must be
+    unique so every row has a distinct position. Instead of OFFSET we filter on
+    "rows after the last one we returned", so every page is an index range scan
+    no matter how deep the client has scrolled.
+
+    The first field may be nullable; its NULL rows come last in either
+    direction. They are read as a second segment (first IS NOT NULL, then IS
+    NULL) rather than with NULLS LAST, which databases cannot serve from a
+    plain index.
+    """
+    segments, fields = _segments(queryset, ordering, cursor)
+    rows = []
+    for segment in segments:
+        rows += list(segment[:limit + 1 - len(rows)])
+        if len(rows) > limit:
+            break
+    return _page(rows, fields, limit)
+
+
+async def akeyset_paginate(queryset, ordering, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """keyset_paginate() for async views, using the async ORM."""
+    segments, fields = _segments(queryset, ordering, cursor)
+    rows = []
+    for segment in segments:
+        rows += [row async for row in segment[:limit + 1 - len(rows)]]
+        if len(rows) > limit:
+            break
+    return _page(rows, fields, limit)
@@ -0,0 +1,326 @@
+"""
+Discharge summary PDF rendering and cache.
+
+PDFs are content-addressed: the file name carries a digest of every field the
+template can show plus the template source, so an edit to the summary, the
+patient's name or the template produces a new file and a stale PDF is never
+served. Cache misses are rendered by a process pool; the request that finds
+a miss only renders the HTML (cheap) and returns straight away.
+
+Nothing in this module imports models at import time, because the worker
+processes import it without setting up Django.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import urljoin, urlparse
+
+from django.conf import settings
+from django.template.loader import get_template, render_to_string
+
+PDF_TEMPLATE = 'discharge_summary_pdf.html'
+
+READY = 'ready'
+PENDING = 'pending'
+FAILED = 'failed'
+
+_executor = None
+_export_executors = {}  # workers -> pool shared by every export asking for that many
+_pending = {}  # digest -> Future of a render that is running, or that failed and is not yet reported
+_lock = threading.RLock()  # add_done_callback() runs the callback at once if the future is done
+
+
+class PdfRenderError(Exception):
+    pass
+
+
+# -------------------- Cache keys --------------------
+@lru_cache(maxsize=None)
+def template_version():
+    source = get_template(PDF_TEMPLATE).template.source
+    return hashlib.sha256(source.encode()).hexdigest()[:16]
+
+
+def summary_digest(summary):
+    fields = {f.attname: getattr(summary, f.attname) for f in summary._meta.concrete_fields}
+    fields['patient.name'] = summary.patient.name
+    payload = json.dumps([template_version(), fields], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def cache_dir():
+    return Path(settings.PDF_CACHE_DIR)
+
+
+def cache_path(summary):
+    return cache_dir() / f'{summary.pk}-{summary_digest(summary)}.pdf'
+
+
+def invalidate(summary_pk):
+    """Drop every cached PDF for a summary (called when it is saved or deleted)."""
+    for path in cache_dir().glob(f'{summary_pk}-*.pdf'):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+# -------------------- Rendering --------------------
+def render_summary_html(summary):
+    return render_to_string(PDF_TEMPLATE, {'summary': summary})
+
+
+def html_to_pdf(html, base_url):
+    from xhtml2pdf import pisa
+
+    result = BytesIO()
+    try:
+        status = pisa.CreatePDF(src=html, dest=result,
+                                link_callback=lambda uri, rel: _link_callback(uri, rel, base_url))
+    except Exception as e:
+        # xhtml2pdf raises on some CSS/markup instead of reporting it in status.err
+        raise PdfRenderError(f'{type(e).__name__}: {e}') from e
+    if status.err:
+        raise PdfRenderError(str(status.err))
+    return result.getvalue()
+
+
+def replaced_files(path):
+    """
+    Other cached PDFs of the same summary when a render of `path` is asked
+    for. Saving a summary already deletes its PDFs (invalidate()), so these
+    are older versions written by renders that were still running at the
+    time; none can be a newer version than `path`.
+    """
+    pk = path.name.split('-', 1)[0]
+    return [str(old) for old in path.parent.glob(f'{pk}-*.pdf') if old != path]
+
+
+def render_to_cache(html, base_url, path, replaces=()):
+    """
+    Render and store atomically, then delete `replaces` (replaced_files()
+    from when the render was asked for); runs inside a worker process.
+    Renders can finish out of order, so a render never deletes a file
+    written after it was asked for.
+    """
+    pdf = html_to_pdf(html, base_url)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(pdf)
+    os.replace(tmp, path)
+
+    for old in replaces:
+        try:
+            os.unlink(old)
+        except FileNotFoundError:
+            pass
+    return str(path)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.PDF_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _executor
+
+
+def _get_export_executor(workers):
+    # Concurrent exports share one pool rather than spawning `workers` processes each
+    with _lock:
+        executor = _export_executors.get(workers)
+        if executor is None:
+            executor = _export_executors[workers] = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return executor
+
+
+def _render_done(digest, future):
+    # A rendered PDF is found on disk from now on; only a failure is kept for
+    # the next request_pdf() to report (it resubmits after that)
+    if not future.cancelled() and future.exception() is None:
+        with _lock:
+            if _pending.get(digest) is future:
+                del _pending[digest]
+
+
+def request_pdf(summary, base_url):
+    """
+    Return (status, value) for a summary's PDF without blocking:
+    (READY, path), (PENDING, None) or (FAILED, error message).
+    A miss queues a render unless one is already running.
+    """
+    path = cache_path(summary)
+    if path.exists():
+        return READY, path
+
+    if not settings.PDF_RENDER_WORKERS:
+        # Inline rendering, for tests and single-process tools
+        try:
+            return READY, Path(render_to_cache(render_summary_html(summary), base_url, path, replaced_files(path)))
+        except PdfRenderError as e:
+            return FAILED, str(e)
+
+    digest = path.stem
+    with _lock:
+        future = _pending.get(digest)
+        if future is None:
+            future = _get_executor().submit(render_to_cache, render_summary_html(summary), base_url, str(path),
+                                            replaced_files(path))
+            _pending[digest] = future
+            future.add_done_callback(lambda f: _render_done(digest, f))
+        if not future.done():
+            return PENDING, None
+        _pending.pop(digest, None)
+
+    error = future.exception()
+    if error is not None:
+        return FAILED, str(error)
+    return READY, Path(future.result())
+
+
+# -------------------- Batch export --------------------
+class _ZipBuffer:
+    """Write-only sink for ZipFile; drain() hands back what was written so far."""
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def export_filename(summary):
+    return f'discharge_summary_{summary.pk}_{summary.discharge_date:%Y%m%d}.pdf'
+
+
+def iter_summary_pdfs(summaries, base_url, workers):
+    """
+    Yield (summary, pdf_bytes, error) in input order. Cached PDFs are read
+    from disk; the rest are rendered on a pool of `workers` processes shared
+    with other exports, with at most 2 * workers renders of this export in
+    flight, so memory does not grow with the batch.
+    """
+    window = max(1, workers) * 2
+    in_flight = deque()
+
+    def finished(entry):
+        summary, cached, future = entry
+        if cached is not None:
+            return summary, cached, None
+        try:
+            return summary, future.result(), None
+        except Exception as e:
+            return summary, None, str(e)
+
+    executor = _get_export_executor(workers) if workers else None
+    try:
+        for summary in summaries:
+            path = cache_path(summary)
+            if path.exists():
+                in_flight.append((summary, path.read_bytes(), None))
+            elif executor:
+                in_flight.append((summary, None, executor.submit(html_to_pdf, render_summary_html(summary), base_url)))
+            else:
+                try:
+                    in_flight.append((summary, html_to_pdf(render_summary_html(summary), base_url), None))
+                except PdfRenderError as e:
+                    yield summary, None, str(e)
+                    continue
+
+            while len(in_flight) >= window:
+                yield finished(in_flight.popleft())
+        while in_flight:
+            yield finished(in_flight.popleft())
+    finally:
+        # Abandoned part-way (client gone): drop this export's queued renders, not the shared pool
+        for _, _, future in in_flight:
+            if future is not None:
+                future.cancel()
+
+
+def stream_summaries_zip(summaries, base_url, workers, stats=None):
+    """
+    Generate a ZIP archive of summary PDFs chunk by chunk. Each PDF is
+    flushed to the caller as soon as it is added; failures are listed in
+    errors.txt at the end of the archive.
+    """
+    buffer = _ZipBuffer()
+    errors = []
+    # PDFs are already compressed; deflating them again costs CPU for nothing
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_STORED) as archive:
+        for summary, data, error in iter_summary_pdfs(summaries, base_url, workers):
+            if error:
+                errors.append(f'{summary.pk}\t{error}')
+                continue
+            archive.writestr(export_filename(summary), data)
+            if stats is not None:
+                stats['pdfs'] = stats.get('pdfs', 0) + 1
+                stats['bytes'] = stats.get('bytes', 0) + len(data)
+            yield buffer.drain()
+        if errors:
+            archive.writestr('errors.txt', '\n'.join(errors) + '\n')
+        if stats is not None:
+            stats['errors'] = len(errors)
+    yield buffer.drain()
+
+
+# helper function to map URIs used in templates to absolute filesystem or URL paths
+def _link_callback(uri, rel, base_url):
+    """
+    Convert HTML URIs (static/media) to absolute paths for xhtml2pdf.
+    - uri: URI from the HTML (like /static/css/style.css or /media/image.png or http://...)
+    - rel: relative path (unused)
+    - base_url: request.build_absolute_uri('/') => 'http://127.0.0.1:8000/'
+
+    Returns an absolute URL or absolute filesystem path xhtml2pdf can read.
+    """
+    parsed = urlparse(uri)
+    # If URI is already absolute (http/https), return as-is
+    if parsed.scheme in ('http', 'https'):
+        return uri
+
+    # If it starts with STATIC_URL or MEDIA_URL, build absolute filesystem path
+    # Adjust depending on your STATIC settings
+    if uri.startswith(settings.STATIC_URL):
+        path = os.path.join(settings.BASE_DIR, uri.lstrip('/'))
+        if os.path.exists(path):
+            return path
+        # fallback to absolute URL
+        return urljoin(base_url, uri.lstrip('/'))
+    if uri.startswith(settings.MEDIA_URL):
+        path = os.path.join(settings.MEDIA_ROOT, uri.replace(settings.MEDIA_URL, '').lstrip('/'))
+        if os.path.exists(path):
+            return path
+        return urljoin(base_url, uri.lstrip('/'))
+
+    # Default: try filesystem relative to BASE_DIR
+    path = os.path.join(settings.BASE_DIR, uri.lstrip('/'))
+    if os.path.exists(path):
+        return path
+
+    # Otherwise return absolute URL
+    return urljoin(base_url, uri.lstrip('/'))
@@ -0,0 +1,335 @@
+"""
+Full-text search indexes backed by SQLite FTS5.
+
+Each index is an external-content FTS5 table that mirrors some columns of a
+model table. Triggers on the source table keep it in sync for every write
+path (save(), bulk_create(), update(), raw SQL); an UPDATE only reindexes the
+row when it sets one of the indexed columns. On other database vendors the
+search functions fall back to plain ORM lookups (icontains / startswith). On
+PostgreSQL, pg_trgm GIN indexes (migration 0019) serve those lookups for
+words of three or more characters; shorter words, and other vendors, scan
+the table. The fallback has no ranking, stemming or snippets.
+
+Indexes: patient name/ID/phone (the patient picker), and the clinical text of
+discharge summaries and visit notes (search_clinical()). Lookups by patient ID
+prefix (lookup_patient_ids()) need no FTS index: the unique index on
+patient_id answers them as a range.
+"""
+import html
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+
+class FtsIndex:
+    def __init__(self, table, content_table, columns, weights,
+                 tokenize='unicode61 remove_diacritics 2', prefix='2 3'):
+        self.table = table
+        self.content_table = content_table
+        self.columns = columns
+        self.weights = weights
+        self.tokenize = tokenize
+        self.prefix = prefix
+
+    def _values(self, prefix):
+        return ', '.join(f'{prefix}.{c}' for c in self.columns)
+
+    def create_statements(self):
+        cols = ', '.join(self.columns)
+        prefix = f", prefix='{self.prefix}'" if self.prefix else ''
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+            f"{cols}, content='{self.content_table}', content_rowid='id', "
+            f"tokenize='{self.tokenize}'{prefix})",
+        ] + self.trigger_statements()
+
+    def trigger_statements(self):
+        # Triggers are dropped whenever a migration rebuilds the source table
+        # on SQLite, so these are re-run (idempotently) after every migrate.
+        cols = ', '.join(self.columns)
+        insert_new = f"INSERT INTO {self.table}(rowid, {cols}) VALUES (new.id, {self._values('new')});"
+        delete_old = (
+            f"INSERT INTO {self.table}({self.table}, rowid, {cols}) "
+            f"VALUES ('delete', old.id, {self._values('old')});"
+        )
+        return [
+            f"CREATE TRIGGER IF NOT EXISTS {self.table}_ai AFTER INSERT ON {self.content_table} "
+            f"BEGIN {insert_new} END",
+            f"CREATE TRIGGER IF NOT EXISTS {self.table}_ad AFTER DELETE ON {self.content_table} "
+            f"BEGIN {delete_old} END",
+            f"CREATE TRIGGER IF NOT EXISTS {self.table}_au AFTER UPDATE OF {cols} ON {self.content_table} "
+            f"BEGIN {delete_old} {insert_new} END",
+        ]
+
+    def drop_statements(self):
+        return [
+            f"DROP TRIGGER IF EXISTS {self.table}_ai",
+            f"DROP TRIGGER IF EXISTS {self.table}_ad",
+            f"DROP TRIGGER IF EXISTS {self.table}_au",
+            f"DROP TABLE IF EXISTS {self.table}",
+        ]
+
+    def rebuild_statement(self):
+        return f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')"
+
+    def bm25(self):
+        return f"bm25({self.table}, {', '.join(str(w) for w in self.weights)})"
+
+    def snippet(self, tokens=16):
+        # Control characters as highlight markers; the text is escaped before they become <mark>
+        return f"snippet({self.table}, -1, char(2), char(3), '…', {tokens})"
+
+
+PATIENT_INDEX = FtsIndex(
+    'main_patient_fts', 'main_patient',
+    columns=['name', 'patient_id', 'contact_number'],
+    weights=[10.0, 5.0, 1.0],
+)
+
+# Clinical free text: stemmed (porter), so "fractures" also finds "fractured". No prefix
+# indexes; they would roughly double the size of these much larger indexes.
+DISCHARGE_INDEX = FtsIndex(
+    'main_dischargesummary_fts', 'main_dischargesummary',
+    columns=['final_diagnosis', 'procedures_done', 'hospital_course'],
+    weights=[10.0, 5.0, 1.0],
+    tokenize='porter unicode61 remove_diacritics 2', prefix=None,
+)
+
+VISIT_NOTES_INDEX = FtsIndex(
+    'main_visit_fts', 'main_visit',
+    columns=['notes'],
+    weights=[1.0],
+    tokenize='porter unicode61 remove_diacritics 2', prefix=None,
+)
+
+SEARCH_INDEXES = [PATIENT_INDEX, DISCHARGE_INDEX, VISIT_NOTES_INDEX]
+
+MIN_RANKED_LENGTH = 3
+
+
+def fts_enabled(conn=None):
+    return (conn or connection).vendor == 'sqlite'
+
+
+def install_index(index, conn=None, rebuild=True):
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        for sql in index.create_statements():
+            cursor.execute(sql)
+        if rebuild:
+            cursor.execute(index.rebuild_statement())
+
+
+def drop_index(index, conn=None):
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        for sql in index.drop_statements():
+            cursor.execute(sql)
+
+
+def ensure_search_indexes(using='default', **kwargs):
+    """post_migrate hook: recreate any triggers a table rebuild dropped."""
+    from django.db import connections
+    conn = connections[using]
+    if not fts_enabled(conn):
+        return
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        existing = {row[0] for row in cursor.fetchall()}
+        for index in SEARCH_INDEXES:
+            if index.table not in existing or index.content_table not in existing:
+                continue
+            for sql in index.trigger_statements():
+                cursor.execute(sql)
+
+
+def fts_query(term, max_tokens=8):
+    """
+    Turn user input into an FTS5 MATCH expression: every word must match as
+    a prefix ("jo sm" finds John Smith), so results update while typing. The
+    patient index keeps prefix tables for this.
+    """
+    tokens = re.findall(r'\w+', term.lower())[:max_tokens]
+    if not tokens:
+        return None
+    return ' '.join(f'"{t}"*' for t in tokens)
+
+
+def _patient_search_plan(term, limit):
+    """
+    (queryset, None) when the ORM can answer, or (None, (sql, params)) for an
+    FTS5 query. Shared by the sync and async entry points.
+    """
+    from .models import Patient
+
+    match = fts_query(term)
+    if match is None:
+        return Patient.objects.only('id', 'name', 'age', 'gender').order_by('name')[:limit], None
+
+    if not fts_enabled():
+        return Patient.objects.filter(
+            Q(name__icontains=term) | Q(patient_id__istartswith=term) | Q(contact_number__startswith=term)
+        ).only('id', 'name', 'age', 'gender').order_by('name')[:limit], None
+
+    index = PATIENT_INDEX
+    # Ranking has to score every match; for one or two typed characters that
+    # is most of the table, so return the first matches unranked instead.
+    order_by = f"ORDER BY {index.bm25()}, p.id" if len(term.strip()) >= MIN_RANKED_LENGTH else ""
+    return None, (
+        f"SELECT p.id, p.name, p.age, p.gender "
+        f"FROM {index.table} JOIN main_patient p ON p.id = {index.table}.rowid "
+        f"WHERE {index.table} MATCH %s "
+        f"{order_by} LIMIT %s",
+        [match, limit],
+    )
+
+
+def search_patients(term, limit=20):
+    """Ranked patient matches on name, patient_id and contact_number."""
+    from .models import Patient
+
+    queryset, raw = _patient_search_plan(term, limit)
+    if queryset is not None:
+        return list(queryset)
+    return list(Patient.objects.raw(*raw))
+
+
+async def asearch_patients(term, limit=20):
+    """search_patients() for async views. Raw querysets have no async API, so FTS runs in a worker thread."""
+    from asgiref.sync import sync_to_async
+    from .models import Patient
+
+    queryset, raw = _patient_search_plan(term, limit)
+    if queryset is not None:
+        return [patient async for patient in queryset]
+    return await sync_to_async(lambda: list(Patient.objects.raw(*raw)))()
+
+
+# -------------------- Patient ID lookup --------------------
+PATIENT_ID_LOOKUP_FIELDS = ('id', 'patient_id', 'name', 'age', 'gender', 'contact_number')
+
+
+def patient_id_prefix_range(term):
+    """
+    (lower, upper) bounds for patient IDs starting with `term`, or None when
+    it has no letters or digits. IDs are stored upper-case (PO00042). A range on the unique index
+    is used instead of istartswith, whose case-insensitive LIKE SQLite cannot
+    answer from an index.
+    """
+    prefix = re.sub(r'[^0-9A-Za-z]', '', term).upper()
+    if not prefix:
+        return None
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def lookup_patient_ids(term, limit=20):
+    """
+    Queryset of the first `limit` patients, in patient_id order, whose ID
+    starts with `term`; empty, without a query, when `term` has no letters or
+    digits.
+    """
+    from .models import Patient
+
+    bounds = patient_id_prefix_range(term)
+    if bounds is None:
+        return Patient.objects.none()
+    return Patient.objects.only(*PATIENT_ID_LOOKUP_FIELDS).filter(
+        patient_id__gte=bounds[0], patient_id__lt=bounds[1]).order_by('patient_id')[:limit]
+
+
+# -------------------- Clinical text --------------------
+CLINICAL_SORTS = ('relevance', 'recent')
+
+
+def clinical_query(term, max_tokens=8):
+    """
+    FTS5 MATCH expression for a submitted clinical search: every word must
+    match as a whole word, unless the user ends it with * ("glomerulo*").
+    Unlike fts_query() there is no implicit prefix, which on these indexes
+    (no prefix tables) would cost a scan of the term list on every query.
+    """
+    tokens = re.findall(r'(\w+)(\*?)', term.lower())[:max_tokens]
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"{star}' for token, star in tokens)
+
+
+def highlight(snippet):
+    """HTML for an FTS5 snippet: text escaped, matches wrapped in <mark>."""
+    return html.escape(snippet).replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+
+def _clinical_sources():
+    from .models import DischargeSummary, Visit
+
+    return {
+        'discharge': (DISCHARGE_INDEX, DischargeSummary, 'discharge_date'),
+        'visit': (VISIT_NOTES_INDEX, Visit, 'date'),
+    }
+
+
+def _clinical_hit(kind, row):
+    pk, patient_id, patient_name, date, snippet, score = row
+    return {
+        'type': kind,
+        'id': pk,
+        'patient_id': patient_id,
+        'patient_name': patient_name,
+        'date': date.isoformat() if hasattr(date, 'isoformat') else date,
+        'snippet': highlight(snippet) if snippet is not None else None,
+        'score': round(-score, 3) if score is not None else None,  # bm25() is lower-is-better
+    }
+
+
+def search_clinical(term, kind, field=None, patient_id=None, sort='relevance', limit=20):
+    """
+    Discharge summaries (kind='discharge') or visits ('visit') whose text
+    matches every word of `term`, best match first or newest first, each with
+    a highlighted snippet. `field` restricts the match to one indexed column,
+    e.g. final_diagnosis; `patient_id` to one patient's records.
+    """
+    index, model, date_field = _clinical_sources()[kind]
+    if field is not None and field not in index.columns:
+        raise ValueError(f'field must be one of {", ".join(index.columns)}')
+    if sort not in CLINICAL_SORTS:
+        raise ValueError(f'sort must be one of {", ".join(CLINICAL_SORTS)}')
+    match = clinical_query(term)
+    if match is None:
+        return []
+
+    if not fts_enabled():
+        # Every word somewhere in the searched columns, as with MATCH (but substrings, unstemmed)
+        columns = [field] if field else index.columns
+        queryset = model.objects.all()
+        for word in re.findall(r'\w+', term)[:8]:
+            condition = Q()
+            for column in columns:
+                condition |= Q(**{f'{column}__icontains': word})
+            queryset = queryset.filter(condition)
+        if patient_id:
+            queryset = queryset.filter(patient__patient_id=patient_id)
+        rows = queryset.order_by(f'-{date_field}', '-id').values_list(
+            'id', 'patient__patient_id', 'patient__name', date_field)[:limit]
+        return [_clinical_hit(kind, (*row, None, None)) for row in rows]
+
+    if field:
+        match = f'{{{field}}} : ({match})'
+    source = model._meta.db_table
+    where, params = [f'{index.table} MATCH %s'], [match]
+    if patient_id:
+        where.append('p.patient_id = %s')
+        params.append(patient_id)
+    # Either order reads every match: bm25 scores them, newest-first sorts them by date
+    order_by = f'{index.bm25()}, d.id DESC' if sort == 'relevance' else f'd.{date_field} DESC, d.id DESC'
+    sql = (
+        f"SELECT d.id, p.patient_id, p.name, d.{date_field}, {index.snippet()}, {index.bm25()} "
+        f"FROM {index.table} "
+        f"JOIN {source} d ON d.id = {index.table}.rowid "
+        f"JOIN main_patient p ON p.id = d.patient_id "
+        f"WHERE {' AND '.join(where)} "
+        f"ORDER BY {order_by} LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [limit])
+        return [_clinical_hit(kind, row) for row in cursor.fetchall()]
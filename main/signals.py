@@ -0,0 +1,173 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import audit, fragments, pdf, snapshots, stats
+from .models import DischargeSummary, Patient, Visit
+
+
+AUDITED_MODELS = (Patient, Visit, DischargeSummary)
+VISIT_PLACEMENT_FIELDS = {'patient', 'patient_id', 'date'}
+
+
+# -------------------- Stored row --------------------
+# The visit counter, dashboard stats and audit handlers below each compare a
+# save with the row as stored. This runs first and reads the union of the
+# columns they need in one primary-key lookup, into instance._stored_row.
+def _touches(fields, update_fields):
+    return update_fields is None or bool(set(fields) & set(update_fields))
+
+
+def stored_columns(sender, instance, update_fields=None):
+    columns = set()
+    tracker = stats.TRACKERS.get(sender)
+    if tracker is not None and _touches(tracker.fields, update_fields):
+        columns.update(tracker.fields)
+    if sender is Visit and _touches(VISIT_PLACEMENT_FIELDS, update_fields):
+        columns.update(('patient_id', 'date'))
+    if sender in AUDITED_MODELS and audit.enabled():
+        columns.update(audit.stored_columns(instance, update_fields))
+    return columns
+
+
+def load_stored_row(sender, instance, update_fields=None, **kwargs):
+    instance._stored_row = None
+    if instance._state.adding:
+        return
+    columns = stored_columns(sender, instance, update_fields)
+    if columns:
+        instance._stored_row = sender._base_manager.filter(pk=instance.pk).values(*columns).first()
+
+
+for model in dict.fromkeys([*stats.TRACKERS, *AUDITED_MODELS]):
+    pre_save.connect(load_stored_row, sender=model, dispatch_uid=f'stored_row_pre_save_{model.__name__}')
+
+
+# -------------------- Discharge Summary PDF cache --------------------
+@receiver([post_save, post_delete], sender=DischargeSummary)
+def invalidate_discharge_pdf(sender, instance, **kwargs):
+    pdf.invalidate(instance.pk)
+
+
+# -------------------- Patient snapshot cache --------------------
+@receiver([post_save, post_delete], sender=Patient)
+def invalidate_patient_snapshot(sender, instance, **kwargs):
+    snapshots.invalidate(instance.patient_id)
+    # A reader may re-cache the old row before this transaction commits
+    transaction.on_commit(lambda: snapshots.invalidate(instance.patient_id))
+
+
+# -------------------- Rendered patient fragments --------------------
+@receiver([post_save, post_delete], sender=Patient)
+def invalidate_patient_fragments(sender, instance, **kwargs):
+    fragments.invalidate_patient(instance.pk)
+    transaction.on_commit(lambda: fragments.invalidate_patient(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=Visit)
+def invalidate_visit_fragments(sender, instance, **kwargs):
+    # Cards show the visit count and last visit; the history lists the visits
+    old = getattr(instance, '_old_placement', None)
+    pks = {instance.patient_id} | ({old[0]} if old else set())
+    fragments.invalidate_patient(*pks)
+    transaction.on_commit(lambda: fragments.invalidate_patient(*pks))
+
+
+# -------------------- Patient visit counters --------------------
+@receiver(pre_save, sender=Visit)
+def capture_old_visit_placement(sender, instance, update_fields=None, **kwargs):
+    instance._old_placement = None
+    if update_fields is not None and not VISIT_PLACEMENT_FIELDS & set(update_fields):
+        instance._old_placement = (instance.patient_id, instance.date)  # neither can change
+    elif instance._stored_row is not None:
+        instance._old_placement = (instance._stored_row['patient_id'], instance._stored_row['date'])
+
+
+@receiver(post_save, sender=Visit)
+def update_patient_visit_counters(sender, instance, created, **kwargs):
+    date = Visit._meta.get_field('date').to_python(instance.date)
+    if created:
+        Patient.visit_added(instance.patient_id, date)
+        return
+    old = instance._old_placement
+    if old != (instance.patient_id, date):
+        Patient.refresh_visit_stats({instance.patient_id} | ({old[0]} if old else set()))
+
+
+@receiver(post_delete, sender=Visit)
+def refresh_patient_visit_counters(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Patient) and origin.pk == instance.patient_id:
+        return  # the patient is being deleted along with its visits
+    Patient.refresh_visit_stats([instance.patient_id])
+
+
+# -------------------- Dashboard statistics --------------------
+def capture_old_stat_keys(sender, instance, update_fields=None, **kwargs):
+    tracker = stats.TRACKERS[sender]
+    if instance._state.adding:
+        instance._stat_old_keys = []
+    elif update_fields is not None and not set(tracker.fields) & set(update_fields):
+        instance._stat_old_keys = None  # counted fields untouched
+    else:
+        row = instance._stored_row
+        instance._stat_old_keys = stats.stored_keys(instance, row) if row is not None else []
+
+
+def update_stats_on_save(sender, instance, **kwargs):
+    old = getattr(instance, '_stat_old_keys', None)
+    if old is None:
+        return
+    tracker = stats.TRACKERS[sender]
+    new = tracker.keys(instance) if tracker.loaded(instance) else stats.stored_keys(instance)
+    deltas = Counter(new)
+    deltas.subtract(old)
+    stats.bump(deltas)
+
+
+def capture_deleted_stat_keys(sender, instance, origin=None, **kwargs):
+    tracker = stats.TRACKERS[sender]
+    if origin is not instance and tracker.loaded(instance):
+        # Rows reached by a cascade were just loaded by the deletion collector
+        instance._stat_old_keys = tracker.keys(instance)
+    else:
+        instance._stat_old_keys = stats.stored_keys(instance)
+
+
+def update_stats_on_delete(sender, instance, **kwargs):
+    stats.bump(Counter({key: -1 for key in instance._stat_old_keys}))
+
+
+for model in stats.TRACKERS:
+    pre_save.connect(capture_old_stat_keys, sender=model, dispatch_uid=f'stats_pre_save_{model.__name__}')
+    post_save.connect(update_stats_on_save, sender=model, dispatch_uid=f'stats_post_save_{model.__name__}')
+    pre_delete.connect(capture_deleted_stat_keys, sender=model, dispatch_uid=f'stats_pre_delete_{model.__name__}')
+    post_delete.connect(update_stats_on_delete, sender=model, dispatch_uid=f'stats_post_delete_{model.__name__}')
+
+
+# -------------------- Audit log --------------------
+def capture_audit_before(sender, instance, update_fields=None, **kwargs):
+    instance._audit_before = None
+    if audit.enabled() and not instance._state.adding:
+        instance._audit_before = audit.stored_values(instance, instance._stored_row, update_fields)
+
+
+def record_audit_save(sender, instance, created, update_fields=None, **kwargs):
+    if not audit.enabled():
+        return
+    entry = audit.save_entry(instance, created, getattr(instance, '_audit_before', None), update_fields)
+    if entry is not None:
+        transaction.on_commit(lambda: audit.record(entry))
+
+
+def record_audit_delete(sender, instance, **kwargs):
+    if audit.enabled():
+        entry = audit.delete_entry(instance)
+        transaction.on_commit(lambda: audit.record(entry))
+
+
+for model in AUDITED_MODELS:
+    pre_save.connect(capture_audit_before, sender=model)
+    post_save.connect(record_audit_save, sender=model)
+    post_delete.connect(record_audit_delete, sender=model)
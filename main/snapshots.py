@@ -0,0 +1,162 @@
+"""
+Read-through cache of patient snapshots for the lookup APIs.
+
+A snapshot is a small dict of the patient columns the lookup endpoints
+return, cached under the patient_id with a TTL (PATIENT_CACHE_TTL) in
+Django's cache framework, so the backend is whatever CACHES configures
+(per-process memory, files, Redis). Patient saves and deletes drop the entry
+through signals; the TTL bounds staleness from writes that skip signals.
+Unknown ids are cached too, so repeated lookups of a bad id stay cheap.
+
+get_patients() resolves many ids with one cache round trip and at most one
+database query for the misses. get_profiles() adds each patient's last visit
+date and visit count in one primary-key lookup; those change with every
+visit, so they are read fresh rather than cached.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+SNAPSHOT_FIELDS = ('id', 'patient_id', 'name', 'age', 'gender', 'status', 'contact_number')
+KEY_PREFIX = 'patient-snapshot:v2:'
+_MISSING = '__missing__'
+
+
+class CacheCounters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hits=0, misses=0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+counters = CacheCounters()
+
+
+def _cache():
+    return caches[settings.PATIENT_CACHE_ALIAS]
+
+
+def cache_key(patient_id):
+    return f'{KEY_PREFIX}{patient_id}'
+
+
+def primary_condition(medical_history):
+    """First non-blank line of the free-text medical history."""
+    for line in (medical_history or '').splitlines():
+        if line.strip():
+            return line.strip()
+    return None
+
+
+def _snapshot_query(patient_ids):
+    from .models import Patient
+
+    return Patient.objects.filter(patient_id__in=patient_ids).values(*SNAPSHOT_FIELDS, 'medical_history')
+
+
+def _snapshot(row):
+    row['primary_condition'] = primary_condition(row.pop('medical_history'))
+    return row
+
+
+def _split(patient_ids, cached):
+    """Sort cache results into found snapshots and ids still to load."""
+    found, missed = {}, []
+    for pid in patient_ids:
+        value = cached.get(cache_key(pid))
+        if value is None:
+            missed.append(pid)
+        elif value != _MISSING:
+            found[pid] = value
+    counters.record(hits=len(patient_ids) - len(missed), misses=len(missed))
+    return found, missed
+
+
+def get_patients(patient_ids):
+    """{patient_id: snapshot} for the ids that exist; unknown ids are left out."""
+    patient_ids = list(dict.fromkeys(patient_ids))
+    if not patient_ids:
+        return {}
+    cache = _cache()
+    found, missed = _split(patient_ids, cache.get_many([cache_key(pid) for pid in patient_ids]))
+    if missed:
+        loaded = {row['patient_id']: _snapshot(row) for row in _snapshot_query(missed)}
+        cache.set_many({cache_key(pid): loaded.get(pid, _MISSING) for pid in missed},
+                       timeout=settings.PATIENT_CACHE_TTL)
+        found.update(loaded)
+    return found
+
+
+async def aget_patients(patient_ids):
+    """get_patients() for async views."""
+    patient_ids = list(dict.fromkeys(patient_ids))
+    if not patient_ids:
+        return {}
+    cache = _cache()
+    found, missed = _split(patient_ids, await cache.aget_many([cache_key(pid) for pid in patient_ids]))
+    if missed:
+        loaded = {row['patient_id']: _snapshot(row) async for row in _snapshot_query(missed)}
+        await cache.aset_many({cache_key(pid): loaded.get(pid, _MISSING) for pid in missed},
+                              timeout=settings.PATIENT_CACHE_TTL)
+        found.update(loaded)
+    return found
+
+
+def get_patient(patient_id):
+    """Snapshot dict for one patient, or None if there is no such patient."""
+    return get_patients([patient_id]).get(patient_id)
+
+
+async def aget_patient(patient_id):
+    return (await aget_patients([patient_id])).get(patient_id)
+
+
+def _counters_query(found):
+    from .models import Patient
+
+    pks = [snapshot['id'] for snapshot in found.values()]
+    return Patient.objects.filter(pk__in=pks).values_list('patient_id', 'last_visit_date', 'visit_count')
+
+
+def _profile(snapshot, last, count):
+    return {**snapshot, 'last_visit': last.isoformat() if last else None, 'visit_count': count}
+
+
+def get_profiles(patient_ids):
+    """
+    Snapshots plus 'last_visit' (ISO date or None) and 'visit_count' for many
+    patients: the cached snapshots and one query on the denormalized counters.
+    """
+    found = get_patients(patient_ids)
+    if not found:
+        return {}
+    return {pid: _profile(found[pid], last, count) for pid, last, count in _counters_query(found)}
+
+
+async def aget_profiles(patient_ids):
+    """get_profiles() for async views."""
+    found = await aget_patients(patient_ids)
+    if not found:
+        return {}
+    return {pid: _profile(found[pid], last, count) async for pid, last, count in _counters_query(found)}
+
+
+def invalidate(*patient_ids):
+    patient_ids = [pid for pid in patient_ids if pid]
+    if patient_ids:
+        _cache().delete_many([cache_key(pid) for pid in patient_ids])
@@ -0,0 +1,181 @@
+"""
+Materialized dashboard counters.
+
+Every count the dashboard and access-control pages show is a DashboardStat
+row keyed by name ('patients.status.Active', 'visits.day.2025-01-31', ...).
+Signal handlers move the counters when an AppUser, Patient, Visit or
+DischargeSummary is created, changed or deleted, inside the same transaction
+as the write, so pages read a handful of rows in one query instead of
+counting tables. Bulk writes that skip signals call record_created(), and
+the reconcile_stats command recounts everything from scratch to repair
+drift (raw SQL, queryset.update()).
+
+Every write bumps 'patients.total' or 'visits.total', and an UPDATE holds
+its row lock until the writer's transaction commits, so a single row per
+counter would queue every concurrent writer behind it. Each counter is
+split into STATS_COUNTER_SHARDS rows instead: a write bumps one shard picked
+at random, and reads sum the shards.
+"""
+import datetime
+import random
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import AppUser, DashboardStat, DischargeSummary, Patient, Visit
+
+DASHBOARD_DAYS = 7
+
+
+class Tracker:
+    """Which counters one instance of `model` contributes to, from `fields`."""
+    def __init__(self, model, fields, keys_for):
+        self.model = model
+        self.fields = fields
+        self.keys_for = keys_for
+
+    def keys(self, instance):
+        return self.keys_for(*(getattr(instance, f) for f in self.fields))
+
+    def loaded(self, instance):
+        # Never trigger a query for a deferred field (.only() querysets)
+        return all(f in instance.__dict__ for f in self.fields)
+
+
+def _visit_day(value):
+    return Visit._meta.get_field('date').to_python(value)
+
+
+TRACKERS = {
+    AppUser: Tracker(AppUser, ('role',), lambda role: ['users.total', f'users.role.{role}']),
+    Patient: Tracker(Patient, ('status',), lambda status: ['patients.total', f'patients.status.{status}']),
+    Visit: Tracker(Visit, ('date',), lambda date: ['visits.total', f'visits.day.{_visit_day(date)}']),
+    DischargeSummary: Tracker(DischargeSummary, ('discharge_type',),
+                              lambda discharge_type: ['discharges.total', f'discharges.type.{discharge_type}']),
+}
+
+
+# -------------------- Updating --------------------
+def bump(deltas):
+    """
+    Apply {key: delta} with one UPDATE per key, each to a random shard (rows
+    are created on first use). Keys are visited in sorted order so two
+    writers never wait on each other's rows in opposite orders.
+    """
+    for key in sorted(deltas):
+        delta = deltas[key]
+        if not delta:
+            continue
+        shard = random.randrange(settings.STATS_COUNTER_SHARDS)
+        row = DashboardStat.objects.filter(key=key, shard=shard)
+        with transaction.atomic():
+            if not row.update(value=F('value') + delta):
+                DashboardStat.objects.get_or_create(key=key, shard=shard)
+                row.update(value=F('value') + delta)
+
+
+def stored_keys(instance, row=None):
+    """
+    Counters the instance's row counts towards as stored in the database.
+    The in-memory instance may be stale (or have deferred fields), so the
+    row is read back (one indexed lookup per write) unless the caller
+    already holds it as a .values() dict in `row`.
+    """
+    tracker = TRACKERS[type(instance)]
+    if row is None:
+        row = type(instance)._base_manager.filter(pk=instance.pk).values(*tracker.fields).first()
+        if row is None:
+            return []
+    return tracker.keys_for(*(row[f] for f in tracker.fields))
+
+
+def record_created(instances):
+    """Count rows inserted by bulk_create(), which sends no signals."""
+    deltas = Counter()
+    for instance in instances:
+        deltas.update(TRACKERS[type(instance)].keys(instance))
+    bump(deltas)
+
+
+# -------------------- Reading --------------------
+def dashboard_keys(today=None):
+    today = today or timezone.localdate()
+    days = [today - datetime.timedelta(days=n) for n in range(DASHBOARD_DAYS - 1, -1, -1)]
+    keys = ['patients.total', 'visits.total', 'discharges.total']
+    keys += [f'patients.status.{value}' for value, _ in Patient.STATUS_CHOICES]
+    keys += [f'discharges.type.{value}' for value, _ in DischargeSummary.DISCHARGE_TYPE_CHOICES]
+    keys += [f'visits.day.{day}' for day in days]
+    return keys, days
+
+
+def read_stats(keys):
+    """{key: value} for `keys` in one query (summing the shards); missing counters read as 0."""
+    values = dict.fromkeys(keys, 0)
+    values.update(DashboardStat.objects.filter(key__in=keys).values('key').annotate(total=Sum('value'))
+                  .order_by().values_list('key', 'total'))
+    return values
+
+
+def dashboard_stats(today=None):
+    keys, days = dashboard_keys(today)
+    values = read_stats(keys)
+    return {
+        'patients_total': values['patients.total'],
+        'visits_total': values['visits.total'],
+        'discharges_total': values['discharges.total'],
+        'patient_status': [(label, values[f'patients.status.{value}']) for value, label in Patient.STATUS_CHOICES],
+        'discharge_types': [(label, values[f'discharges.type.{value}'])
+                            for value, label in DischargeSummary.DISCHARGE_TYPE_CHOICES],
+        'visits_per_day': [(day, values[f'visits.day.{day}']) for day in days],
+        'visits_today': values[f'visits.day.{days[-1]}'],
+    }
+
+
+# -------------------- Reconcile --------------------
+def actual_counts():
+    """Recount every counter from the tables (a few GROUP BY queries)."""
+    counts = Counter()
+    for model, tracker in TRACKERS.items():
+        for row in model.objects.values(*tracker.fields).annotate(n=Count('pk')).order_by():
+            for key in tracker.keys_for(*(row[f] for f in tracker.fields)):
+                counts[key] += row['n']
+    return counts
+
+
+def _lock_counters():
+    """
+    Hold off bump() until the transaction ends, after waiting for every
+    writer that has already bumped to commit. Counting first and locking
+    after would let a writer commit in between: its bump would then be read
+    back as drift and wiped out, since the recount predates its row.
+    """
+    if connection.vendor == 'postgresql':
+        # Conflicts with the ROW EXCLUSIVE lock every UPDATE/INSERT takes, but not with reads
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {DashboardStat._meta.db_table} IN SHARE ROW EXCLUSIVE MODE')
+    # SQLite transactions begin IMMEDIATE (settings.DATABASES), which already takes the write lock
+
+
+def reconcile(dry_run=False):
+    """
+    Make the table match the real counts. Returns {key: (stored, actual)}
+    for every counter that had drifted. Writers wait while it runs, so it
+    is safe alongside live traffic.
+    """
+    with transaction.atomic():
+        _lock_counters()
+        actual = actual_counts()
+        stored = Counter()
+        for key, value in DashboardStat.objects.values_list('key', 'value'):
+            stored[key] += value
+        drift = {key: (stored[key], actual[key]) for key in stored.keys() | actual.keys() if stored[key] != actual[key]}
+        if drift and not dry_run:
+            # Collapse each drifted counter into shard 0 holding the real count
+            DashboardStat.objects.filter(key__in=list(drift)).delete()
+            DashboardStat.objects.bulk_create(
+                DashboardStat(key=key, value=actual[key]) for key in drift if key in actual
+            )
+    return drift
@@ -1,3 +1,1610 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from asgiref.sync import sync_to_async
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.hashers import make_password
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection, connections, transaction
+from django.http import HttpResponse
+from django.template import engines
+from django.test import (AsyncClient, Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+
+from . import audit, auth, metrics, pdf, snapshots, stats, urls as main_urls, views, vitals
+from .exports import EXPORTS, FLUSH_BYTES, export_rows, stream_export
+from .importers import import_patients
+from .search import search_clinical, search_patients
+from .models import (PATIENT_ID_SEQUENCE, AppUser, AuditEntry, DashboardStat, DischargeSummary, IdSequence, Patient,
+                     Visit, format_patient_id)
+
+
+# -------------------- Query plans --------------------
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite-specific")
+class HotPathQueryPlanTests(TestCase):
+    """
+    Every SELECT a hot view runs against our tables must be answered from an
+    index. A plan line like "SCAN main_patient" (no USING ...) means SQLite
+    reads the whole table, which is what these tests guard against.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        for role in ('doctor', 'nurse', 'admin'):
+            AppUser.objects.create(username=role, usermail=f'{role}@example.com', password='x', role=role)
+        cls.patients = [
+            Patient.objects.create(name=f'Patient {i}', age=30 + i, gender='Female' if i % 2 else 'Male',
+                                   contact_number=f'98000000{i:02d}', status='Active' if i % 3 else 'Chronic')
+            for i in range(10)
+        ]
+        for i, patient in enumerate(cls.patients):
+            Visit.objects.create(patient=patient, doctor_name='Dr. Rao', date=datetime.date(2025, 1, 1 + i),
+                                 checkup_type='Regular', healthcare_service='OPD', bp='120/80',
+                                 oxygen_level='98%', weight='70.00')
+            DischargeSummary.objects.create(patient=patient, uhid=f'UH{i}', ward='ICU', consultant_name='Dr. Rao',
+                                            admission_date=datetime.date(2025, 2, 1),
+                                            discharge_date=datetime.date(2025, 2, 2 + i),
+                                            final_diagnosis='CKD stage 3')
+            AuditEntry.objects.create(uuid=uuid.uuid4(), timestamp=datetime.datetime(2025, 1, 1 + i, tzinfo=datetime.UTC),
+                                      action='update', model='patient', object_id=patient.pk, patient_pk=patient.pk,
+                                      changes={'status': ['Active', 'Chronic']})
+
+    def setUp(self):
+        cache.clear()  # the patient lookups would otherwise be served from the snapshot cache
+        session = self.client.session
+        session['user_id'] = 'test'
+        session['role'] = 'admin'
+        session.save()
+
+    def query_plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexedQueries(self, url, params=None, bounded_scans=()):
+        """
+        `bounded_scans` lists tables the view reads in primary-key order
+        under a LIMIT (e.g. newest N rows); those stop early and are allowed.
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params or {})
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+
+        checked = 0
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or 'main_' not in sql:
+                continue
+            checked += 1
+            for line in self.query_plan(sql):
+                if not line.startswith('SCAN ') or 'USING' in line or 'VIRTUAL TABLE' in line:
+                    continue
+                table = line.split()[1]
+                if table in bounded_scans:
+                    continue
+                self.fail(f"Full table scan ({line}) for {url} {params or ''}:\n{sql}")
+        self.assertGreater(checked, 0, f"No queries captured for {url}")
+
+    def test_ehr_home(self):
+        self.assertIndexedQueries('/ehr_home/', bounded_scans={'main_patient'})
+
+    def test_ehr_home_filtered(self):
+        self.assertIndexedQueries('/ehr_home/', {'status': 'Chronic'})
+        self.assertIndexedQueries('/ehr_home/', {'gender': 'Female'})
+
+    def test_patient_list_api_next_page(self):
+        page = self.client.get('/api/patients/', {'status': 'Active', 'limit': 2}).json()
+        self.assertIndexedQueries('/api/patients/', {'status': 'Active', 'cursor': page['next_cursor']})
+
+    def test_patient_list_most_recently_seen(self):
+        page = self.client.get('/api/patients/', {'sort': 'recent', 'limit': 3}).json()
+        self.assertIndexedQueries('/ehr_home/', {'sort': 'recent'})
+        self.assertIndexedQueries('/api/patients/', {'sort': 'recent', 'cursor': page['next_cursor']})
+
+    def test_patient_search(self):
+        self.assertIndexedQueries('/patients/search/', {'term': 'Pati'})
+        self.assertIndexedQueries('/patients/search/', {'term': ''})
+
+    def test_patient_id_lookup(self):
+        self.assertIndexedQueries('/api/patients/lookup/', {'term': 'po0'})
+        self.assertIndexedQueries(f'/discharge/add/{self.patients[0].patient_id}/')
+
+    def test_clinical_search(self):
+        self.assertIndexedQueries('/api/search/clinical/', {'q': 'ckd'})
+        self.assertIndexedQueries('/api/search/clinical/', {'q': 'ckd', 'type': 'discharge', 'field': 'final_diagnosis',
+                                                            'patient': self.patients[0].patient_id, 'sort': 'recent'})
+
+    def test_data_export(self):
+        for kind in ('patients', 'visits', 'discharges'):
+            self.assertIndexedQueries(f'/api/export/{kind}/', {'since_id': 5})
+            self.assertIndexedQueries(f'/api/export/{kind}/', {'format': 'ndjson', 'from': '2025-01-05'})
+
+    def test_patient_lookups(self):
+        patient_id = self.patients[0].patient_id
+        self.assertIndexedQueries(f'/api/patient/{patient_id}/')
+        cache.clear()
+        self.assertIndexedQueries(f'/api/patient-details/{patient_id}/')
+        self.assertIndexedQueries('/api/patients/batch/', {'ids': ','.join(p.patient_id for p in self.patients)})
+
+    def test_patient_audit(self):
+        patient_id = self.patients[0].patient_id
+        self.assertIndexedQueries(f'/api/patient/{patient_id}/audit/')
+        self.assertIndexedQueries(f'/api/patient/{patient_id}/audit/', {'model': 'visit', 'limit': 1})
+
+    def test_visit_timeline(self):
+        patient_id = self.patients[0].patient_id
+        self.assertIndexedQueries(f'/api/patient/{patient_id}/visits/', {'fields': 'summary'})
+
+    def test_vitals(self):
+        self.assertIndexedQueries(f'/api/patient/{self.patients[0].patient_id}/vitals/')
+        self.assertIndexedQueries('/api/vitals/alerts/', {'from': '2025-01-05'})
+        self.assertIndexedQueries('/api/vitals/alerts/')  # defaults to the last 90 days
+
+    def test_visit_history(self):
+        # The two newest patients are read in id order under LIMIT 2 (aliased U0 in the subquery)
+        self.assertIndexedQueries('/visit_history/', bounded_scans={'main_patient', 'U0'})
+
+    def test_discharge_summary_list(self):
+        self.assertIndexedQueries('/discharge/list/')
+        self.assertIndexedQueries('/api/discharges/', {'discharge_type': 'Planned', 'from': '2025-02-05'})
+
+    def test_dashboard(self):
+        self.assertIndexedQueries('/dashboard/')
+
+    def test_access_control(self):
+        self.assertIndexedQueries('/access-control/')
+
+
+# -------------------- Concurrent writes --------------------
+class ConcurrentWriteTests(TransactionTestCase):
+    """
+    Visits and discharge summaries posted from many threads at once while a
+    long read (an export or report walking a big table) is still open. Without
+    WAL, SQLite cannot commit while any reader holds the database, so these
+    writes waited out the busy timeout and failed with "database is locked".
+    """
+    THREADS = 8
+    POSTS_PER_THREAD = 10
+
+    def setUp(self):
+        self.patient = Patient.objects.create(name='Stress Test', age=40, gender='Female',
+                                              contact_number='9800000000', status='Active')
+        history = Patient.objects.create(name='Long History', age=70, gender='Male',
+                                         contact_number='9800000001', status='Chronic')
+        Visit.objects.bulk_create(
+            Visit(patient=history, doctor_name='Dr. Rao', date=datetime.date(2020, 1, 1), checkup_type='Regular',
+                  healthcare_service='OPD', bp='120/80', oxygen_level='98%', weight='70.00')
+            for _ in range(500)
+        )
+
+    def post_many(self, worker):
+        errors = []
+
+        def run(n):
+            client = Client()
+            try:
+                for i in range(self.POSTS_PER_THREAD):
+                    response = worker(client, n, i)
+                    if response.status_code != 302:
+                        errors.append(f'HTTP {response.status_code}')
+            except Exception as e:
+                errors.append(repr(e))
+            finally:
+                connections.close_all()
+
+        self.run_threads(run)
+        return errors
+
+    def run_threads(self, run):
+        """run(n) on THREADS threads at once."""
+        threads = [threading.Thread(target=run, args=(n,)) for n in range(self.THREADS)]
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # switch threads mid-transaction, as on a multi-core server
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+
+    def test_new_visit_and_discharge_summaries(self):
+        spool_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(AUDIT_LOG='background', AUDIT_SPOOL_DIR=spool_dir))
+
+        def worker(client, n, i):
+            if (n + i) % 2:
+                return client.post('/discharge/add/', {
+                    'patient': self.patient.patient_id, 'uhid': f'UH{n}-{i}', 'ward': 'ICU',
+                    'discharge_type': 'Planned', 'admission_date': '2025-02-27', 'discharge_date': '2025-03-01',
+                })
+            return client.post('/new_visit/', {
+                'patient': self.patient.pk, 'date': f'2025-01-{1 + i:02d}', 'doctor_name': 'Dr. Rao',
+                'checkup_type': 'Regular', 'healthcare_service': 'OPD', 'bp': '120/80',
+                'oxygen_level': '98%', 'weight': '70.00',
+            })
+
+        # A cursor part-way through 500 rows keeps its read open until it is exhausted
+        long_read = Visit.objects.order_by('id').iterator(chunk_size=50)
+        next(long_read)
+        errors = self.post_many(worker)
+        self.assertEqual(sum(1 for _ in long_read), 499)
+
+        self.assertEqual(errors, [])
+        total = self.THREADS * self.POSTS_PER_THREAD
+        visits = Visit.objects.filter(patient=self.patient)
+        self.assertEqual(visits.count() + DischargeSummary.objects.count(), total)
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.visit_count, visits.count())
+        self.assertEqual(self.patient.last_visit_date, visits.latest('date').date)
+
+        # Every committed write was audited once, and the spool was emptied behind the flush
+        self.assertTrue(audit.flush(timeout=30))
+        self.assertEqual(AuditEntry.objects.filter(model='visit', action='create').count(), visits.count())
+        self.assertEqual(AuditEntry.objects.filter(model='dischargesummary', action='create').count(),
+                         DischargeSummary.objects.count())
+        self.assertEqual(sum(f.stat().st_size for f in audit.get_log().spool_dir.iterdir()), 0)
+
+    def test_concurrent_creates_get_unique_patient_ids(self):
+        created, errors = [], []
+
+        def run(n):
+            try:
+                for i in range(self.POSTS_PER_THREAD):
+                    created.append(Patient.objects.create(name=f'Concurrent {n}-{i}', age=30, gender='Other',
+                                                          contact_number='9800000010', status='Active'))
+            except Exception as e:
+                errors.append(repr(e))
+            finally:
+                connections.close_all()
+
+        self.run_threads(run)
+        self.assertEqual(errors, [])
+        ids = [patient.patient_id for patient in created]
+        self.assertEqual(len(set(ids)), self.THREADS * self.POSTS_PER_THREAD)
+        stored = set(Patient.objects.filter(name__startswith='Concurrent ').values_list('patient_id', flat=True))
+        self.assertEqual(stored, set(ids))
+
+    @skipUnless(connection.vendor == 'sqlite', "journal modes are SQLite-specific")
+    def test_wal_is_set_by_migration_not_per_connection(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+
+        # Connecting alone must leave a database file (like the committed db.sqlite3) untouched
+        import sqlite3
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'fresh.sqlite3')
+        fresh = sqlite3.connect(path)
+        fresh.execute('CREATE TABLE t (x)')
+        fresh.close()
+        fresh = sqlite3.connect(path)
+        fresh.executescript(settings.SQLITE_PRAGMAS)
+        self.assertEqual(fresh.execute('PRAGMA journal_mode').fetchone()[0], 'delete')
+        fresh.close()
+
+
+# -------------------- Patient import --------------------
+@override_settings(AUDIT_LOG='off')
+class PatientImportTests(TestCase):
+    HEADER = 'name,age,gender,contact_number,status\n'
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        rows = io.StringIO(self.HEADER
+                           + 'Valid One,30,Female,9811111111,Active\n'
+                           + 'Bad Age,abc,Male,9811111112,Active\n'
+                           + 'No Gender,40,,9811111113,Active\n'
+                           + 'Bad Status,50,Male,9811111114,Discharged\n'
+                           + 'Valid Two,61,Other,9811111115,Chronic\n')
+        error_file = io.StringIO()
+        result = import_patients(rows, 'csv', batch_size=1, error_file=error_file)
+
+        self.assertEqual((result.rows, result.imported, result.failed), (5, 2, 3))
+        self.assertEqual([(e['line'], list(e['errors'])) for e in result.errors],
+                         [(3, ['age']), (4, ['gender']), (5, ['status'])])
+        self.assertEqual(sorted(Patient.objects.values_list('name', flat=True)), ['Valid One', 'Valid Two'])
+
+        lines = error_file.getvalue().splitlines()
+        self.assertEqual(lines[0], 'line,errors,row')
+        self.assertEqual(len(lines), 4)
+        self.assertIn('Bad Age', lines[1])
+
+    def test_jsonl_parse_errors_and_batches(self):
+        rows = io.StringIO('{"name": "A", "age": 1, "gender": "Male", "contact_number": "1", "status": "Active"}\n'
+                           '{"name": "B", "age": 2, "gender"\n'
+                           '\n'
+                           '["not", "an", "object"]\n'
+                           '{"name": "C", "age": 3, "gender": "Male", "contact_number": "3", "status": "Active"}\n'
+                           '{"name": "D", "age": 4, "gender": "Male", "contact_number": "4", "status": "Active"}\n')
+        result = import_patients(rows, 'jsonl', batch_size=2)
+
+        self.assertEqual((result.rows, result.imported, result.failed), (5, 3, 2))
+        self.assertEqual([e['line'] for e in result.errors], [2, 4])
+        self.assertTrue(result.errors[0]['errors']['__all__'][0].startswith('Invalid JSON'))
+        self.assertEqual(result.errors[1]['errors'], {'__all__': ['Expected a JSON object']})
+        ids = list(Patient.objects.order_by('name').values_list('patient_id', flat=True))
+        self.assertEqual(len(set(ids)), 3)
+
+    def test_error_list_is_capped_but_every_failure_counted(self):
+        rows = io.StringIO(self.HEADER + ''.join(f'Bad {n},x,Male,1,Active\n' for n in range(5)))
+        result = import_patients(rows, 'csv', keep_errors=2)
+        self.assertEqual(result.failed, 5)
+        self.assertEqual(len(result.errors), 2)
+
+
+class PatientImportJobTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings_override = override_settings(IMPORT_DIR=Path(tmp.name), IMPORT_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.import_dir = Path(tmp.name)
+        self.sign_in('admin')
+
+    def sign_in(self, role):
+        session = self.client.session
+        session['user_id'] = 'test'
+        session['role'] = role
+        session.save()
+
+    def upload(self, content, name='patients.csv'):
+        return self.client.post('/patients/import/', {'file': SimpleUploadedFile(name, content.encode())})
+
+    def test_upload_runs_as_a_job_with_a_downloadable_error_file(self):
+        response = self.upload(PatientImportTests.HEADER
+                               + 'Valid One,30,Female,9811111111,Active\n'
+                               + 'Bad Age,abc,Male,9811111112,Active\n'
+                               + 'Bad Status,50,Male,9811111114,Discharged\n')
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual(job['status'], 'done')  # IMPORT_WORKERS=0 imports inline
+
+        status = self.client.get(job['status_url']).json()
+        self.assertEqual((status['rows'], status['imported'], status['failed'], status['error_count']), (3, 1, 2, 2))
+        self.assertIn('rows_per_sec', status)
+        self.assertFalse((self.import_dir / job['job'] / 'upload').exists())
+
+        errors = self.client.get(status['errors_url'])
+        self.assertEqual(errors['Content-Type'], 'text/csv')
+        self.assertIn('attachment', errors['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(b''.join(errors.streaming_content).decode())))
+        self.assertEqual(rows[0], ['line', 'errors', 'row'])
+        self.assertEqual([row[0] for row in rows[1:]], ['3', '4'])
+        self.assertIn('Bad Age', rows[1][2])
+
+    def test_clean_import_has_no_errors_url(self):
+        job = self.upload(PatientImportTests.HEADER + 'Valid One,30,Female,9811111111,Active\n').json()
+        status = self.client.get(job['status_url']).json()
+        self.assertEqual(status['error_count'], 0)
+        self.assertNotIn('errors_url', status)
+
+    def test_failed_import_is_reported(self):
+        with self.assertLogs('main.importers', 'ERROR'), \
+                mock.patch('main.importers.import_patients', side_effect=OSError('disk full')):
+            job = self.upload(PatientImportTests.HEADER).json()
+        self.assertEqual(job['status'], 'failed')
+        self.assertEqual(self.client.get(job['status_url']).json()['error'], 'OSError: disk full')
+        self.assertEqual(self.client.get(f"/patients/import/{job['job']}/errors.csv").status_code, 404)
+
+    def test_unknown_or_malformed_job_is_404(self):
+        self.assertEqual(self.client.get(f'/patients/import/{uuid.uuid4().hex}/').status_code, 404)
+        self.assertEqual(self.client.get('/patients/import/..%2F..%2Fetc/').status_code, 404)
+
+    def test_admin_only(self):
+        job = self.upload(PatientImportTests.HEADER).json()
+        self.sign_in('doctor')
+        self.assertEqual(self.client.get(job['status_url']).status_code, 403)
+        self.assertEqual(self.upload(PatientImportTests.HEADER).status_code, 403)
+
+
+# -------------------- Patient snapshots --------------------
+class PatientSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patient = Patient.objects.create(name='Snapshot Test', age=45, gender='Male',
+                                              contact_number='9800000011', status='Active',
+                                              medical_history='\nHypertension\nAsthma')
+
+    def test_cached_after_first_read(self):
+        self.assertEqual(snapshots.get_patient(self.patient.patient_id)['primary_condition'], 'Hypertension')
+        with self.assertNumQueries(0):
+            self.assertEqual(snapshots.get_patient(self.patient.patient_id)['name'], 'Snapshot Test')
+
+    def test_update_invalidates(self):
+        snapshots.get_patient(self.patient.patient_id)
+        self.patient.name = 'Renamed'
+        self.patient.status = 'Chronic'
+        self.patient.save()
+        snapshot = snapshots.get_patient(self.patient.patient_id)
+        self.assertEqual((snapshot['name'], snapshot['status']), ('Renamed', 'Chronic'))
+
+    def test_delete_invalidates(self):
+        snapshots.get_patient(self.patient.patient_id)
+        self.patient.delete()
+        self.assertIsNone(snapshots.get_patient(self.patient.patient_id))
+
+    def test_cached_unknown_id_is_dropped_when_the_patient_is_created(self):
+        next_id = format_patient_id(IdSequence.peek(PATIENT_ID_SEQUENCE))
+        self.assertIsNone(snapshots.get_patient(next_id))
+        with self.assertNumQueries(0):
+            self.assertIsNone(snapshots.get_patient(next_id))  # the miss is cached too
+        Patient.objects.create(name='Late Arrival', age=20, gender='Female',
+                               contact_number='9800000012', status='Active')
+        self.assertEqual(snapshots.get_patient(next_id)['name'], 'Late Arrival')
+
+
+# -------------------- Patient API --------------------
+class PatientBatchApiTests(TestCase):
+    def test_profiles_match_patient_api(self):
+        patient = Patient.objects.create(name='Batch Test', age=52, gender='Female',
+                                         contact_number='9800000008', status='Active')
+        single = self.client.get(f'/api/patient/{patient.patient_id}/').json()
+        batch = self.client.get('/api/patients/batch/', {'ids': f'{patient.patient_id},PO99999'}).json()
+        self.assertEqual(batch, {'results': {patient.patient_id: single}, 'missing': ['PO99999']})
+        self.assertNotIn('contact_number', single)
+
+
+# -------------------- Patient visit counters --------------------
+class PatientVisitCounterTests(TestCase):
+    def setUp(self):
+        self.first, self.second = (
+            Patient.objects.create(name=name, age=50, gender='Male', contact_number='9800000018', status='Active')
+            for name in ('Counter One', 'Counter Two')
+        )
+
+    def add_visit(self, patient, day):
+        return Visit.objects.create(patient=patient, doctor_name='Dr. Rao', date=datetime.date(2025, 5, day),
+                                    checkup_type='Regular', healthcare_service='OPD', bp='120/80',
+                                    oxygen_level='98%', weight='70.00')
+
+    def assertCounters(self, patient, count, last_day):
+        patient.refresh_from_db()
+        self.assertEqual((patient.visit_count, patient.last_visit_date),
+                         (count, datetime.date(2025, 5, last_day) if last_day else None))
+
+    def test_delete_recounts(self):
+        early, late = self.add_visit(self.first, 2), self.add_visit(self.first, 9)
+        self.assertCounters(self.first, 2, 9)
+        late.delete()
+        self.assertCounters(self.first, 1, 2)
+        early.delete()
+        self.assertCounters(self.first, 0, None)
+
+    def test_moving_a_visit_recounts_both_patients(self):
+        self.add_visit(self.first, 3)
+        moved = self.add_visit(self.first, 7)
+        self.add_visit(self.second, 5)
+
+        moved.patient = self.second
+        moved.save()
+        self.assertCounters(self.first, 1, 3)
+        self.assertCounters(self.second, 2, 7)
+
+        moved.date = datetime.date(2025, 5, 1)
+        moved.save(update_fields=['date'])
+        self.assertCounters(self.second, 2, 5)
+
+    def test_patient_delete_cascades_without_recounting(self):
+        for day in (1, 2, 3):
+            self.add_visit(self.first, day)
+        self.add_visit(self.second, 4)
+        with mock.patch.object(Patient, 'refresh_visit_stats') as refresh:
+            self.first.delete()
+        refresh.assert_not_called()
+        self.assertFalse(Visit.objects.filter(patient_id=self.first.pk).exists())
+        self.assertCounters(self.second, 1, 4)
+        self.assertEqual(stats.read_stats(['visits.total'])['visits.total'], 1)
+
+    def test_recent_sort_pages_cross_from_seen_to_never_seen(self):
+        # Seen patients (two share a date) first, newest first; never-seen ones last, by id
+        for day, patient in ((5, self.first), (5, self.second)):
+            self.add_visit(patient, day)
+        seen = Patient.objects.create(name='Counter Three', age=50, gender='Male',
+                                      contact_number='9800000018', status='Active')
+        self.add_visit(seen, 1)
+        never_seen = [Patient.objects.create(name=f'Never Seen {n}', age=50, gender='Male',
+                                             contact_number='9800000018', status='Active') for n in range(3)]
+        expected = [p.patient_id for p in [self.second, self.first, seen, *reversed(never_seen)]]
+
+        for limit in (1, 2, 3, 4):
+            with self.subTest(limit=limit):
+                seen_ids, cursor = [], None
+                while True:
+                    params = {'sort': 'recent', 'limit': limit, **({'cursor': cursor} if cursor else {})}
+                    data = self.client.get('/api/patients/', params).json()
+                    seen_ids += [row['patient_id'] for row in data['results']]
+                    cursor = data['next_cursor']
+                    if not cursor:
+                        break
+                self.assertEqual(seen_ids, expected)
+
+
+# -------------------- Visit timeline --------------------
+class VisitTimelineApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = Patient.objects.create(name='Timeline Test', age=61, gender='Female',
+                                             contact_number='9800000017', status='Chronic')
+        cls.url = f'/api/patient/{cls.patient.patient_id}/visits/'
+        # Two visits share a date, so the id breaks the tie across a page boundary
+        for day in (1, 3, 3, 5, 8):
+            cls.add_visit(datetime.date(2025, 4, day))
+
+    @classmethod
+    def add_visit(cls, date):
+        return Visit.objects.create(patient=cls.patient, doctor_name='Dr. Rao', date=date, checkup_type='Regular',
+                                    healthcare_service='OPD', bp='120/80', oxygen_level='98%', weight='70.00',
+                                    notes='Review')
+
+    def test_unchanged_timeline_answers_304(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'])
+        self.assertTrue(response['Last-Modified'])
+
+        with self.assertNumQueries(2):  # the patient's pk and the visits' count / latest change
+            cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b'')
+        self.assertEqual(self.client.get('/api/patient/PO99999/visits/').status_code, 404)
+
+    def test_etag_changes_when_a_visit_is_added_or_edited(self):
+        first = self.client.get(self.url)['ETag']
+        visit = self.add_visit(datetime.date(2025, 4, 9))
+        second = self.client.get(self.url)['ETag']
+        self.assertNotEqual(second, first)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first).status_code, 200)
+
+        visit.notes = 'Edited'
+        visit.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=second)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], second)
+        self.assertEqual(response.json()['results'][0]['notes'], 'Edited')
+
+    def test_cursor_pages_follow_each_other(self):
+        seen, etags, cursor = [], set(), None
+        while True:
+            params = {'limit': 2, 'fields': 'summary'}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            etags.add(response['ETag'])
+            data = response.json()
+            self.assertLessEqual(len(data['results']), 2)
+            self.assertTrue(all('notes' not in row for row in data['results']))
+            seen += [row['id'] for row in data['results']]
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        expected = list(Visit.objects.filter(patient=self.patient).order_by('-date', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(etags), 3)  # each page is its own representation
+        self.assertEqual(self.client.get(self.url, {'cursor': 'not-a-cursor'}).status_code, 400)
+
+
+# -------------------- Dashboard counters --------------------
+@override_settings(STATS_COUNTER_SHARDS=4)
+class DashboardStatTests(TestCase):
+    def test_counters_sum_their_shards(self):
+        for _ in range(40):
+            stats.bump({'test.counter': 1})
+        self.assertGreater(DashboardStat.objects.filter(key='test.counter').count(), 1)
+        self.assertEqual(stats.read_stats(['test.counter']), {'test.counter': 40})
+
+    def test_reconcile_collapses_drifted_shards(self):
+        for n in range(3):
+            Patient.objects.create(name=f'Counted {n}', age=30, gender='Female',
+                                   contact_number='9800000007', status='Active')
+        DashboardStat.objects.filter(key='patients.total').update(value=0)
+        self.assertEqual(stats.reconcile(), {'patients.total': (0, 3)})
+        self.assertEqual(list(DashboardStat.objects.filter(key='patients.total').values_list('value', flat=True)), [3])
+        self.assertEqual(stats.reconcile(), {})
+
+
+class DashboardReconcileTests(TransactionTestCase):
+    def test_reconcile_waits_for_a_write_in_flight(self):
+        written, release, drift = threading.Event(), threading.Event(), []
+
+        def write():
+            try:
+                with transaction.atomic():
+                    Patient.objects.create(name='In Flight', age=30, gender='Male',
+                                           contact_number='9800000015', status='Active')
+                    written.set()
+                    release.wait(10)
+            finally:
+                connections.close_all()
+
+        def reconcile():
+            try:
+                drift.append(stats.reconcile())
+            finally:
+                connections.close_all()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        self.assertTrue(written.wait(10))
+        reconciler = threading.Thread(target=reconcile)
+        reconciler.start()
+        reconciler.join(0.3)
+        self.assertTrue(reconciler.is_alive())  # waiting for the writer's transaction
+        release.set()
+        writer.join()
+        reconciler.join()
+
+        self.assertEqual(drift, [{}])
+        self.assertEqual(stats.read_stats(['patients.total', 'patients.status.Active']),
+                         {'patients.total': 1, 'patients.status.Active': 1})
+
+
+# -------------------- Patient search --------------------
+@skipUnless(connection.vendor == 'sqlite', "FTS5 indexes are SQLite-only")
+class PatientSearchIndexTests(TestCase):
+    def setUp(self):
+        self.patient = Patient.objects.create(name='Meera Krishnan', age=34, gender='Female',
+                                              contact_number='9812345670', status='Active')
+
+    def found(self, term):
+        return [p.pk for p in search_patients(term)]
+
+    def test_matches_every_word_as_a_prefix(self):
+        self.assertEqual(self.found('mee kri'), [self.patient.pk])
+        self.assertEqual(self.found(self.patient.patient_id.lower()), [self.patient.pk])
+        self.assertEqual(self.found('98123'), [self.patient.pk])
+        self.assertEqual(self.found('meera smith'), [])
+
+    def test_name_match_outranks_phone_match(self):
+        # Her contact number is the other patient's name, so only the column weights decide
+        by_phone = Patient.objects.create(name='Arjun Rao', age=40, gender='Male',
+                                          contact_number='Sunil', status='Active')
+        by_name = Patient.objects.create(name='Sunil Verma', age=45, gender='Male',
+                                         contact_number='9812345671', status='Active')
+        self.assertEqual(self.found('sunil'), [by_name.pk, by_phone.pk])
+
+    def test_update_and_delete_reindex(self):
+        self.patient.name = 'Meera Iyer'
+        self.patient.save()
+        self.assertEqual(self.found('krishnan'), [])
+        self.assertEqual(self.found('iyer'), [self.patient.pk])
+
+        Patient.objects.filter(pk=self.patient.pk).update(contact_number='9700000001')
+        self.assertEqual(self.found('98123'), [])
+        self.assertEqual(self.found('97000'), [self.patient.pk])
+
+        self.patient.delete()
+        self.assertEqual(self.found('iyer'), [])
+
+    def test_counter_updates_leave_the_index_alone(self):
+        # A new visit bumps visit_count and last_visit_date; the trigger fires on the indexed columns only
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'main_patient_fts_au'")
+            self.assertIn('AFTER UPDATE OF name, patient_id, contact_number', cursor.fetchone()[0])
+        Visit.objects.create(patient=self.patient, date='2025-02-01', doctor_name='Dr. Rao',
+                             checkup_type='Regular', healthcare_service='OPD', bp='120/80',
+                             oxygen_level='98%', weight='60.00')
+        self.assertEqual(self.found('meera'), [self.patient.pk])
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO main_patient_fts(main_patient_fts, rank) VALUES ('integrity-check', 1)")
+
+
+class PatientIdLookupTests(TestCase):
+    def setUp(self):
+        # IDs either side of the PO0001 prefix's range (PO0001 <= id < PO0002)
+        for patient_id in ('PO00009', 'PO00010', 'PO00015', 'PO00019', 'PO00020', 'PO00100'):
+            Patient.objects.create(patient_id=patient_id, name=f'Lookup {patient_id}', age=30, gender='Male',
+                                   contact_number='9800000018', status='Active')
+
+    def lookup(self, term):
+        response = self.client.get('/api/patients/lookup/', {'term': term})
+        self.assertEqual(response.status_code, 200)
+        return [option['id'] for option in response.json()['results']]
+
+    def test_prefix_matches_its_range(self):
+        self.assertEqual(self.lookup('po0001'), ['PO00010', 'PO00015', 'PO00019'])
+        self.assertEqual(self.lookup(' PO-0001 '), ['PO00010', 'PO00015', 'PO00019'])
+        self.assertEqual(self.lookup('PO0010'), ['PO00100'])
+        self.assertEqual(self.lookup('PO00009'), ['PO00009'])
+        self.assertEqual(self.lookup('PO000099'), [])
+
+    def test_options_carry_the_form_fields(self):
+        option, = self.client.get('/api/patients/lookup/', {'term': 'PO00015'}).json()['results']
+        self.assertEqual(option, {'id': 'PO00015', 'text': 'PO00015 - Lookup PO00015', 'name': 'Lookup PO00015',
+                                  'age': 30, 'gender': 'Male', 'contact_number': '9800000018'})
+
+    def test_empty_or_odd_prefix_is_an_empty_list(self):
+        for term in ('', '   ', '%', '_*-', 'ZZ', 'PO0001Z'):
+            with self.subTest(term=term), self.assertNumQueries(0 if not term.strip('%_*- ') else 1):
+                self.assertEqual(self.lookup(term), [])
+
+
+# -------------------- Clinical search --------------------
+class ClinicalSearchTests(TestCase):
+    def setUp(self):
+        patient = Patient.objects.create(name='Search Test', age=66, gender='Male',
+                                         contact_number='9800000006', status='Chronic')
+        # Entered out of date order, as back-filled records are
+        for discharged, diagnosis in (('2025-03-01', 'Chronic kidney disease stage 3'),
+                                      ('2024-01-01', 'Chronic disease of the kidney, stage 2'),
+                                      ('2025-06-01', 'Chronic cough')):
+            DischargeSummary.objects.create(patient=patient, uhid='UH-S', consultant_name='Dr. Rao',
+                                            admission_date=discharged, discharge_date=discharged,
+                                            final_diagnosis=diagnosis)
+
+    def dates(self, term, **kwargs):
+        return [hit['date'] for hit in search_clinical(term, 'discharge', **kwargs)]
+
+    def test_recent_is_newest_discharge_first(self):
+        self.assertEqual(self.dates('chronic', sort='recent'), ['2025-06-01', '2025-03-01', '2024-01-01'])
+
+    def test_fallback_matches_every_word_anywhere(self):
+        with mock.patch('main.search.fts_enabled', return_value=False):
+            self.assertEqual(self.dates('chronic kidney'), ['2025-03-01', '2024-01-01'])
+            self.assertEqual(self.dates('kidney cough'), [])
+
+
+@skipUnless(connection.vendor == 'sqlite', "FTS5 indexes are SQLite-only")
+class ClinicalSearchIndexTests(TestCase):
+    def setUp(self):
+        self.patient = Patient.objects.create(name='Index Test', age=52, gender='Female',
+                                              contact_number='9800000016', status='Active')
+
+    def summary(self, final_diagnosis, hospital_course=None, discharged='2025-01-01'):
+        return DischargeSummary.objects.create(patient=self.patient, uhid='UH-I', consultant_name='Dr. Rao',
+                                               admission_date=discharged, discharge_date=discharged,
+                                               final_diagnosis=final_diagnosis, hospital_course=hospital_course)
+
+    def visit(self, notes):
+        return Visit.objects.create(patient=self.patient, date='2025-02-01', doctor_name='Dr. Rao',
+                                    checkup_type='Regular', healthcare_service='OPD', bp='120/80',
+                                    oxygen_level='98%', weight='60.00', notes=notes)
+
+    def ids(self, term, kind='discharge', **kwargs):
+        return [hit['id'] for hit in search_clinical(term, kind, **kwargs)]
+
+    def test_diagnosis_match_outranks_hospital_course_match(self):
+        # Entered first and older, so neither id nor date order puts it first
+        in_diagnosis = self.summary('Community acquired pneumonia', discharged='2025-01-01')
+        in_course = self.summary('Fever', hospital_course='Treated for pneumonia, improved', discharged='2025-06-01')
+        for diagnosis in ('Asthma', 'Gout', 'Anaemia', 'Migraine'):
+            self.summary(diagnosis)  # a rare term scores above zero
+        hits = search_clinical('pneumonia', 'discharge')
+        self.assertEqual([hit['id'] for hit in hits], [in_diagnosis.pk, in_course.pk])
+        self.assertGreater(hits[0]['score'], hits[1]['score'])
+        self.assertEqual(self.ids('pneumonia', field='hospital_course'), [in_course.pk])
+
+    def test_stemmed_match_and_escaped_snippet(self):
+        summary = self.summary('Fractured <left> femur')
+        hit, = search_clinical('fractures', 'discharge')
+        self.assertEqual(hit['id'], summary.pk)
+        self.assertEqual(hit['snippet'], '<mark>Fractured</mark> &lt;left&gt; femur')
+
+    def test_summary_update_and_delete_reindex(self):
+        summary = self.summary('Acute appendicitis')
+        summary.final_diagnosis = 'Renal colic'
+        summary.save()
+        self.assertEqual(self.ids('appendicitis'), [])
+        self.assertEqual(self.ids('colic'), [summary.pk])
+
+        DischargeSummary.objects.filter(pk=summary.pk).update(procedures_done='Ureteroscopy')
+        self.assertEqual(self.ids('ureteroscopy'), [summary.pk])
+
+        summary.delete()
+        self.assertEqual(self.ids('colic'), [])
+        self.assertEqual(self.ids('ureteroscopy'), [])
+
+    def test_visit_notes_update_and_delete_reindex(self):
+        visit = self.visit('Persistent dry cough')
+        self.assertEqual(self.ids('cough', 'visit'), [visit.pk])
+        Visit.objects.filter(pk=visit.pk).update(notes='Wheezing on exertion')
+        self.assertEqual(self.ids('cough', 'visit'), [])
+        self.assertEqual(self.ids('wheezing', 'visit'), [visit.pk])
+
+        visit.delete()
+        self.assertEqual(self.ids('wheezing', 'visit'), [])
+
+    def test_index_matches_rebuild_after_writes(self):
+        # An external-content index out of step with its table fails FTS5's integrity check
+        for notes in ('Headache', 'Migraine with aura', None):
+            self.visit(notes)
+        Visit.objects.filter(notes='Headache').update(notes='Tension headache')
+        Visit.objects.filter(notes__startswith='Migraine').delete()
+        self.summary('Sepsis').delete()
+        with connection.cursor() as cursor:
+            for table in ('main_visit_fts', 'main_dischargesummary_fts'):
+                cursor.execute(f"INSERT INTO {table}({table}, rank) VALUES ('integrity-check', 1)")
+
+
+# -------------------- Vitals --------------------
+class VitalsParsingTests(SimpleTestCase):
+    def test_parse_bp(self):
+        cases = [
+            ('120/80', (120, 80)),
+            ('120/80 mmHg', (120, 80)),
+            (' 135 / 85 ', (135, 85)),
+            ('BP 90/60 sitting', (90, 60)),
+            ('120/', (None, None)),
+            ('/80', (None, None)),
+            ('abc', (None, None)),
+            ('', (None, None)),
+            (None, (None, None)),
+            ('400/80', (None, None)),  # out of range: a typo, not a reading
+            ('120/10', (None, None)),
+            ('1200/800', (None, None)),
+        ]
+        for text, expected in cases:
+            with self.subTest(text=text):
+                self.assertEqual(vitals.parse_bp(text), expected)
+
+    def test_parse_spo2(self):
+        cases = [
+            ('98%', 98.0),
+            ('97.5 %', 97.5),
+            ('SpO2 95', 95.0),
+            ('100', 100.0),
+            ('101%', None),
+            ('49%', None),
+            ('abc', None),
+            ('', None),
+            (None, None),
+        ]
+        for text, expected in cases:
+            with self.subTest(text=text):
+                self.assertEqual(vitals.parse_spo2(text), expected)
+
+    def test_rolling_mean_skips_missing_readings(self):
+        import numpy as np
+
+        values = np.array([120.0, np.nan, 130.0, 140.0, np.nan, np.nan])
+        np.testing.assert_allclose(vitals.rolling_mean(values, 2), [120.0, 120.0, 130.0, 135.0, 140.0, np.nan])
+        np.testing.assert_allclose(vitals.rolling_mean(values, 1), values)
+
+    def test_trend_per_30_days(self):
+        import numpy as np
+
+        days = np.array([0.0, 15.0, 30.0, 60.0])
+        self.assertEqual(vitals.trend_per_30_days(days, np.array([120.0, np.nan, 130.0, 140.0])), 10.0)
+        self.assertEqual(vitals.trend_per_30_days(days, np.array([98.0, 97.0, 96.0, 94.0])), -2.0)
+        self.assertIsNone(vitals.trend_per_30_days(days, np.array([np.nan, 120.0, np.nan, np.nan])))
+        self.assertIsNone(vitals.trend_per_30_days(np.array([5.0, 5.0]), np.array([120.0, 130.0])))
+
+
+class VitalsAlertsTests(TestCase):
+    def setUp(self):
+        today = datetime.date.today()
+        for name, days_ago in (('Recent', 10), ('Last Year', 365)):
+            patient = Patient.objects.create(name=name, age=70, gender='Male',
+                                             contact_number='9800000005', status='Chronic')
+            Visit.objects.create(patient=patient, doctor_name='Dr. Rao', date=today - datetime.timedelta(days=days_ago),
+                                 checkup_type='Regular', healthcare_service='OPD', bp='170/100',
+                                 oxygen_level='91%', weight='70.00')
+
+    def alert_names(self, params=None):
+        response = self.client.get('/api/vitals/alerts/', params or {})
+        self.assertEqual(response.status_code, 200)
+        return [alert['name'] for alert in response.json()['results']]
+
+    def test_defaults_to_the_last_90_days(self):
+        self.assertEqual(self.alert_names(), ['Recent'])
+
+    def test_explicit_range(self):
+        since = datetime.date.today() - datetime.timedelta(days=400)
+        self.assertEqual(sorted(self.alert_names({'from': since.isoformat()})), ['Last Year', 'Recent'])
+
+
+# -------------------- Authentication --------------------
+TEST_SECRET_KEY = 'wellconx-tests-' + 'x' * 50
+
+
+@override_settings(SECRET_KEY=TEST_SECRET_KEY, PASSWORD_HASH_ITERATIONS=1000, LOGIN_THROTTLE_ENABLED=False)
+class AuthCookieTests(TestCase):
+    PASSWORD = 'correct horse'
+
+    def setUp(self):
+        for role in ('admin', 'nurse'):
+            AppUser.objects.create(username=role, usermail=f'{role}@wellconx.test',
+                                   password=make_password(self.PASSWORD), role=role)
+
+    def login(self, role):
+        client = Client()
+        response = client.post('/', {'email': f'{role}@wellconx.test', 'password': self.PASSWORD})
+        self.assertEqual(response.status_code, 302)
+        return client
+
+    def cookie_only(self, value):
+        """A client holding just the auth cookie, no session."""
+        client = Client()
+        client.cookies[settings.AUTH_COOKIE_NAME] = value
+        return client
+
+    def test_cookie_alone_authorizes_by_role(self):
+        admin_cookie = self.login('admin').cookies[settings.AUTH_COOKIE_NAME].value
+        nurse_cookie = self.login('nurse').cookies[settings.AUTH_COOKIE_NAME].value
+        self.assertEqual(self.cookie_only(admin_cookie).get('/add_patient/').status_code, 200)
+        self.assertEqual(self.cookie_only(nurse_cookie).get('/add_patient/').status_code, 403)
+        self.assertEqual(self.cookie_only(nurse_cookie).get('/dashboard/').status_code, 200)
+
+    def test_tampered_cookie_is_rejected(self):
+        nurse_cookie = self.login('nurse').cookies[settings.AUTH_COOKIE_NAME].value
+        signature = nurse_cookie.split(':', 1)[1]  # timestamp:signature, kept from the real cookie
+        forged = signing.b64_encode(json.dumps({'user_id': str(uuid.uuid4()), 'role': 'admin'},
+                                               separators=(',', ':')).encode()).decode()
+        self.assertEqual(self.cookie_only(f'{forged}:{signature}').get('/add_patient/').status_code, 403)
+        self.assertEqual(self.cookie_only(nurse_cookie[:-1]).get('/dashboard/').status_code, 302)
+
+    def test_expired_cookie_falls_back_to_session(self):
+        client = self.login('nurse')
+        with override_settings(AUTH_COOKIE_AGE=0):
+            time.sleep(1)
+            self.assertEqual(self.cookie_only(client.cookies[settings.AUTH_COOKIE_NAME].value)
+                             .get('/dashboard/').status_code, 302)
+            self.assertEqual(client.get('/dashboard/').status_code, 200)  # the session still signs it in
+
+    def test_insecure_default_key_uses_session_only(self):
+        insecure_key = auth.INSECURE_KEY_PREFIX + 'published-in-the-repository'
+        with override_settings(SECRET_KEY=insecure_key):
+            client = self.login('admin')
+            self.assertNotIn(settings.AUTH_COOKIE_NAME, client.cookies)
+            self.assertEqual(client.get('/add_patient/').status_code, 200)
+            forged = signing.dumps({'user_id': str(uuid.uuid4()), 'role': 'admin'}, salt=auth.SALT, compress=False)
+            self.assertEqual(self.cookie_only(forged).get('/add_patient/').status_code, 403)
+
+
+@override_settings(PASSWORD_HASH_ITERATIONS=1000, LOGIN_THROTTLE_ENABLED=True)
+class LoginThrottleTests(TransactionTestCase):
+    PASSWORD = 'correct horse'
+
+    def setUp(self):
+        cache.clear()
+        AppUser.objects.create(username='nurse', usermail='nurse@wellconx.test',
+                               password=make_password(self.PASSWORD), role='nurse')
+
+    def post(self, password, client=None):
+        return (client or Client()).post('/', {'email': 'nurse@wellconx.test', 'password': password})
+
+    def test_concurrent_failures_cannot_share_a_slot(self):
+        attempts, allowed = 30, settings.LOGIN_THROTTLE_EMAIL_RATE[0]
+        start = threading.Barrier(attempts)
+        statuses = []
+
+        def attempt():
+            try:
+                start.wait()
+                statuses.append(self.post('wrong').status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=attempt) for _ in range(attempts)]
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(statuses.count(200), allowed)  # the login page again, with an error
+        self.assertEqual(statuses.count(429), attempts - allowed)
+
+    def test_success_clears_the_email_limit(self):
+        for _ in range(settings.LOGIN_THROTTLE_EMAIL_RATE[0] - 1):
+            self.assertEqual(self.post('wrong').status_code, 200)
+        self.assertEqual(self.post(self.PASSWORD).status_code, 302)
+        for _ in range(settings.LOGIN_THROTTLE_EMAIL_RATE[0]):
+            self.assertEqual(self.post('wrong').status_code, 200)
+        response = self.post(self.PASSWORD)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+
+# -------------------- Discharge summary list --------------------
+class DischargeListApiTests(TestCase):
+    def setUp(self):
+        patient = Patient.objects.create(name='List Test', age=58, gender='Female',
+                                         contact_number='9800000017', status='Active',
+                                         medical_history='Long history ' * 50)
+        # Two on the same day, so a page can end between them
+        for discharged, ward, kind in (('2025-01-01', 'A', 'Planned'), ('2025-03-01', 'B', 'DAMA'),
+                                       ('2025-01-01', 'B', 'Planned'), ('2024-12-01', 'A', 'DOR'),
+                                       ('2025-02-01', 'A', 'Planned')):
+            DischargeSummary.objects.create(patient=patient, uhid='UH-L', consultant_name='Dr. Rao',
+                                            admission_date=discharged, discharge_date=discharged,
+                                            ward=ward, discharge_type=kind,
+                                            final_diagnosis='Diagnosis', hospital_course='Course ' * 200)
+        self.newest_first = list(DischargeSummary.objects.order_by('-discharge_date', '-id')
+                                 .values_list('id', flat=True))
+
+    def pages(self, **params):
+        """Every page of /api/discharges/ as lists of summary ids."""
+        pages, cursor = [], None
+        while True:
+            response = self.client.get('/api/discharges/', {**params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            ids = [int(pk) for pk in re.findall(r'/discharge/(\d+)/"', data['html'])]
+            self.assertEqual(len(ids), data['count'])
+            pages.append(ids)
+            cursor = data['next_cursor']
+            if cursor is None:
+                return pages
+
+    def test_pages_cover_every_summary_once_in_order(self):
+        for limit in range(1, 7):
+            with self.subTest(limit=limit):
+                pages = self.pages(limit=limit)
+                self.assertEqual([pk for page in pages for pk in page], self.newest_first)
+                self.assertTrue(all(len(page) == limit for page in pages[:-1]))
+                self.assertLessEqual(len(pages[-1]), limit)
+
+    def test_filters_apply_across_pages(self):
+        expected = list(DischargeSummary.objects.filter(ward='A', discharge_date__gte='2025-01-01')
+                        .order_by('-discharge_date', '-id').values_list('id', flat=True))
+        pages = self.pages(limit=1, ward='A', **{'from': '2025-01-01'})
+        self.assertEqual([pk for page in pages for pk in page], expected)
+        self.assertEqual(self.pages(discharge_type='DOR', to='2024-12-31'), [self.newest_first[-1:]])
+
+    def test_selects_no_text_columns(self):
+        text_columns = [f.column for model in (DischargeSummary, Patient) for f in model._meta.fields
+                        if f.get_internal_type() == 'TextField']
+        with CaptureQueriesContext(connection) as queries:
+            self.pages(limit=2)
+        selects = [q['sql'] for q in queries if 'FROM "main_dischargesummary"' in q['sql']]
+        self.assertEqual(len(selects), 3)
+        for sql in selects:
+            for column in text_columns:
+                self.assertNotIn(f'."{column}"', sql)
+
+    def test_bad_cursor_or_date_is_400(self):
+        self.assertEqual(self.client.get('/api/discharges/', {'cursor': 'nonsense'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/discharges/', {'from': '01/02/2025'}).status_code, 400)
+
+
+# -------------------- Discharge summary PDFs --------------------
+class DischargePdfTests(TestCase):
+    def setUp(self):
+        self.cache_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(PDF_CACHE_DIR=self.cache_dir))
+        patient = Patient.objects.create(name='Pdf Test', age=61, gender='Female',
+                                         contact_number='9800000004', status='Active')
+        self.summary = DischargeSummary.objects.create(
+            patient=patient, uhid='UH-PDF', consultant_name='Dr. Rao', admission_date='2025-02-27',
+            discharge_date='2025-03-01', final_diagnosis='Observation',
+        )
+
+    def tearDown(self):
+        if pdf._executor is not None:
+            pdf._executor.shutdown()
+            pdf._executor = None
+        while pdf._export_executors:
+            pdf._export_executors.popitem()[1].shutdown()
+
+    @override_settings(PDF_RENDER_WORKERS=1)
+    def test_finished_render_is_not_kept_pending(self):
+        status, _ = pdf.request_pdf(self.summary, 'http://testserver/')
+        self.assertEqual(status, pdf.PENDING)
+        digest = pdf.cache_path(self.summary).stem
+        pdf._pending[digest].result(timeout=60)
+        deadline = time.monotonic() + 5
+        while digest in pdf._pending and time.monotonic() < deadline:
+            time.sleep(0.01)  # done callbacks run just after result() wakes up
+        self.assertNotIn(digest, pdf._pending)
+        self.assertEqual(pdf.request_pdf(self.summary, 'http://testserver/')[0], pdf.READY)
+
+    @override_settings(PDF_RENDER_WORKERS=0)
+    def test_late_render_of_an_older_version_keeps_the_newer_pdf(self):
+        base_url = 'http://testserver/'
+        old_path = pdf.cache_path(self.summary)
+        old_render = (pdf.render_summary_html(self.summary), base_url, old_path, pdf.replaced_files(old_path))
+
+        self.summary.final_diagnosis = 'Revised'
+        self.summary.save()
+        new_path = pdf.cache_path(self.summary)
+        leftover = Path(self.cache_dir) / f'{self.summary.pk}-leftover.pdf'  # from a render in flight at the save
+        leftover.write_bytes(b'%PDF-stale')
+
+        with mock.patch.object(pdf, 'html_to_pdf', return_value=b'%PDF-test'):
+            self.assertEqual(pdf.request_pdf(self.summary, base_url), (pdf.READY, new_path))
+            self.assertFalse(leftover.exists())
+            pdf.render_to_cache(*old_render)  # the older version's render finishes last
+
+        self.assertTrue(new_path.exists())
+        with mock.patch.object(pdf, 'render_to_cache') as render:
+            self.assertEqual(pdf.request_pdf(self.summary, base_url), (pdf.READY, new_path))
+        render.assert_not_called()
+
+    def test_exports_share_one_pool(self):
+        first = [error for _, _, error in pdf.iter_summary_pdfs([self.summary], 'http://testserver/', 1)]
+        pool = pdf._export_executors[1]
+        second = [error for _, _, error in pdf.iter_summary_pdfs([self.summary], 'http://testserver/', 1)]
+        self.assertEqual(first + second, [None, None])
+        self.assertIs(pdf._export_executors[1], pool)
+
+    def test_export_is_admin_only(self):
+        self.assertEqual(self.client.get('/discharge/export/').status_code, 403)
+
+    def test_pdf_invalidated_before_it_is_opened_is_asked_for_again(self):
+        url = f'/discharge/{self.summary.pk}/pdf/'
+        missing = Path(self.cache_dir) / f'{self.summary.pk}-deleted.pdf'
+        with mock.patch.object(pdf, 'request_pdf', return_value=(pdf.READY, missing)):
+            response = self.client.get(url)
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+
+
+# -------------------- Audit log --------------------
+@override_settings(AUDIT_LOG='inline')
+class AuditLogTests(TransactionTestCase):
+    def setUp(self):
+        self.patient = Patient.objects.create(name='Audit Test', age=50, gender='Male',
+                                              contact_number='9800000002', status='Active')
+
+    def background_log(self):
+        """Switch to the background log with a spool directory of its own; returns the directory."""
+        spool_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(AUDIT_LOG='background', AUDIT_SPOOL_DIR=spool_dir))
+        return spool_dir
+
+    def spooled_entry(self):
+        return audit.make_entry('update', self.patient, {'status': ['Active', 'Chronic']})
+
+    def test_bulk_import_is_audited(self):
+        rows = io.StringIO('name,age,gender,contact_number,status\n'
+                           'Imported One,30,Female,9811111111,Active\n'
+                           'Imported Two,41,Male,9811111112,Chronic\n')
+        self.assertEqual(import_patients(rows, 'csv').imported, 2)
+        imported = Patient.objects.filter(name__startswith='Imported')
+        entries = AuditEntry.objects.filter(model='patient', action='create', patient_pk__in=imported.values('pk'))
+        self.assertEqual(entries.count(), 2)
+        self.assertEqual(entries.get(object_id=imported.get(name='Imported Two').pk).changes['status'],
+                         [None, 'Chronic'])
+
+    def test_update_reads_stored_row_once(self):
+        visit = Visit.objects.create(patient=self.patient, date='2025-03-01', doctor_name='Dr. Rao',
+                                     checkup_type='Regular', healthcare_service='OPD', bp='120/80',
+                                     oxygen_level='98%', weight='70.00')
+        for instance, table, change in ((self.patient, Patient._meta.db_table, {'status': 'Chronic'}),
+                                        (visit, Visit._meta.db_table, {'date': '2025-03-02'})):
+            for name, value in change.items():
+                setattr(instance, name, value)
+            with CaptureQueriesContext(connection) as queries:
+                instance.save()
+            lookups = [q['sql'] for q in queries if q['sql'].startswith('SELECT') and f'FROM "{table}"' in q['sql']]
+            self.assertEqual(len(lookups), 1, lookups)
+
+    def test_update_records_changed_fields_only(self):
+        self.patient.status = 'Chronic'
+        self.patient.contact_number = '9800000009'
+        self.patient.age = '50'  # as a form posts it; stored as 50, so not a change
+        self.patient.save()
+        entry = AuditEntry.objects.get(object_id=self.patient.pk, action='update')
+        self.assertEqual(entry.model, 'patient')
+        self.assertEqual(entry.patient_pk, self.patient.pk)
+        self.assertEqual(entry.changes, {'status': ['Active', 'Chronic'],
+                                         'contact_number': ['9800000002', '9800000009']})
+
+        self.patient.save()  # nothing changed
+        self.assertEqual(AuditEntry.objects.filter(object_id=self.patient.pk, action='update').count(), 1)
+
+    def test_rolled_back_write_is_not_audited(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.patient.status = 'Chronic'
+            self.patient.save()
+            Patient.objects.create(name='Never Committed', age=20, gender='Female',
+                                   contact_number='9800000003', status='Active')
+            raise RuntimeError
+        self.assertFalse(AuditEntry.objects.filter(action='update').exists())
+        self.assertFalse(AuditEntry.objects.filter(changes__name=[None, 'Never Committed']).exists())
+
+    def test_replays_spool_of_dead_process(self):
+        spool_dir = self.background_log()
+        entry = self.spooled_entry()
+        dead = subprocess.Popen([sys.executable, '-c', ''])
+        dead.wait()
+        leftover = os.path.join(spool_dir, f'audit-{audit.HOST}-{dead.pid}-0123456789ab-0.jsonl')
+        with open(leftover, 'w') as f:
+            f.write(json.dumps(entry) + '\n')
+
+        audit.get_log()
+        self.assertTrue(audit.flush(timeout=10))
+        self.assertTrue(AuditEntry.objects.filter(uuid=entry['uuid']).exists())
+        self.assertFalse(os.path.exists(leftover))
+
+    def test_queue_overflow_is_read_back_from_spool(self):
+        self.enterContext(override_settings(AUDIT_QUEUE_SIZE=1))
+        self.background_log()
+        entries = [self.spooled_entry() for _ in range(50)]
+        audit.record(*entries)
+        self.assertTrue(audit.flush(timeout=10))
+        self.assertGreater(audit.get_log().overflowed, 0)
+        self.assertEqual(AuditEntry.objects.filter(uuid__in=[e['uuid'] for e in entries]).count(), 50)
+
+    def test_failed_insert_is_retried_from_spool(self):
+        self.background_log()
+        entry = self.spooled_entry()
+        write_entries, calls = audit.write_entries, []
+
+        def locked_once(entries):
+            calls.append(entries)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            write_entries(entries)
+
+        with mock.patch.object(audit, 'write_entries', locked_once), self.assertLogs(audit.logger, 'ERROR'):
+            audit.record(entry)
+            self.assertTrue(audit.flush(timeout=10))
+        self.assertGreater(len(calls), 1)
+        self.assertTrue(AuditEntry.objects.filter(uuid=entry['uuid']).exists())
+
+    def test_admin_is_read_only(self):
+        model_admin = admin.site._registry[AuditEntry]
+        request = RequestFactory().get('/admin/')
+        self.assertFalse(model_admin.has_add_permission(request))
+        self.assertFalse(model_admin.has_change_permission(request))
+        self.assertFalse(model_admin.has_delete_permission(request))
+
+    def test_replays_spool_left_by_earlier_process_with_same_pid(self):
+        spool_dir = self.background_log()
+        entry = self.spooled_entry()
+        # A container restart can hand the new process the old one's pid
+        leftover = os.path.join(spool_dir, f'audit-{audit.HOST}-{os.getpid()}-0123456789ab-0.jsonl')
+        with open(leftover, 'w') as f:
+            f.write(json.dumps(entry) + '\n' + '{"uuid": "cut short by the crash')
+
+        audit.get_log()
+        self.assertTrue(audit.flush(timeout=10))
+        self.assertTrue(AuditEntry.objects.filter(uuid=entry['uuid']).exists())
+        self.assertFalse(os.path.exists(leftover))
+
+    def dead_pid(self):
+        dead = subprocess.Popen([sys.executable, '-c', ''])
+        dead.wait()
+        return dead.pid
+
+    def spool_file(self, spool_dir, host, pid):
+        entry = self.spooled_entry()
+        path = os.path.join(spool_dir, f'audit-{host}-{pid}-0123456789ab-0.jsonl')
+        with open(path, 'w') as f:
+            f.write(json.dumps(entry) + '\n')
+        return path, entry
+
+    @skipUnless(audit.fcntl, "needs flock()")
+    def test_shared_spool_leaves_files_of_live_logs_alone(self):
+        spool_dir = self.background_log()
+        # Written by a log on another host: its pid means nothing here, only its lock does
+        path, entry = self.spool_file(spool_dir, 'otherhost', self.dead_pid())
+        with open(path, 'rb') as held:
+            audit.fcntl.flock(held, audit.fcntl.LOCK_EX)
+            audit.get_log()
+            self.assertTrue(audit.flush(timeout=10))
+            self.assertFalse(AuditEntry.objects.filter(uuid=entry['uuid']).exists())
+            self.assertTrue(os.path.exists(path))
+
+        # Its process is gone, and the lock with it
+        audit.shutdown()
+        audit.get_log()
+        self.assertTrue(audit.flush(timeout=10))
+        self.assertTrue(AuditEntry.objects.filter(uuid=entry['uuid']).exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_without_flock_only_this_hosts_files_are_replayed(self):
+        spool_dir = self.background_log()
+        pid = self.dead_pid()
+        ours, our_entry = self.spool_file(spool_dir, audit.HOST, pid)
+        theirs, their_entry = self.spool_file(spool_dir, 'otherhost', pid)
+        with mock.patch.object(audit, 'fcntl', None):
+            audit.get_log()
+            self.assertTrue(audit.flush(timeout=10))
+        self.assertTrue(AuditEntry.objects.filter(uuid=our_entry['uuid']).exists())
+        self.assertFalse(AuditEntry.objects.filter(uuid=their_entry['uuid']).exists())
+        self.assertFalse(os.path.exists(ours))
+        self.assertTrue(os.path.exists(theirs))
+
+
+# -------------------- Request metrics --------------------
+def visit_labels(request):
+    # Visit.__str__ reads visit.patient: one query per visit unless it is select_related
+    visits = Visit.objects.order_by('id')
+    if request.GET.get('related'):
+        visits = visits.select_related('patient')
+    template = engines['django'].from_string('{% for visit in visits %}{{ visit }}\n{% endfor %}')
+    return HttpResponse(template.render({'visits': visits}))
+
+
+class _MetricsUrls:
+    urlpatterns = [path('visit-labels/', visit_labels, name='visit_labels')] + main_urls.urlpatterns
+
+
+@override_settings(REQUEST_METRICS_ENABLED=True, REQUEST_METRICS_SERVER_TIMING=True,
+                   REQUEST_METRICS_N_PLUS_ONE_THRESHOLD=5, REQUEST_METRICS_TOKEN='', ROOT_URLCONF=_MetricsUrls)
+class RequestMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        patient = Patient.objects.create(name='Metrics Test', age=40, gender='Male',
+                                         contact_number='9800000016', status='Active')
+        for day in range(1, 7):
+            Visit.objects.create(patient=patient, doctor_name='Dr. Rao', date=datetime.date(2025, 3, day),
+                                 checkup_type='Regular', healthcare_service='OPD', bp='120/80',
+                                 oxygen_level='98%', weight='70.00')
+
+    def setUp(self):
+        metrics.registry.reset()
+
+    def sign_in(self, role):
+        session = self.client.session
+        session['user_id'] = 'test'
+        session['role'] = role
+        session.save()
+
+    def test_n_plus_one_is_counted_logged_and_timed(self):
+        with self.assertLogs('main.metrics', 'WARNING') as logs:
+            response = self.client.get('/visit-labels/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Possible N+1 in visit_labels: statement ran 6 times', logs.output[0])
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="7 queries", tpl;dur=[\d.]+, total;dur=[\d.]+$')
+
+        row = metrics.registry.snapshot()['visit_labels']
+        self.assertEqual((row['requests'], row['queries'], row['n_plus_one']), (1, 7, 1))
+        self.assertEqual(row['response_bytes'], len(response.content))
+        self.assertGreater(row['template_seconds'], 0)
+        self.assertGreater(row['seconds'], row['template_seconds'])
+
+        self.client.get('/visit-labels/', {'related': 1})
+        row = metrics.registry.snapshot()['visit_labels']
+        self.assertEqual((row['requests'], row['queries'], row['n_plus_one']), (2, 8, 1))
+
+    def test_prometheus_text(self):
+        with self.assertLogs('main.metrics', 'WARNING'):
+            self.client.get('/visit-labels/')
+        self.sign_in('admin')
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4')
+        lines = response.content.decode().splitlines()
+        self.assertIn('# TYPE wellconx_n_plus_one_requests_total counter', lines)
+        self.assertIn('wellconx_requests_total{view="visit_labels"} 1', lines)
+        self.assertIn('wellconx_db_queries_total{view="visit_labels"} 7', lines)
+        self.assertIn('wellconx_n_plus_one_requests_total{view="visit_labels"} 1', lines)
+        self.assertTrue(any(line.startswith('wellconx_template_seconds_total{view="visit_labels"} ') for line in lines))
+
+    def test_metrics_are_restricted(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.sign_in('nurse')
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+        scraper = Client()
+        with override_settings(REQUEST_METRICS_TOKEN='scrape-token'):
+            self.assertEqual(scraper.get('/metrics/', HTTP_AUTHORIZATION='Bearer scrape-token').status_code, 200)
+            self.assertEqual(scraper.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        with override_settings(REQUEST_METRICS_ENABLED=False):
+            self.sign_in('admin')
+            self.assertEqual(self.client.get('/metrics/').status_code, 404)
+
+
+# -------------------- Fragment caching --------------------
+@override_settings(FRAGMENT_CACHE_TTL=600)
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.first, self.second = (
+            Patient.objects.create(name=name, age=40, gender='Male', contact_number='9800000014', status='Active')
+            for name in ('Fragment One', 'Fragment Two')
+        )
+
+    def page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def add_visit(self, patient, notes):
+        return Visit.objects.create(patient=patient, doctor_name='Dr. Rao', date=datetime.date(2025, 3, 1),
+                                    checkup_type='Regular', healthcare_service='OPD', bp='120/80',
+                                    oxygen_level='98%', weight='70.00', notes=notes)
+
+    def test_patient_card_follows_patient_writes(self):
+        self.assertIn('Fragment One', self.page('/ehr_home/'))
+        # A write that skips signals shows the card really is cached
+        Patient.objects.filter(pk=self.first.pk).update(name='Not Yet Shown')
+        self.assertNotIn('Not Yet Shown', self.page('/ehr_home/'))
+
+        self.first.name = 'Renamed Card'
+        self.first.save()
+        self.assertIn('Renamed Card', self.page('/ehr_home/'))
+
+    def test_card_and_history_follow_visit_writes(self):
+        self.assertIn('· 0 visits<', self.page('/ehr_home/'))
+        self.page('/visit_history/')
+
+        visit = self.add_visit(self.first, 'First note')
+        self.assertIn('· 1 visit<', self.page('/ehr_home/'))
+        self.assertIn('First note', self.page('/visit_history/'))
+
+        visit.notes = 'Edited note'
+        visit.save()
+        self.assertIn('Edited note', self.page('/visit_history/'))
+
+        # Moving the visit changes both patients' cards and history groups
+        visit.patient = self.second
+        visit.save()
+        cards = self.page('/ehr_home/')
+        self.assertEqual(cards.count('· 1 visit<'), 1)
+        self.assertEqual(cards.count('· 0 visits<'), 1)
+
+        visit.delete()
+        self.assertNotIn('Edited note', self.page('/visit_history/'))
+        self.assertEqual(self.page('/ehr_home/').count('· 0 visits<'), 2)
+
+
+# -------------------- Data exports --------------------
+@override_settings(PASSWORD_HASH_ITERATIONS=1000, LOGIN_THROTTLE_ENABLED=False)
+class DataExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        AppUser.objects.create(username='admin', usermail='admin@wellconx.test',
+                               password=make_password('export'), role='admin')
+        cls.patient = Patient.objects.create(name='Export, "Quoted"', age=70, gender='Male',
+                                             contact_number='9800000013', status='Chronic',
+                                             medical_history='Line one\nLine two')
+        cls.visits = [
+            Visit.objects.create(patient=cls.patient, doctor_name='Dr. Rao', date=datetime.date(2025, 3, day),
+                                 checkup_type='Regular', healthcare_service='OPD', bp='120/80',
+                                 oxygen_level='98%', weight='70.50', notes='Ünïcode ✓')
+            for day in (5, 1, 3)  # ids out of date order
+        ]
+
+    def setUp(self):
+        self.client.post('/', {'email': 'admin@wellconx.test', 'password': 'export'})
+
+    def export(self, kind, **params):
+        response = self.client.get(f'/api/export/{kind}/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        response, body = self.export('patients', format='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=patients.csv')
+        rows = list(csv.reader(io.StringIO(body)))
+        self.assertEqual(rows[0], EXPORTS['patients'].headers)
+        self.assertEqual(len(rows), 2)
+        row = dict(zip(rows[0], rows[1]))
+        self.assertEqual((row['name'], row['medical_history']), ('Export, "Quoted"', 'Line one\nLine two'))
+        self.assertEqual((row['last_visit_date'], row['visit_count']), ('2025-03-05', '3'))
+
+    def test_ndjson_in_id_order_and_since_id(self):
+        response, body = self.export('visits', format='ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([r['id'] for r in rows], [v.pk for v in self.visits])
+        self.assertEqual(rows[0]['patient_id'], self.patient.patient_id)
+        self.assertEqual((rows[0]['date'], rows[0]['weight'], rows[0]['notes']),
+                         ('2025-03-05', '70.50', 'Ünïcode ✓'))
+        self.assertEqual(rows[0]['systolic'], 120)
+
+        _, body = self.export('visits', format='ndjson', since_id=self.visits[0].pk)
+        self.assertEqual([json.loads(line)['id'] for line in body.splitlines()], [v.pk for v in self.visits[1:]])
+
+    def test_date_range_in_date_order(self):
+        _, body = self.export('visits', format='ndjson', **{'from': '2025-03-02', 'to': '2025-03-31'})
+        self.assertEqual([json.loads(line)['date'] for line in body.splitlines()], ['2025-03-03', '2025-03-05'])
+
+    def test_large_export_is_flushed_in_chunks(self):
+        Patient.objects.bulk_create(
+            Patient(name=f'Bulk {n}', patient_id=f'PB{n:05d}', age=40, gender='Female', contact_number='1',
+                    status='Active', medical_history='x' * 200)
+            for n in range(600)
+        )
+        stats = {}
+        chunks = list(stream_export('patients', 'csv', export_rows('patients'), chunk_size=100, stats=stats))
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) <= FLUSH_BYTES + 1024 for chunk in chunks))
+        self.assertEqual(len(list(csv.reader(io.StringIO(b''.join(chunks).decode())))), 602)
+        self.assertEqual(stats['rows'], 601)
+        self.assertEqual(stats['last_id'], Patient.objects.latest('id').id)
+
+    def test_rejects_bad_parameters(self):
+        self.assertEqual(self.client.get('/api/export/patients/', {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/export/patients/', {'since_id': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/export/patients/', {'from': '03/01/2025'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/export/nothing/').status_code, 404)
+        self.assertEqual(Client().get('/api/export/patients/').status_code, 403)
+
+
+# -------------------- Async views --------------------
+class _AsyncUrls:
+    """main.urls as it is routed with ASYNC_VIEWS on: every view with an async twin swapped for it."""
+    urlpatterns = [
+        path(str(pattern.pattern), getattr(views, f'{pattern.callback.__name__}_async', pattern.callback),
+             name=pattern.name)
+        for pattern in main_urls.urlpatterns
+    ]
+
+
+class AsyncViewParityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patients = []
+        for n, status in enumerate(['Active', 'Chronic', 'Active', 'Follow-up']):
+            patient = Patient.objects.create(name=f'Parity {n}', age=30 + n, gender='Female',
+                                             contact_number=f'98000001{n:02d}', status=status,
+                                             medical_history='Diabetes')
+            Visit.objects.create(patient=patient, doctor_name='Dr. Rao', date=datetime.date(2025, 1, 1 + n),
+                                 checkup_type='Regular', healthcare_service='OPD', bp='120/80',
+                                 oxygen_level='98%', weight='70.00')
+            DischargeSummary.objects.create(patient=patient, uhid=f'UH-P{n}', ward='ICU', consultant_name='Dr. Rao',
+                                            admission_date='2025-02-01', discharge_date=f'2025-02-0{2 + n}',
+                                            final_diagnosis='Observation')
+            cls.patients.append(patient)
+
+    async def test_async_twins_return_the_same_responses(self):
+        pid = self.patients[0].patient_id
+        first_page = await sync_to_async(self.client.get)('/api/patients/', {'limit': 2})
+        urls = [
+            ('/ehr_home/', {}),
+            ('/ehr_home/', {'status': 'Active'}),
+            ('/api/patients/', {'limit': 2}),
+            ('/api/patients/', {'limit': 2, 'cursor': first_page.json()['next_cursor']}),
+            ('/api/patients/', {'cursor': 'not-a-cursor'}),
+            (f'/api/patient/{pid}/', {}),
+            ('/api/patient/PO99999/', {}),
+            (f'/api/patient-details/{pid}/', {}),
+            ('/patients/search/', {'term': 'parity'}),
+            ('/api/patients/lookup/', {'term': pid[:-1]}),
+            ('/discharge/list/', {}),
+            ('/api/discharges/', {'limit': 2}),
+        ]
+        for url, params in urls:
+            with self.subTest(url=url, params=params):
+                expected = await sync_to_async(self.client.get)(url, params)
+                with override_settings(ROOT_URLCONF=_AsyncUrls):
+                    actual = await self.async_client.get(url, params)
+                self.assertEqual(actual.status_code, expected.status_code)
+                self.assertEqual(actual.content, expected.content)
+
+
+# -------------------- Middleware under ASGI --------------------
+async def slow_async_view(request):
+    await asyncio.sleep(0.2)
+    return HttpResponse('ok')
+
+
+urlpatterns = [path('slow/', slow_async_view)]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncMiddlewareTests(SimpleTestCase):
+    """
+    Every middleware in the stack must be async capable: one sync-only
+    middleware runs each async request through Django's single
+    thread-sensitive executor, one at a time.
+    """
+
+    async def test_async_requests_overlap(self):
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(AsyncClient().get('/slow/') for _ in range(10)))
+        elapsed = time.perf_counter() - start
+        self.assertEqual([r.status_code for r in responses], [200] * 10)
+        self.assertLess(elapsed, 1.0, "async requests were serialized")
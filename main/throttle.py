@@ -0,0 +1,152 @@
+"""
+Login throttling: sliding-window attempt counters in Django's cache, one per
+client IP and one per email address.
+
+Every attempt reserves a slot in both counters before the user is looked up
+or any password is hashed. The reservation is one atomic cache.incr(), so
+concurrent attempts cannot all pass on the same free slot: the first
+`capacity` increments win and the rest see a full counter. A rejected
+attempt hands its slots back and gets a 429, so a credential-stuffing burst
+costs a cache round trip per request instead of a full PBKDF2 run. A failed
+login keeps its slots; a successful one hands back its IP slot and clears
+the email's counter, so a ward full of staff behind one NAT address is not
+locked out by its own sign-ins.
+
+Counts are kept per fixed window of `per_seconds`. The limit applies to the
+current window's count plus the previous window's, weighted by how much of
+that window is still within the last `per_seconds`, so the allowance comes
+back gradually instead of all at once at a window boundary.
+
+incr() is atomic in the locmem (per process) and Redis caches. The file-based
+cache implements it as a read then a write, so there concurrent attempts can
+still share a slot.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+KEY_PREFIX = 'login-throttle:'
+
+
+class SlidingWindow:
+    def __init__(self, scope, capacity, per_seconds):
+        self.scope = scope
+        self.capacity = capacity
+        self.window = per_seconds
+
+    def _key(self, ident, index):
+        digest = hashlib.sha256(ident.encode()).hexdigest()[:32]
+        return f'{KEY_PREFIX}{self.scope}:{digest}:{index}'
+
+    def _position(self, now):
+        """(window index, share of that window already elapsed) at `now`."""
+        index, offset = divmod(now, self.window)
+        return int(index), offset / self.window
+
+    def _counts(self, ident, index):
+        counts = _cache().get_many([self._key(ident, index), self._key(ident, index - 1)])
+        return counts.get(self._key(ident, index), 0), counts.get(self._key(ident, index - 1), 0)
+
+    def reserve(self, ident, now=None):
+        """Take a slot for `ident`; returns the key to refund() it with, or None when full."""
+        now = now if now is not None else time.time()
+        index, elapsed = self._position(now)
+        key = self._key(ident, index)
+        # Kept while it is the current or the previous window
+        count = _incr(key, timeout=2 * self.window + 1)
+        previous = _cache().get(self._key(ident, index - 1), 0)
+        if count + previous * (1 - elapsed) > self.capacity:
+            self.refund(key)
+            return None
+        return key
+
+    def refund(self, key):
+        try:
+            _cache().decr(key)
+        except ValueError:
+            pass  # its window has expired anyway
+
+    def retry_after(self, ident, now=None):
+        """Seconds until `ident` has a free slot again (0 if it has one now)."""
+        now = now if now is not None else time.time()
+        index, elapsed = self._position(now)
+        current, previous = self._counts(ident, index)
+        if current < self.capacity:
+            # Wait for enough of the previous window to slide out
+            if not previous:
+                return 0
+            fits_at = 1 - (self.capacity - 1 - current) / previous
+            return max(0, fits_at - elapsed) * self.window
+        # Full on its own: wait for the next window, then for enough of this one to slide out
+        fits_at = 1 - (self.capacity - 1) / current
+        return (1 - elapsed + max(0, fits_at)) * self.window
+
+    def reset(self, ident, now=None):
+        now = now if now is not None else time.time()
+        index, _ = self._position(now)
+        _cache().delete_many([self._key(ident, index), self._key(ident, index - 1)])
+
+
+def _cache():
+    return caches[settings.LOGIN_THROTTLE_CACHE_ALIAS]
+
+
+def _incr(key, timeout):
+    cache = _cache()
+    while True:
+        cache.add(key, 0, timeout=timeout)
+        try:
+            return cache.incr(key)
+        except ValueError:  # expired between add() and incr()
+            continue
+
+
+def ip_window():
+    return SlidingWindow('ip', *settings.LOGIN_THROTTLE_IP_RATE)
+
+
+def email_window():
+    return SlidingWindow('email', *settings.LOGIN_THROTTLE_EMAIL_RATE)
+
+
+def client_ip(request):
+    # Behind a reverse proxy, make it set REMOTE_ADDR (X-Forwarded-For is client-controlled)
+    return request.META.get('REMOTE_ADDR') or 'unknown'
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+def reserve_attempt(request, email):
+    """
+    Reserve this attempt against the IP and email limits, before any password
+    work. Returns 0 when it may go ahead, else the seconds the caller must wait
+    (nothing stays reserved then).
+    """
+    if not settings.LOGIN_THROTTLE_ENABLED:
+        return 0
+    now = time.time()
+    reserved = []
+    for window, ident in ((ip_window(), client_ip(request)), (email_window(), normalize_email(email))):
+        slot = window.reserve(ident, now)
+        if slot is None:
+            for reserved_window, reserved_slot in reserved:
+                reserved_window.refund(reserved_slot)
+            # A slot may have been handed back since; still ask for a second
+            return max(window.retry_after(ident, now), 1)
+        reserved.append((window, slot))
+    request._login_throttle_ip_slot = reserved[0][1]
+    return 0
+
+
+def record_attempt(request, email, success):
+    """A failed attempt keeps the slots reserve_attempt() took; a successful one gives them back."""
+    if not settings.LOGIN_THROTTLE_ENABLED or not success:
+        return
+    ip_slot = getattr(request, '_login_throttle_ip_slot', None)
+    if ip_slot is not None:
+        ip_window().refund(ip_slot)
+    email_window().reset(normalize_email(email))
@@ -1,16 +1,35 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+
+def _view(name):
+    """The async twin of a view when ASYNC_VIEWS is on (ASGI deployments), else the sync view."""
+    if settings.ASYNC_VIEWS:
+        return getattr(views, f'{name}_async')
+    return getattr(views, name)
+
+
 urlpatterns = [
     path('', views.custom_login, name='login'),
     path('register/', views.register_view, name='register'),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('logout/', views.logout_view, name='logout'),
+    path('metrics/', views.metrics_view, name='metrics'),
 
     # Patient Management
-    path('ehr_home/', views.ehr_home, name='ehr_home'),
+    path('ehr_home/', _view('ehr_home'), name='ehr_home'),
+    path('api/patients/', _view('patient_list_api'), name='patient_list_api'),
     path('add_patient/', views.add_patient, name='add_patient'),
-    path('api/patient/<str:patient_id>/', views.patient_api, name='patient_api'),
+    path('patients/import/', views.import_patients_view, name='import_patients'),
+    path('patients/import/<str:job_id>/', views.import_patients_status, name='import_patients_status'),
+    path('patients/import/<str:job_id>/errors.csv', views.import_patients_errors, name='import_patients_errors'),
+    path('api/patients/batch/', views.patient_batch_api, name='patient_batch_api'),
+    path('api/patient/<str:patient_id>/', _view('patient_api'), name='patient_api'),
+    path('api/patient/<str:patient_id>/visits/', views.visit_timeline_api, name='visit_timeline_api'),
+    path('api/patient/<str:patient_id>/vitals/', views.patient_vitals_api, name='patient_vitals_api'),
+    path('api/patient/<str:patient_id>/audit/', views.patient_audit_api, name='patient_audit_api'),
+    path('api/vitals/alerts/', views.vitals_alerts_api, name='vitals_alerts_api'),
     path('patient/<str:patient_id>/edit/', views.edit_patient, name='edit_patient'),
 
     # Other Views
@@ -22,14 +41,20 @@ urlpatterns = [
     # Visits
     path('visit_history/', views.visit_history_view, name='visit_history'),
     path('new_visit/', views.new_visit, name='new_visit'),
-    path('patients/search/', views.patient_search, name='patient_search'),
+    path('patients/search/', _view('patient_search'), name='patient_search'),
+    path('api/patients/lookup/', _view('patient_id_lookup'), name='patient_id_lookup'),
+    path('api/search/clinical/', views.clinical_search_api, name='clinical_search_api'),
     #discharge
     path('discharge/add/', views.add_discharge_summary, name='add_discharge_summary'),
     path('discharge/add/<str:patient_id>/', views.add_discharge_summary, name='add_discharge_summary_for_patient'),
-    path('discharge/list/', views.discharge_summary_list, name='discharge_summary_list'),
+    path('discharge/list/', _view('discharge_summary_list'), name='discharge_summary_list'),
+    path('api/discharges/', _view('discharge_list_api'), name='discharge_list_api'),
     path('discharge/<int:pk>/', views.discharge_summary_detail, name='discharge_summary_detail'),
+    path('discharge/export/', views.discharge_summary_export, name='discharge_summary_export'),
+    path('api/export/<str:kind>/', views.data_export, name='data_export'),
    path('discharge/<int:pk>/pdf/', views.discharge_summary_pdf, name='discharge_summary_pdf'),
+    path('discharge/<int:pk>/pdf/status/', views.discharge_summary_pdf_status, name='discharge_summary_pdf_status'),
 
     # API for patient details (for auto-fill)
-    path('api/patient-details/<str:patient_id>/', views.get_patient_details, name='get_patient_details'),
+    path('api/patient-details/<str:patient_id>/', _view('get_patient_details'), name='get_patient_details'),
 ]
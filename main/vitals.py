@@ -0,0 +1,249 @@
+"""
+Numeric vitals: parsing the free-text BP / SpO2 fields and trend analytics.
+
+Visit keeps the text the clinician typed ("120/80 mmHg", "98%") and stores
+the parsed numbers next to it (systolic, diastolic, spo2), so analytics read
+plain numeric columns instead of string-parsing every row. The analytics pull
+the needed columns in one query straight into NumPy arrays and compute
+rolling averages, trends and out-of-range flags without a Python loop per
+visit.
+
+NumPy is imported inside the analytics functions, so the parsers (used by
+Visit.save()) work without it.
+"""
+import datetime
+import re
+
+from django.db import connections
+from django.db.models import F, FloatField, Func, IntegerField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+BP_RE = re.compile(r'(\d{2,3})\s*/\s*(\d{2,3})')
+SPO2_RE = re.compile(r'(\d{2,3}(?:\.\d+)?)')
+
+# Readings outside these ranges are treated as typos and stored as NULL
+SYSTOLIC_RANGE = (50, 300)
+DIASTOLIC_RANGE = (20, 200)
+SPO2_RANGE = (50.0, 100.0)
+
+# (low, high) normal ranges; a reading outside is flagged
+NORMAL_RANGES = {
+    'systolic': (90, 139),
+    'diastolic': (60, 89),
+    'spo2': (94, 100),
+}
+VITALS = tuple(NORMAL_RANGES)
+
+DEFAULT_WINDOW = 3
+MAX_WINDOW = 20
+
+# vitals_alerts() without a start date looks this far back, not at every visit ever
+ALERTS_DEFAULT_DAYS = 90
+
+
+# -------------------- Parsing --------------------
+def parse_bp(text):
+    """'120/80 mmHg' -> (120, 80); (None, None) if the text is not a reading."""
+    match = BP_RE.search(text or '')
+    if not match:
+        return None, None
+    systolic, diastolic = int(match.group(1)), int(match.group(2))
+    if not (SYSTOLIC_RANGE[0] <= systolic <= SYSTOLIC_RANGE[1]
+            and DIASTOLIC_RANGE[0] <= diastolic <= DIASTOLIC_RANGE[1]):
+        return None, None
+    return systolic, diastolic
+
+
+def parse_spo2(text):
+    """'98%' -> 98.0; None if the text is not a reading."""
+    match = SPO2_RE.search(text or '')
+    if not match:
+        return None
+    value = float(match.group(1))
+    return value if SPO2_RANGE[0] <= value <= SPO2_RANGE[1] else None
+
+
+# -------------------- Analytics --------------------
+class EpochDay(Func):
+    """A date as days since 1970-01-01, so rows reach NumPy as plain integers."""
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="CAST(julianday(%(expressions)s) - 2440587.5 AS INTEGER)",
+                           **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="(%(expressions)s - DATE '1970-01-01')", **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="(TO_DAYS(%(expressions)s) - 719528)", **extra_context)
+
+
+def _columns(queryset, *fields):
+    """
+    Fetch `date` plus `fields` of a queryset as NumPy arrays in one query.
+
+    Rows are read with a plain cursor and fed to np.fromiter(); building
+    Python date objects and ORM rows costs more than the rest of the
+    analytics combined. Dates come back as day numbers, vitals as float64
+    with NaN for missing readings (NULL is coalesced to 0 in SQL, which is
+    never a valid reading).
+    """
+    import numpy as np
+
+    exprs = {'_date': EpochDay('date')}
+    dtype = [('date', 'i8')]
+    for name in fields:
+        if name in VITALS:
+            exprs[f'_{name}'] = Coalesce(F(name), 0.0, output_field=FloatField())
+            dtype.append((name, 'f8'))
+        else:
+            exprs[f'_{name}'] = F(name)
+            dtype.append((name, 'i8'))
+    sql, params = queryset.annotate(**exprs).values_list(*exprs).query.sql_with_params()
+
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        data = np.fromiter(_fetch(cursor), dtype=dtype)
+
+    columns = {'date': data['date'].astype('datetime64[D]')}
+    for name in fields:
+        column = data[name]
+        if name in VITALS:
+            column = np.where(column == 0, np.nan, column)
+        columns[name] = column
+    return columns
+
+
+def _fetch(cursor, size=10000):
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+
+def _flags(values, name):
+    import numpy as np
+
+    low, high = NORMAL_RANGES[name]
+    flags = np.full(values.shape, '', dtype=object)
+    flags[values < low] = 'low'
+    flags[values > high] = 'high'
+    return flags
+
+
+def rolling_mean(values, window):
+    """Mean of the last `window` readings at each point, skipping missing ones (NaN if none)."""
+    import numpy as np
+
+    present = ~np.isnan(values)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(present, values, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(present)))
+    upper = np.arange(1, len(values) + 1)
+    lower = np.maximum(upper - window, 0)
+    n = counts[upper] - counts[lower]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(n > 0, (sums[upper] - sums[lower]) / n, np.nan)
+
+
+def trend_per_30_days(days, values):
+    """Least-squares slope of `values` over `days`, scaled to a 30-day change; None with < 2 readings."""
+    import numpy as np
+
+    present = ~np.isnan(values)
+    x, y = days[present], values[present]
+    if len(x) < 2 or np.ptp(x) == 0:
+        return None
+    x = x - x.mean()
+    slope = float((x * (y - y.mean())).sum() / (x * x).sum())
+    return round(slope * 30, 2)
+
+
+def _number(value):
+    return None if value != value else round(float(value), 1)  # NaN -> None
+
+
+def patient_vitals(patient_pk, window=DEFAULT_WINDOW):
+    """
+    Time series for one patient, oldest first: each reading with its rolling
+    average and flag, plus a per-vital summary (latest, mean, min, max, trend).
+    """
+    import numpy as np
+    from .models import Visit
+
+    data = _columns(Visit.objects.filter(patient_id=patient_pk).order_by('date', 'id'), 'id', *VITALS)
+    days = data['date'].astype('i8').astype('f8')
+
+    readings = {'visit_id': data['id'].tolist(), 'date': [str(d) for d in data['date']]}
+    summary = {}
+    for name in VITALS:
+        values = data[name]
+        averages = rolling_mean(values, window)
+        readings[name] = [_number(v) for v in values]
+        readings[f'{name}_avg'] = [_number(v) for v in averages]
+        readings[f'{name}_flag'] = _flags(values, name).tolist()
+
+        present = values[~np.isnan(values)]
+        summary[name] = {
+            'readings': int(len(present)),
+            'latest': _number(present[-1]) if len(present) else None,
+            'mean': _number(present.mean()) if len(present) else None,
+            'min': _number(present.min()) if len(present) else None,
+            'max': _number(present.max()) if len(present) else None,
+            'trend_per_30_days': trend_per_30_days(days, values),
+            'out_of_range': int((_flags(values, name) != '').sum()),
+        }
+    return {'window': window, 'summary': summary, 'readings': readings}
+
+
+def vitals_alerts(date_from=None, date_to=None, limit=200):
+    """
+    Patients whose latest reading in the date range is out of range for any
+    vital, most abnormal first. Without `date_from` the range is the
+    ALERTS_DEFAULT_DAYS up to `date_to` (or today), so the query always reads
+    a bounded slice of visit_date_idx. One query over the range, then the
+    latest visit per patient is picked with a stable sort instead of a GROUP BY.
+    """
+    import numpy as np
+    from .models import Visit
+
+    if date_from is None:
+        date_from = (date_to or timezone.localdate()) - datetime.timedelta(days=ALERTS_DEFAULT_DAYS - 1)
+    visits = Visit.objects.filter(date__gte=date_from)
+    if date_to:
+        visits = visits.filter(date__lte=date_to)
+    data = _columns(visits, 'id', 'patient_id', *VITALS)
+    if not len(data['id']):
+        return []
+
+    # Sort by (patient, date, id) and keep the last row of each patient
+    order = np.lexsort((data['id'], data['date'], data['patient_id']))
+    patients = data['patient_id'][order]
+    last = np.flatnonzero(np.append(patients[1:] != patients[:-1], True))
+    latest = order[last]
+
+    # How far outside the normal range each vital is, relative to the range width
+    score = np.zeros(len(latest))
+    flags = {}
+    for name in VITALS:
+        values = data[name][latest]
+        low, high = NORMAL_RANGES[name]
+        distance = np.maximum(low - values, 0) + np.maximum(values - high, 0)
+        score += np.nan_to_num(distance / (high - low))
+        flags[name] = _flags(values, name)
+
+    abnormal = np.flatnonzero(score > 0)
+    ranked = abnormal[np.argsort(-score[abnormal], kind='stable')][:limit]
+    return [
+        {
+            'patient_pk': int(data['patient_id'][latest[i]]),
+            'visit_id': int(data['id'][latest[i]]),
+            'date': str(data['date'][latest[i]]),
+            **{name: _number(data[name][latest[i]]) for name in VITALS},
+            'flags': {name: flags[name][i] for name in VITALS if flags[name][i]},
+            'score': round(float(score[i]), 3),
+        }
+        for i in ranked
+    ]
@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Serving through this module routes the read-heavy endpoints to their async
+views (settings.ASYNC_VIEWS), e.g.:
+
+    uvicorn wellconx.asgi:application --workers 4
 """
 
 import os
@@ -12,5 +17,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wellconx.settings')
+os.environ.setdefault('WELLCONX_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()